@@ -0,0 +1,79 @@
+"""
+Set-based actions on a selection of an Account's Transactions.
+
+A selection is any queryset of Transactions (the rows checked on a page, or
+everything matching a ``TransactionSelectionForm``), so it can be resolved
+on the server however many rows it has. An action is applied a chunk of
+rows at a time: the chunk's pks are read with a keyset query (see
+``utils.iter_keyset_chunks``), then changed with one ``update()`` or
+``delete()``, in its own database transaction. Those go through
+``TransactionQuerySet``, which keeps the Accounts' totals, monthly rollups,
+search indexes and RecurringTransactions in sync.
+
+"""
+from django.db.transaction import commit_on_success
+
+from .models import Transaction
+from .settings import BULK_ACTION_CHUNK_SIZE
+from .utils import iter_keyset_chunks
+
+ACTIONS = [
+    ('remove-pending', 'Mark Cleared'),
+    ('mark-pending', 'Mark Pending'),
+    ('mark-recurring', 'Mark Recurring'),
+    ('unmark-recurring', 'Mark Not Recurring'),
+    ('change-type', 'Change Type'),
+    ('move', 'Move to Account'),
+    ('delete', 'Delete'),
+]
+
+
+def action_values(action, transaction_type=None, to_account=None):
+    """Return a dict of the field values that ``action`` sets, or None for
+    ``delete``. Raises ``ValueError`` for an unknown action."""
+    if action == 'delete':
+        return None
+    values = {
+        'remove-pending': {'pending': False},
+        'mark-pending': {'pending': True},
+        'mark-recurring': {'recurring': True},
+        'unmark-recurring': {'recurring': False},
+        'change-type': {'transaction_type': transaction_type},
+        'move': {'account': to_account},
+    }
+    if action not in values:
+        raise ValueError("Unknown action: {0}".format(action))
+    if None in values[action].values():
+        raise ValueError("Missing a value for {0}".format(action))
+    return values[action]
+
+
+def apply_action(transactions, action, transaction_type=None,
+                 to_account=None, chunk_size=BULK_ACTION_CHUNK_SIZE):
+    """Apply an action (see ``ACTIONS``) to the Transactions in the given
+    queryset, returning the number of Transactions changed.
+
+    * ``transaction_type`` -- the new type, for ``change-type``.
+    * ``to_account`` -- the Account to ``move`` the Transactions to.
+    * ``chunk_size`` -- the number of Transactions changed per query (and
+      per database transaction).
+
+    Transactions which already have the action's values are skipped.
+
+    """
+    values = action_values(action, transaction_type, to_account)
+    if values is not None:
+        transactions = transactions.exclude(**values)
+
+    changed = 0
+    pks = transactions.order_by('id').values('id')
+    for chunk in iter_keyset_chunks(pks, chunk_size):
+        chunk = [row['id'] for row in chunk]
+        with commit_on_success():
+            selected = Transaction.objects.filter(pk__in=chunk)
+            if values is None:
+                selected.delete()
+            else:
+                selected.update(**values)
+        changed += len(chunk)
+    return changed
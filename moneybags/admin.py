@@ -3,7 +3,7 @@ from moneybags import models
 
 
 class AccountAdmin(admin.ModelAdmin):
-    list_display = ('name', 'slug', 'owner', )
+    list_display = ('name', 'slug', 'owner', 'balance', )
     search_fields = (
         'name', 'owner__username', 'owner__first_name', 'owner__last_name'
     )
@@ -17,6 +17,7 @@ class TransactionAdmin(admin.ModelAdmin):
         'transaction_type'
     )
     list_filter = ('recurring', 'pending')
+    list_select_related = True
     search_fields = ('description', 'account__name')
 
 
@@ -26,9 +27,38 @@ class RecurringTransactionAdmin(admin.ModelAdmin):
         'due_date', 'account', 'description', 'desc_slug', 'frequency',
         'frequency_start_date', 'last_transaction_date'
     )
+    list_select_related = True
     search_fields = ('description', 'account__name')
 
 
+class MonthlyRollupAdmin(admin.ModelAdmin):
+    date_hierarchy = 'month'
+    list_display = (
+        'month', 'account', 'cleared_credits', 'cleared_debits',
+        'pending_credits', 'pending_debits'
+    )
+    list_select_related = True
+    search_fields = ('account__name', )
+
+
+class BalanceCheckpointAdmin(admin.ModelAdmin):
+    date_hierarchy = 'date'
+    list_display = ('date', 'account', 'balance', 'transaction_count')
+    list_select_related = True
+    search_fields = ('account__name', )
+
+
+class JournalEntryAdmin(admin.ModelAdmin):
+    date_hierarchy = 'created_on'
+    list_display = ('id', 'account', 'kind', 'action', 'object_ids',
+                    'created_on')
+    list_filter = ('kind', 'action')
+    list_select_related = True
+
+
 admin.site.register(models.Account, AccountAdmin)
 admin.site.register(models.Transaction, TransactionAdmin)
 admin.site.register(models.RecurringTransaction, RecurringTransactionAdmin)
+admin.site.register(models.MonthlyRollup, MonthlyRollupAdmin)
+admin.site.register(models.BalanceCheckpoint, BalanceCheckpointAdmin)
+admin.site.register(models.JournalEntry, JournalEntryAdmin)
@@ -0,0 +1,394 @@
+"""
+A JSON API for Accounts, Transactions and RecurringTransactions.
+
+Every view needs an authenticated user (the API uses the same sessions, and
+so the same CSRF protection, as the HTML views) and only sees that user's
+Accounts. Listings are paged with opaque cursors (see
+``utils.keyset_paginate_queryset``), and the ``changes`` feed lets a client
+fetch only what changed since it last synced, rather than a whole ledger.
+
+The ``journal`` feed reports every create, update and delete (including
+deletes, which ``changes`` can't) by sequence number; see ``journal``.
+
+Transactions are created and updated in batches: each POST holds a list of
+Transactions, which are all validated and then written in one database
+transaction, or not at all.
+
+"""
+import json
+from functools import wraps
+from hashlib import sha1
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.transaction import commit_on_success
+from django.forms.models import model_to_dict
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import six
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_GET, require_http_methods
+
+from .exports import _amount
+from .forms import RecurringTransactionForm, TransactionForm
+from .importers import insert_transactions
+from .journal import read_changes
+from .models import (
+    Account,
+    JournalEntry,
+    RecurringTransaction,
+    Transaction,
+)
+from .settings import API_BATCH_SIZE, API_PAGE_SIZE
+from .utils import keyset_paginate_queryset, keyset_token
+
+ACCOUNT_FIELDS = (
+    'id', 'slug', 'name', 'balance', 'total_credits', 'total_debits',
+    'transaction_count', 'version', 'changed_on',
+)
+
+TRANSACTION_FIELDS = (
+    'id', 'date', 'check_no', 'description', 'amount', 'transaction_type',
+    'pending', 'recurring', 'updated_on',
+)
+
+RECURRING_FIELDS = (
+    'id', 'description', 'amount', 'transaction_type', 'frequency',
+    'frequency_start_date', 'last_transaction_date', 'due_date',
+    'updated_on',
+)
+
+AMOUNT_FIELDS = ('amount', 'balance', 'total_credits', 'total_debits')
+
+
+def json_response(data, status=200):
+    return HttpResponse(json.dumps(data, cls=DjangoJSONEncoder),
+                        content_type='application/json', status=status)
+
+
+def json_error(message, status=400, **extra):
+    extra['error'] = message
+    return json_response(extra, status=status)
+
+
+def api_login_required(view):
+    """Like ``login_required``, but answers with a 401 rather than a
+    redirect to the login page."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated():
+            return json_error("Authentication required", status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _errors(form):
+    return dict((name, [six.text_type(e) for e in errors])
+                for name, errors in form.errors.items())
+
+
+def _serialize(row):
+    """Prepare a ``values()`` dict for JSON: amounts are sent as strings
+    with ``AMOUNT_DECIMAL_PLACES``, so no precision is lost."""
+    row = dict(row)
+    for name in AMOUNT_FIELDS:
+        if row.get(name) is not None:
+            row[name] = _amount(row[name])
+    return row
+
+
+def _limit(request):
+    """The page size requested with ``?limit=``, at most ``API_PAGE_SIZE``."""
+    try:
+        limit = int(request.GET.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        limit = API_PAGE_SIZE
+    return max(1, min(limit, API_PAGE_SIZE))
+
+
+def _page(request, queryset, fields, cursor_var='cursor'):
+    """Return a page of ``queryset`` as a dict with the serialized
+    ``results`` and the ``next`` and ``previous`` cursors."""
+    page = keyset_paginate_queryset(request, queryset.values(*fields),
+        num_items=_limit(request), cursor_var=cursor_var)
+    return {
+        'results': [_serialize(row) for row in page],
+        'next': page.next_token,
+        'previous': page.previous_token,
+    }
+
+
+def _get_account(request, account_slug):
+    return get_object_or_404(Account, slug=account_slug, owner=request.user)
+
+
+def _serialize_account(account):
+    return _serialize((name, getattr(account, name))
+                      for name in ACCOUNT_FIELDS)
+
+
+def _read_list(request):
+    """Return the list of objects in the request's JSON body, or None if it
+    isn't a list of objects."""
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+    except ValueError:
+        return None
+    if not isinstance(data, list) or \
+            not all(isinstance(item, dict) for item in data):
+        return None
+    return data
+
+
+@api_login_required
+@require_GET
+def list_accounts(request):
+    """The user's Accounts, with their stored balances."""
+    accounts = Account.objects.filter(owner=request.user)
+    return json_response(_page(request, accounts, ACCOUNT_FIELDS))
+
+
+@api_login_required
+@require_GET
+def detail_account(request, account_slug):
+    """An Account, with its stored balance. With ``?as_of=YYYY-MM-DD``,
+    also its balance on that date (see ``Account.balance_as_of``)."""
+    account = _get_account(request, account_slug)
+    data = _serialize_account(account)
+    if 'as_of' in request.GET:
+        try:
+            as_of = parse_date(request.GET['as_of'])
+        except ValueError:
+            as_of = None
+        if as_of is None:
+            return json_error("Invalid date")
+        data['as_of'] = as_of
+        data['balance_as_of'] = _amount(account.balance_as_of(as_of))
+    return json_response(data)
+
+
+def _client_fingerprint(account, client_id):
+    """The ``fingerprint`` of a Transaction created with a ``client_id``,
+    so a retried batch doesn't create it twice."""
+    key = u"api|{0}|{1}".format(account.pk, client_id)
+    return sha1(key.encode('utf-8')).hexdigest()
+
+
+def _transaction_forms(account, items):
+    """Return a list of ``(item, form)`` for a batch of Transaction dicts,
+    where each form is bound to the item's values on top of either the
+    existing Transaction's (if the item has an ``id``) or the defaults.
+    Existing Transactions are found with one query."""
+    ids = [item['id'] for item in items if item.get('id') is not None]
+    instances = Transaction.objects.filter(account=account, pk__in=ids)
+    instances = dict((t.pk, t) for t in instances)
+
+    fields = list(TransactionForm.base_fields)
+    forms = []
+    for item in items:
+        instance = None
+        if item.get('id') is not None:
+            instance = instances.get(item['id'])
+            if instance is None:
+                forms.append((item, None))
+                continue
+        else:
+            instance = Transaction(account=account)
+        data = model_to_dict(instance, fields)
+        data.update((k, v) for k, v in item.items() if k in fields)
+        forms.append((item, TransactionForm(data, instance=instance)))
+    return forms
+
+
+@api_login_required
+@require_http_methods(['GET', 'POST'])
+def transactions(request, account_slug):
+    """GET a page of the Account's Transactions (newest first), or POST a
+    JSON list of Transactions to create (those without an ``id``) and
+    update (those with one), in a single database transaction.
+
+    New Transactions may include a ``client_id``; creating a Transaction
+    with the same ``client_id`` again returns the existing one, so a batch
+    can safely be retried. The response lists every Transaction in the
+    batch, in order.
+
+    """
+    account = _get_account(request, account_slug)
+    if request.method == 'GET':
+        transactions = Transaction.objects.filter(account=account)
+        return json_response(_page(request, transactions, TRANSACTION_FIELDS))
+
+    items = _read_list(request)
+    if items is None:
+        return json_error("Expected a JSON list of transactions")
+    if len(items) > API_BATCH_SIZE:
+        return json_error("At most {0} transactions per request".format(
+            API_BATCH_SIZE))
+
+    forms = _transaction_forms(account, items)
+    errors = {}
+    client_ids = set()
+    for index, item in enumerate(items):
+        if item.get('client_id') and item.get('id') is None:
+            if item['client_id'] in client_ids:
+                errors[index] = {'client_id': ["Duplicate client_id"]}
+            client_ids.add(item['client_id'])
+    for index, (item, form) in enumerate(forms):
+        if form is None:
+            errors[index] = {'id': ["No such transaction"]}
+        elif not form.is_valid() and index not in errors:
+            errors[index] = _errors(form)
+    if errors:
+        return json_error("Invalid transactions", errors=errors)
+
+    # New Transactions are inserted together (see ``insert_transactions``).
+    new_transactions = []
+    with commit_on_success():
+        for item, form in forms:
+            transaction = form.save(commit=False)
+            if transaction.pk is None:
+                if item.get('client_id'):
+                    transaction.fingerprint = _client_fingerprint(
+                        account, item['client_id'])
+                new_transactions.append(transaction)
+            else:
+                transaction.save()
+        insert_transactions(new_transactions)
+
+    # ``bulk_create`` doesn't set ids, so find them by the fingerprints
+    # ``insert_transactions`` gave them.
+    created = dict(Transaction.objects.filter(account=account,
+        fingerprint__in=[t.fingerprint for t in new_transactions]
+    ).values_list('fingerprint', 'pk'))
+    pks = [created[form.instance.fingerprint]
+           if form.instance.pk is None else form.instance.pk
+           for item, form in forms]
+    rows = Transaction.objects.filter(pk__in=pks).values(*TRANSACTION_FIELDS)
+    rows = dict((row['id'], _serialize(row)) for row in rows)
+    return json_response({'results': [rows[pk] for pk in pks]})
+
+
+@api_login_required
+@require_http_methods(['GET', 'POST'])
+def recurring_transactions(request, account_slug):
+    """GET a page of the Account's RecurringTransactions, or POST a JSON
+    list of changes to their ``frequency`` and ``frequency_start_date``
+    (each with the ``id`` of the rule to change), in a single database
+    transaction."""
+    account = _get_account(request, account_slug)
+    rules = RecurringTransaction.objects.filter(account=account)
+    if request.method == 'GET':
+        # The usual ordering, less the Account (which is always the same).
+        ordered = rules.order_by('-last_transaction_date', 'transaction_type',
+                                 'description')
+        return json_response(_page(request, ordered, RECURRING_FIELDS))
+
+    items = _read_list(request)
+    if items is None:
+        return json_error("Expected a JSON list of recurring transactions")
+    if len(items) > API_BATCH_SIZE:
+        return json_error("At most {0} recurring transactions per "
+                          "request".format(API_BATCH_SIZE))
+
+    ids = [item['id'] for item in items if item.get('id') is not None]
+    instances = dict((rule.pk, rule) for rule in rules.filter(pk__in=ids))
+    fields = list(RecurringTransactionForm.base_fields)
+    forms = []
+    errors = {}
+    for index, item in enumerate(items):
+        rule = instances.get(item.get('id'))
+        if rule is None:
+            errors[index] = {'id': ["No such recurring transaction"]}
+            continue
+        data = model_to_dict(rule, fields)
+        data.update((k, v) for k, v in item.items() if k in fields)
+        form = RecurringTransactionForm(data, instance=rule)
+        if not form.is_valid():
+            errors[index] = _errors(form)
+        forms.append(form)
+    if errors:
+        return json_error("Invalid recurring transactions", errors=errors)
+
+    with commit_on_success():
+        for form in forms:
+            form.save()
+    pks = [form.instance.pk for form in forms]
+    rows = rules.filter(pk__in=pks).values(*RECURRING_FIELDS)
+    rows = dict((row['id'], _serialize(row)) for row in rows)
+    return json_response({'results': [rows[pk] for pk in pks]})
+
+
+def _changed(request, queryset, fields, cursor_var):
+    """Return ``(rows, token)``: the next page of rows written after the
+    position in the ``cursor_var`` token, oldest first, and the token for
+    the position after them (or the same token, if nothing changed)."""
+    queryset = queryset.order_by('updated_on', 'id').values(*fields)
+    page = keyset_paginate_queryset(request, queryset,
+        num_items=_limit(request), cursor_var=cursor_var)
+    token = request.GET.get(cursor_var)
+    if page.object_list:
+        # Even on the last page, so the next sync starts after it.
+        token = keyset_token(queryset, page.object_list[-1])
+    return [_serialize(row) for row in page.object_list], token
+
+
+@api_login_required
+@require_GET
+def changes(request, account_slug):
+    """The Account's Transactions and RecurringTransactions that were
+    created or changed since the positions in the ``since`` tokens, so a
+    client only downloads what changed since it last synced.
+
+    Call this with no tokens for everything, then with the returned
+    ``transactions_since`` and ``recurring_since`` tokens until ``more`` is
+    false; save the tokens and pass them next time. Deleted objects are
+    not reported.
+
+    """
+    account = _get_account(request, account_slug)
+    transactions, transactions_since = _changed(request,
+        Transaction.objects.filter(account=account), TRANSACTION_FIELDS,
+        'transactions_since')
+    rules, recurring_since = _changed(request,
+        RecurringTransaction.objects.filter(account=account),
+        RECURRING_FIELDS, 'recurring_since')
+    limit = _limit(request)
+    return json_response({
+        'account': _serialize_account(account),
+        'transactions': transactions,
+        'recurring_transactions': rules,
+        'transactions_since': transactions_since,
+        'recurring_since': recurring_since,
+        'more': len(transactions) >= limit or len(rules) >= limit,
+    })
+
+
+@api_login_required
+@require_GET
+def journal(request, account_slug):
+    """The Account's journaled creates, updates and deletes after the
+    sequence number ``?after=`` (see ``journal.read_changes``). Pass the
+    returned ``after`` next time; ``more`` says there's more to read now.
+    ``limit`` is the most journal entries read, not changes returned."""
+    account = _get_account(request, account_slug)
+    try:
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        return json_error("Invalid sequence number")
+    limit = _limit(request)
+    changes, next_after = read_changes(account, after, limit + 1)
+    more = len(set(c.sequence for c in changes)) > limit
+    if more:
+        changes = [c for c in changes if c.sequence < next_after]
+        next_after = changes[-1].sequence if changes else after
+    kinds = dict(JournalEntry.KIND_CHOICES)
+    actions = dict(JournalEntry.ACTION_CHOICES)
+    return json_response({
+        'changes': [{
+            'sequence': c.sequence,
+            'type': kinds[c.kind].lower().replace(' ', '_'),
+            'action': actions[c.action].lower(),
+            'id': c.object_id,
+        } for c in changes],
+        'after': next_after,
+        'more': more,
+    })
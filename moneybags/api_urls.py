@@ -0,0 +1,35 @@
+from django.conf.urls.defaults import patterns, url
+
+
+# /accounts/
+# /<account_slug>/transactions/
+# /<account_slug>/recurring/
+# /<account_slug>/changes/
+# /<account_slug>/journal/
+# /<account_slug>/
+
+urlpatterns = patterns('moneybags.api',
+    url(r'^accounts/$',
+        'list_accounts',
+        name='moneybags-api-list-accounts'),
+
+    url(r'^(?P<account_slug>.*)/transactions/$',
+        'transactions',
+        name='moneybags-api-transactions'),
+
+    url(r'^(?P<account_slug>.*)/recurring/$',
+        'recurring_transactions',
+        name='moneybags-api-recurring-transactions'),
+
+    url(r'^(?P<account_slug>.*)/changes/$',
+        'changes',
+        name='moneybags-api-changes'),
+
+    url(r'^(?P<account_slug>.*)/journal/$',
+        'journal',
+        name='moneybags-api-journal'),
+
+    url(r'^(?P<account_slug>.*)/$',
+        'detail_account',
+        name='moneybags-api-detail-account'),
+)
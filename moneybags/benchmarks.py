@@ -0,0 +1,332 @@
+"""
+Synthetic ledgers and a repeatable benchmark suite.
+
+``generate_ledger`` fills the database with users, Accounts, Transactions
+and RecurringTransactions drawn from a seeded random generator, so the same
+arguments always produce the same data. ``run_benchmarks`` builds a ledger
+of each requested size, times the app's hot paths against it, and returns
+results that can be saved as JSON and compared to a baseline with
+``compare_results``.
+
+Run these against a scratch database: the benchmark data is deleted
+afterwards, but it is written to whatever database is configured.
+
+"""
+import csv
+import os
+import random
+import shutil
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from time import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test.client import RequestFactory
+from django.utils.six import StringIO
+
+from .importers import write_batch
+from .instrumentation import profile
+from .models import (
+    Account,
+    RecurringTransaction,
+    Transaction,
+    create_transactions_due_today,
+)
+from .settings import (
+    AMOUNT_DECIMAL_PLACES,
+    IMPORT_BATCH_SIZE,
+    TRANSACTION_TYPE_CREDIT,
+    TRANSACTION_TYPE_DEBIT,
+)
+
+User = get_user_model()
+
+# (description, type, median amount, relative frequency). Amounts are drawn
+# from a log-normal distribution around the median.
+PAYEES = [
+    ("Corner Coffee Shop", TRANSACTION_TYPE_DEBIT, 4.5, 30),
+    ("Grocery Mart", TRANSACTION_TYPE_DEBIT, 85, 12),
+    ("Fuel Stop", TRANSACTION_TYPE_DEBIT, 40, 8),
+    ("Online Store", TRANSACTION_TYPE_DEBIT, 35, 8),
+    ("Thai Kitchen", TRANSACTION_TYPE_DEBIT, 28, 6),
+    ("Pizza Place", TRANSACTION_TYPE_DEBIT, 22, 5),
+    ("Pharmacy", TRANSACTION_TYPE_DEBIT, 18, 4),
+    ("Hardware Store", TRANSACTION_TYPE_DEBIT, 45, 3),
+    ("ATM Withdrawal", TRANSACTION_TYPE_DEBIT, 60, 3),
+    ("Book Shop", TRANSACTION_TYPE_DEBIT, 25, 2),
+    ("Movie Theater", TRANSACTION_TYPE_DEBIT, 24, 2),
+    ("Transfer From Savings", TRANSACTION_TYPE_CREDIT, 200, 2),
+    ("Refund", TRANSACTION_TYPE_CREDIT, 30, 1),
+]
+
+# (description, type, amount, frequency) of the recurring rules each
+# Account gets, in order.
+RECURRING = [
+    ("Paycheck", TRANSACTION_TYPE_CREDIT, 2100, 'b'),
+    ("Rent", TRANSACTION_TYPE_DEBIT, 1450, 'm'),
+    ("Electric Company", TRANSACTION_TYPE_DEBIT, 95, 'm'),
+    ("Mobile Phone", TRANSACTION_TYPE_DEBIT, 65, 'm'),
+    ("Streaming Service", TRANSACTION_TYPE_DEBIT, 12.99, 'm'),
+    ("Car Insurance", TRANSACTION_TYPE_DEBIT, 310, 'q'),
+    ("Gym Membership", TRANSACTION_TYPE_DEBIT, 30, 'm'),
+    ("Domain Renewal", TRANSACTION_TYPE_DEBIT, 15, 'y'),
+]
+
+BENCHMARK_USERNAME = "moneybags-benchmark"
+
+# The default last day of generated ledgers. It's fixed (rather than today)
+# so that a seed generates the same ledger whenever it's run, and benchmark
+# results stay comparable with older baselines.
+LEDGER_END = date(2013, 12, 31)
+
+
+class LedgerGenerator(object):
+    """Draws realistic, reproducible transaction data from a seeded random
+    number generator.
+
+    Purchases are spread over the ``days`` before ``end``, with more of
+    them on weekends, and the last few days' are still pending.
+
+    """
+
+    def __init__(self, seed=0, end=None, days=3 * 365):
+        self.random = random.Random(seed)
+        self.end = end or LEDGER_END
+        self.days = days
+        self._cumulative = []
+        total = 0
+        for payee in PAYEES:
+            total += payee[3]
+            self._cumulative.append(total)
+
+    def _payee(self):
+        n = self.random.uniform(0, self._cumulative[-1])
+        for payee, limit in zip(PAYEES, self._cumulative):
+            if n <= limit:
+                return payee
+        return PAYEES[-1]
+
+    def _date(self):
+        while True:
+            day = self.end - timedelta(days=self.random.randrange(self.days))
+            if day.weekday() >= 5 or self.random.random() < 0.6:
+                return day
+
+    def _amount(self, median):
+        amount = median * self.random.lognormvariate(0, 0.45)
+        return Decimal(str(round(max(amount, 0.5), AMOUNT_DECIMAL_PLACES)))
+
+    def transaction_values(self):
+        """Return a dict of field values for one random Transaction."""
+        description, transaction_type, median, weight = self._payee()
+        day = self._date()
+        return {
+            'date': day,
+            'check_no': None,
+            'description': description,
+            'amount': self._amount(median),
+            'transaction_type': transaction_type,
+            'pending': (self.end - day).days < 5,
+        }
+
+    def transactions(self, account, count):
+        """Yield ``count`` unsaved Transactions for the Account."""
+        for i in range(count):
+            yield Transaction(account=account, **self.transaction_values())
+
+    def recurring_transactions(self, account, count):
+        """Return ``count`` unsaved RecurringTransactions for the Account,
+        each started some time in the last year."""
+        rules = []
+        for i in range(count):
+            description, transaction_type, amount, frequency = \
+                RECURRING[i % len(RECURRING)]
+            if i >= len(RECURRING):
+                description = "{0} {1}".format(description, i)
+            start = self.end - timedelta(days=self.random.randrange(365))
+            rules.append(RecurringTransaction(
+                account=account,
+                description=description,
+                amount=Decimal(str(amount)),
+                transaction_type=transaction_type,
+                frequency=frequency,
+                frequency_start_date=start,
+                last_transaction_date=start,
+            ))
+        return rules
+
+    def csv_rows(self, count):
+        """Yield ``count`` rows of CSV data, in the layout read by
+        ``load_transactions_from_csv``."""
+        for i in range(count):
+            values = self.transaction_values()
+            amount = str(values['amount'])
+            debit = amount
+            credit = ''
+            if values['transaction_type'] == TRANSACTION_TYPE_CREDIT:
+                debit, credit = credit, debit
+            yield [values['date'].strftime('%m/%d/%Y'), '',
+                   values['description'], debit, credit]
+
+
+def generate_ledger(users=1, accounts=1, transactions=1000, recurring=8,
+                    seed=0, end=None, username=BENCHMARK_USERNAME,
+                    batch_size=IMPORT_BATCH_SIZE, stdout=None):
+    """Create ``users`` Users, each with ``accounts`` Accounts holding
+    ``transactions`` Transactions and ``recurring`` RecurringTransactions.
+    Transactions are written in batches (like an import), so millions of
+    rows can be generated in constant memory. Returns the Accounts."""
+    generator = LedgerGenerator(seed, end)
+    created = []
+    for u in range(users):
+        name = "{0}-{1}".format(username, u)
+        user = User.objects.create_user(name, password=name)
+        for a in range(accounts):
+            account = Account.objects.create(
+                name="{0} Account {1}".format(name, a), owner=user)
+            batch = []
+            for t in generator.transactions(account, transactions):
+                batch.append(t)
+                if len(batch) >= batch_size:
+                    write_batch(batch)
+                    batch = []
+            if batch:
+                write_batch(batch)
+            for rule in generator.recurring_transactions(account, recurring):
+                rule.save()
+            created.append(account)
+            if stdout is not None:
+                stdout.write("Created {0} with {1} transactions\n".format(
+                    account.slug, transactions))
+    return created
+
+
+def delete_ledger(username=BENCHMARK_USERNAME):
+    """Delete the Users (and their Accounts) made by ``generate_ledger``."""
+    for user in User.objects.filter(username__startswith=username + '-'):
+        Transaction.objects.filter(account__owner=user).delete()
+        user.delete()
+
+
+def _time(name, size, func, repeat, setup=None):
+    """Run ``func`` ``repeat`` times (calling ``setup``, untimed, before
+    each run), returning a result dict with the timings and the number of
+    queries of the last run."""
+    times = []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        with profile(name) as p:
+            started = time()
+            func()
+            times.append(time() - started)
+    times.sort()
+    return {
+        'name': name,
+        'size': size,
+        'times': times,
+        'min': times[0],
+        'median': times[len(times) // 2],
+        'queries': p.num_queries,
+        'db_time': p.db_time,
+    }
+
+
+def benchmark_size(size, repeat=3, seed=0, end=None, stdout=None):
+    """Generate a ledger with ``size`` Transactions, ending on ``end``
+    (default ``LEDGER_END``), and time each of the benchmarks against it.
+    Returns a list of result dicts."""
+    from . import views
+
+    username = "{0}-{1}".format(BENCHMARK_USERNAME, size)
+    delete_ledger(username)
+    account, = generate_ledger(transactions=size, seed=seed, end=end,
+                               username=username)
+    user = account.owner
+    factory = RequestFactory()
+
+    def request(path, data=None):
+        r = factory.get(path, data or {})
+        r.user = user
+        return r
+
+    def get_balance():
+        Account.objects.get(pk=account.pk).get_balance()
+
+    def detail_account():
+        views.detail_account(request('/'), account.slug)
+
+    def transaction_report():
+        data = {'description': 'coffee', 'description_match': 'contains'}
+        views.transaction_report(request('/', data), account.slug)
+
+    tmpdir = tempfile.mkdtemp()
+    csv_path = os.path.join(tmpdir, 'ledger.csv')
+    with open(csv_path, 'w') as f:
+        csv.writer(f).writerows(
+            LedgerGenerator(seed + 1, end).csv_rows(size))
+    import_account = Account.objects.create(name="Import", owner=user)
+
+    def clear_import():
+        Transaction.objects.filter(account=import_account).delete()
+
+    def load_transactions_from_csv():
+        call_command('load_transactions_from_csv', user.username,
+                     import_account.slug, csv_path, stdout=StringIO())
+
+    def reset_rules():
+        # Move the rules back a month, so there's something to create.
+        Transaction.objects.filter(account=account, recurring=True).delete()
+        start = date.today() - timedelta(days=31)
+        for rule in RecurringTransaction.objects.filter(account=account):
+            rule.last_transaction_date = rule.frequency_start_date = start
+            rule.save()
+
+    benchmarks = [
+        ('get_balance', get_balance, None),
+        ('detail_account', detail_account, None),
+        ('transaction_report', transaction_report, None),
+        ('load_transactions_from_csv', load_transactions_from_csv,
+         clear_import),
+        ('create_transactions_due_today', create_transactions_due_today,
+         reset_rules),
+    ]
+    results = []
+    try:
+        for name, func, setup in benchmarks:
+            result = _time(name, size, func, repeat, setup)
+            results.append(result)
+            if stdout is not None:
+                stdout.write("{name} @ {size}: {median:.4f}s median, "
+                             "{queries} queries\n".format(**result))
+    finally:
+        shutil.rmtree(tmpdir)
+        delete_ledger(username)
+    return results
+
+
+def run_benchmarks(sizes=(1000, 10000), repeat=3, seed=0, end=None,
+                   stdout=None):
+    """Run every benchmark at each of the given ledger sizes."""
+    results = []
+    for size in sizes:
+        results.extend(benchmark_size(size, repeat, seed, end, stdout))
+    return results
+
+
+def compare_results(results, baseline, threshold=0.25):
+    """Compare results to a baseline (both lists of result dicts), returning
+    a list of ``(name, size, baseline_median, median)`` for each benchmark
+    whose median time grew by more than ``threshold`` (a fraction)."""
+    previous = dict(((r['name'], r['size']), r) for r in baseline)
+    regressions = []
+    for result in results:
+        base = previous.get((result['name'], result['size']))
+        if base is None:
+            continue
+        if result['median'] > base['median'] * (1 + threshold):
+            regressions.append((result['name'], result['size'],
+                                base['median'], result['median']))
+    return regressions
@@ -0,0 +1,70 @@
+"""
+Versioned caching of per-Account data.
+
+Every Account has a ``version`` that is bumped whenever the Account, or any
+of its Transactions or RecurringTransactions, are written, including by
+bulk ``update()`` and ``delete()`` (see ``models.touch_accounts``). Cache
+keys include the version, so a stale entry is never read; it just expires.
+
+What's cached: an Account's forecast (``forecast.forecast_balance``), its
+upcoming RecurringTransactions, and each page of its Transactions on its
+page (see ``get_page``; the view caches the rows, so a hit doesn't query
+them, and the template caches their rendering).
+
+This uses Django's default cache, so any backend works (``locmem`` is fine
+for local testing).
+
+"""
+from hashlib import md5
+
+from django.core.cache import cache
+
+from .models import RecurringTransaction, attach_account
+from .settings import CACHE_TIMEOUT
+
+
+def cache_key(account, name, *parts):
+    """Return the cache key for ``name`` (and any other ``parts``) in the
+    current version of the given Account."""
+    extra = u":".join(u"{0}".format(part) for part in parts)
+    return "moneybags:{0}:{1}:{2}:{3}".format(
+        account.pk, account.version, name,
+        md5(extra.encode('utf-8')).hexdigest())
+
+
+def get_or_set(account, name, compute, parts=(), timeout=CACHE_TIMEOUT):
+    """Return the cached value of ``name`` for the given Account, calling
+    ``compute()`` to create (and cache) it if needed."""
+    key = cache_key(account, name, *parts)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
+
+
+def get_page(account, name, paginate, parts=(), timeout=CACHE_TIMEOUT):
+    """Like ``get_or_set``, for a page of results from ``paginate()`` (see
+    ``utils.paginate_queryset`` and ``utils.keyset_paginate_queryset``).
+    The page's rows are fetched and cached, rather than its queryset (which
+    would be pickled with every row it matches)."""
+    def compute():
+        page = paginate()
+        page.object_list = list(page.object_list)
+        paginator = getattr(page, 'paginator', None)
+        if paginator is not None:
+            paginator.num_pages  # Count the rows now, so it's cached too.
+            paginator.object_list = page.object_list
+        return page
+    return get_or_set(account, name, compute, parts, timeout)
+
+
+def get_upcoming_recurring_transactions(account, today):
+    """Return a list of the Account's RecurringTransactions that are due on
+    or after ``today``, from the cache if possible."""
+    def compute():
+        rules = RecurringTransaction.objects.filter(due_date__gte=today,
+            account=account)
+        return list(rules)
+    rules = get_or_set(account, 'upcoming', compute, [today])
+    return attach_account(rules, account)
@@ -0,0 +1,85 @@
+"""
+ETag and Last-Modified support for the account views.
+
+Anything that changes what an account's pages show also bumps the
+Account's ``version`` and ``changed_on`` (see ``models.touch_accounts``),
+so these functions, for use with Django's ``condition`` decorator, can
+decide whether a page has changed with a single query. Unchanged pages get
+a ``304 Not Modified`` without running the view.
+
+"""
+from datetime import date, datetime, time
+from hashlib import md5
+
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .models import Account
+
+
+def _etag(request, *parts):
+    """Hash the request's path (including the querystring, which picks the
+    page, report, etc.) with the given parts."""
+    parts = (request.get_full_path(), ) + parts
+    key = u":".join(u"{0}".format(part) for part in parts)
+    return md5(key.encode('utf-8')).hexdigest()
+
+
+def _start_of_today(changed_on):
+    """Midnight today, in the same form (naive or aware) as ``changed_on``.
+    Pages show what's due today, so they change at midnight too."""
+    midnight = datetime.combine(date.today(), time())
+    if timezone.is_aware(changed_on):
+        midnight = timezone.make_aware(midnight,
+                                       timezone.get_current_timezone())
+    return midnight
+
+
+def _account_state(request, account_slug):
+    """Return ``(pk, version, changed_on)`` for the requested Account, or
+    None if the user has no such Account. This is only queried once per
+    request."""
+    if not hasattr(request, '_moneybags_account_state'):
+        rows = Account.objects.filter(slug=account_slug,
+            owner=request.user).values_list('pk', 'version', 'changed_on')
+        rows = list(rows[:1])
+        request._moneybags_account_state = rows[0] if rows else None
+    return request._moneybags_account_state
+
+
+def account_etag(request, account_slug, **kwargs):
+    """The ETag of a page about a single Account."""
+    state = _account_state(request, account_slug)
+    if state is not None:
+        pk, version, changed_on = state
+        return _etag(request, pk, version, date.today())
+
+
+def account_last_modified(request, account_slug, **kwargs):
+    """When a page about a single Account last changed."""
+    state = _account_state(request, account_slug)
+    if state is not None:
+        pk, version, changed_on = state
+        return max(changed_on, _start_of_today(changed_on))
+
+
+def _accounts_state(request):
+    """Return a summary of all of the user's Accounts that changes whenever
+    any of them does (or one is added or removed)."""
+    if not hasattr(request, '_moneybags_accounts_state'):
+        request._moneybags_accounts_state = Account.objects.filter(
+            owner=request.user).aggregate(count=Count('pk'),
+            versions=Sum('version'), changed_on=Max('changed_on'))
+    return request._moneybags_accounts_state
+
+
+def accounts_etag(request, **kwargs):
+    """The ETag of the list of the user's Accounts."""
+    state = _accounts_state(request)
+    return _etag(request, state['count'], state['versions'],
+                 state['changed_on'])
+
+
+def accounts_last_modified(request, **kwargs):
+    """When the list of the user's Accounts last changed."""
+    return _accounts_state(request)['changed_on']
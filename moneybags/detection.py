@@ -0,0 +1,153 @@
+"""
+Finds recurring series in an Account's transaction history.
+
+The history is read once, in ``(payee_key, transaction_type, date)`` order
+and in chunks (see ``utils.iter_keyset_chunks``), so each payee's
+Transactions arrive together and only one payee's dates and amounts are
+ever held in memory. For each payee, the typical interval between
+Transactions is matched against the ``RecurringTransaction`` frequencies,
+and the series is proposed if enough of the intervals fit.
+
+"""
+from collections import namedtuple
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.transaction import commit_on_success
+
+from .models import RecurringTransaction, Transaction, attach_account
+from .utils import iter_keyset_chunks
+
+# The typical number of days between occurrences for each frequency, and
+# how far (in days) an interval may be from it and still count.
+FREQUENCY_INTERVALS = [
+    ('d', 1, 0),
+    ('w', 7, 1),
+    ('b', 14, 2),
+    ('m', 30.4, 3),
+    ('q', 91.3, 5),
+    ('y', 365.25, 7),
+]
+
+RecurringSeries = namedtuple('RecurringSeries', [
+    'description', 'payee_key', 'transaction_type', 'frequency',
+    'occurrences', 'first_date', 'last_date', 'interval', 'amount',
+    'amount_spread', 'regularity',
+])
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def guess_frequency(intervals):
+    """Return ``(frequency, regularity)`` for a list of intervals (in days)
+    between Transactions, where ``regularity`` is the fraction of intervals
+    that fit the frequency. Returns ``(None, 0)`` if nothing fits."""
+    if not intervals:
+        return None, 0
+    median = _median(intervals)
+    for frequency, days, tolerance in FREQUENCY_INTERVALS:
+        if abs(median - days) <= tolerance:
+            fits = sum(1 for i in intervals if abs(i - days) <= tolerance)
+            return frequency, fits / float(len(intervals))
+    return None, 0
+
+
+def analyze_series(rows, min_occurrences=3, min_regularity=0.75,
+                   max_amount_spread=0.25):
+    """Return a ``RecurringSeries`` for one payee's rows (``values()`` dicts
+    in date order), or None if they don't look like a recurring series."""
+    if len(rows) < min_occurrences:
+        return None
+    dates = [r['date'] for r in rows]
+    intervals = [float((b - a).days) for a, b in zip(dates, dates[1:])]
+    frequency, regularity = guess_frequency(intervals)
+    if frequency is None or regularity < min_regularity:
+        return None
+
+    amounts = [r['amount'] for r in rows]
+    amount = _median(amounts)
+    spread = 0
+    if amount:
+        spread = float(max(abs(a - amount) for a in amounts) / amount)
+    if spread > max_amount_spread:
+        return None
+
+    last = rows[-1]
+    return RecurringSeries(
+        description=last['description'],
+        payee_key=last['payee_key'],
+        transaction_type=last['transaction_type'],
+        frequency=frequency,
+        occurrences=len(rows),
+        first_date=dates[0],
+        last_date=dates[-1],
+        interval=_median(intervals),
+        amount=last['amount'],
+        amount_spread=spread,
+        regularity=regularity,
+    )
+
+
+def detect_recurring(account, min_occurrences=3, min_regularity=0.75,
+                     max_amount_spread=0.25):
+    """Return a list of ``RecurringSeries`` found in the Account's history
+    that don't already have a ``RecurringTransaction``.
+
+    * ``min_occurrences`` -- the fewest Transactions that make a series.
+    * ``min_regularity`` -- the fraction of intervals that must fit the
+      guessed frequency.
+    * ``max_amount_spread`` -- how far (as a fraction of the median) any
+      amount may be from the median amount.
+
+    """
+    # Rules are keyed by payee (their ``desc_slug``), since a rule's
+    # description is only that of one occurrence ("PAYROLL #1005").
+    existing = set(RecurringTransaction.objects.filter(account=account)
+                   .values_list('desc_slug', flat=True))
+
+    transactions = Transaction.objects.filter(account=account).exclude(
+        payee_key='').order_by('payee_key', 'transaction_type', 'date', 'id')
+    transactions = transactions.values('id', 'payee_key', 'transaction_type',
+        'date', 'description', 'amount')
+    rows = (row for chunk in iter_keyset_chunks(transactions)
+            for row in chunk)
+
+    found = []
+    key = itemgetter('payee_key', 'transaction_type')
+    for (payee, transaction_type), series in groupby(rows, key):
+        series = analyze_series(list(series), min_occurrences,
+                                min_regularity, max_amount_spread)
+        if series is not None and payee not in existing:
+            found.append(series)
+    return found
+
+
+def create_recurring_transactions(account, series):
+    """Create a ``RecurringTransaction`` for each ``RecurringSeries``, and
+    mark the series' Transactions as recurring. Returns the new rules."""
+    rules = []
+    with commit_on_success():
+        for s in series:
+            rule = RecurringTransaction(
+                account=account,
+                description=s.description,
+                amount=s.amount,
+                transaction_type=s.transaction_type,
+                frequency=s.frequency,
+                frequency_start_date=s.last_date,
+                last_transaction_date=s.last_date,
+            )
+            rule.save()
+            rules.append(rule)
+            # The series' descriptions can differ ("PAYROLL #1001"), so the
+            # rule just created is the only one they should have.
+            Transaction.objects.filter(account=account,
+                payee_key=s.payee_key, transaction_type=s.transaction_type,
+                recurring=False).update(recurring=True, sync_recurring=False)
+    return attach_account(rules, account)
@@ -0,0 +1,97 @@
+"""
+Streaming exports of Transactions.
+
+Rows are read from the database a chunk at a time (see
+``utils.iter_keyset_chunks``) and written to a ``StreamingHttpResponse`` as
+they're read, so memory use stays flat however many Transactions match.
+
+"""
+import csv
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.encoding import smart_str
+
+from .settings import (
+    AMOUNT_DECIMAL_PLACES,
+    EXPORT_CHUNK_SIZE,
+    TRANSACTION_TYPE_DEBIT,
+)
+from .utils import iter_keyset_chunks
+
+# The fields read for each exported Transaction.
+EXPORT_FIELDS = (
+    'id', 'date', 'check_no', 'description', 'amount', 'transaction_type',
+    'pending',
+)
+
+
+def _amount(value):
+    """Format an amount with ``AMOUNT_DECIMAL_PLACES``, however the database
+    returned it."""
+    places = Decimal(10) ** -AMOUNT_DECIMAL_PLACES
+    return str(Decimal(str(value)).quantize(places))
+
+
+class Echo(object):
+    """A file-like object whose ``write`` just returns what it's given, so a
+    ``csv.writer`` can format rows for a streaming response."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(transactions):
+    """Yield lines of CSV for the given ``values()`` dicts, in the same
+    layout that ``load_transactions_from_csv`` reads (date, check number,
+    description, debit, credit), so an export can be imported again."""
+    writer = csv.writer(Echo())
+    for t in transactions:
+        debit = credit = ''
+        if t['transaction_type'] == TRANSACTION_TYPE_DEBIT:
+            debit = _amount(t['amount'])
+        else:
+            credit = _amount(t['amount'])
+        yield writer.writerow([
+            t['date'].strftime('%m/%d/%Y'),
+            t['check_no'] if t['check_no'] is not None else '',
+            smart_str(t['description']),
+            debit,
+            credit,
+        ])
+
+
+def ndjson_lines(transactions):
+    """Yield one line of JSON for each of the given ``values()`` dicts."""
+    encoder = DjangoJSONEncoder(sort_keys=True)
+    for t in transactions:
+        t['amount'] = _amount(t['amount'])
+        yield encoder.encode(t) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', csv_lines),
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+}
+
+
+def iter_export(queryset, fmt, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the lines of an export of the given Transactions."""
+    content_type, lines = EXPORT_FORMATS[fmt]
+    queryset = queryset.values(*EXPORT_FIELDS)
+    for chunk in iter_keyset_chunks(queryset, chunk_size):
+        for line in lines(chunk):
+            yield line
+
+
+def export_response(queryset, fmt, filename):
+    """Return a ``StreamingHttpResponse`` that exports the given Transactions
+    as ``fmt`` (one of ``EXPORT_FORMATS``), as a download named
+    ``filename``."""
+    content_type = EXPORT_FORMATS[fmt][0]
+    response = StreamingHttpResponse(iter_export(queryset, fmt),
+                                     content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="{0}"'.format(
+        filename)
+    return response
@@ -0,0 +1,72 @@
+"""
+Cash-flow forecasts: where an Account's balance is heading, given its
+``RecurringTransaction``s.
+
+"""
+from datetime import date, timedelta
+
+from .caching import get_or_set
+from .models import RecurringTransaction
+from .recurrence import bulk_between, compile_rule
+from .settings import TRANSACTION_TYPE_CREDIT
+
+
+def compute_forecast(balance, rules, start, days):
+    """Project ``balance`` forward for ``days`` days from ``start``.
+
+    ``rules`` are dicts with ``pk``, ``frequency``, ``frequency_start_date``,
+    ``due_date``, ``last_transaction_date``, ``amount`` and
+    ``transaction_type`` keys. Each rule's occurrences from its due date on
+    are added up into one change per day, which is then accumulated into a
+    running balance. Anything overdue (due before ``start``) is applied on
+    ``start``. A rule without a frequency is only due once, so it's left out
+    if its Transaction has already been recorded (on or after its due date),
+    and is already in ``balance``.
+
+    Returns a list of ``(date, balance)`` tuples, one for every day.
+
+    """
+    end = start + timedelta(days=days - 1)
+    occurrences = bulk_between([
+        (r['pk'], r['frequency'], r['frequency_start_date'], r['due_date'])
+        for r in rules
+    ], end)
+
+    changes = [0] * days
+    for rule in rules:
+        dates = occurrences[rule['pk']]
+        one_off = compile_rule(rule['frequency'],
+                               rule['frequency_start_date']) is None
+        if one_off:
+            due, last = rule['due_date'], rule['last_transaction_date']
+            recorded = last is not None and last >= due
+            dates = [due] if due <= end and not recorded else []
+        amount = rule['amount']
+        if rule['transaction_type'] != TRANSACTION_TYPE_CREDIT:
+            amount = -amount
+        for day in dates:
+            changes[max(0, (day - start).days)] += amount
+
+    series = []
+    for offset, change in enumerate(changes):
+        balance += change
+        series.append((start + timedelta(days=offset), balance))
+    return series
+
+
+def forecast_balance(account, days=365, start=None):
+    """Return the projected daily balance of ``account`` for the next
+    ``days`` days, as a list of ``(date, balance)`` tuples.
+
+    Forecasts are cached until anything in the Account changes (see
+    ``caching``).
+
+    """
+    start = start or date.today()
+
+    def compute():
+        rules = list(RecurringTransaction.objects.filter(account=account)
+            .values('pk', 'frequency', 'frequency_start_date', 'due_date',
+                    'last_transaction_date', 'amount', 'transaction_type'))
+        return compute_forecast(account.balance, rules, start, days)
+    return get_or_set(account, 'forecast', compute, [start, days])
@@ -1,5 +1,7 @@
 from django import forms
+from actions import ACTIONS
 from models import Account, Transaction, RecurringTransaction
+from search import MATCH_LOOKUPS, search_transactions
 
 
 class AccountForm(forms.ModelForm):
@@ -34,6 +36,8 @@ class TransactionReportForm(forms.Form):
         ('iexact', ''),
         ('startswith', 'Starts With'),
         ('endswith', 'Ends With'),
+        ('contains', 'Contains'),
+        ('word', 'Contains Word'),
         ('exact', 'Exact'),
     ]
     description = forms.CharField(
@@ -46,12 +50,10 @@ class TransactionReportForm(forms.Form):
         help_text="(optional) Match Transactions up to this date. "
                   "Format: mm/dd/YYY")
 
-    def _cleaned_data_as_kwargs(self):
+    def _date_kwargs(self):
         # Grab the claned data
         from_date = self.cleaned_data.get('from_date', None)
         to_date = self.cleaned_data.get('to_date', None)
-        desc = self.cleaned_data['description']
-        matching = self.cleaned_data['description_match']
 
         # Create a dict of kwargs to pass to an ORM filter
         kwargs = {}
@@ -62,34 +64,148 @@ class TransactionReportForm(forms.Form):
         if to_date:
             kwargs.update({'date__lte': to_date})
 
-        if matching == "startswith":
-            kwargs.update({'description__istartswith': desc})
-        elif matching == "endswith":
-            kwargs.update({'date__iendswith': desc})
-        elif matching == "exact":
-            kwargs.update({'date': desc})
-        else:  # iexact
-            kwargs.update({'date__iexact': desc})
+        return kwargs
+
+    def _cleaned_data_as_kwargs(self):
+        desc = self.cleaned_data['description']
+        matching = self.cleaned_data['description_match']
+
+        kwargs = self._date_kwargs()
+        if matching == "exact":
+            kwargs.update({'description': desc})
+        else:
+            kwargs.update(MATCH_LOOKUPS[matching](desc))
 
         return kwargs
 
-    def get_matching_transactions(self, fields=None):
+    def get_matching_transactions(self, fields=None, account=None):
         """Do the query to get matching Transactions. This should only be
         called after validation.
 
         * fields - a tuple of fields to bass into the ORM's ``.values()``
                    method. If provided, this should dramatically speed up
                    queries.
+        * account - (optional) only match this Account's Transactions. The
+                    description is then found with the Account's search
+                    index (see ``search``), rather than a table scan.
 
         """
+        desc = self.cleaned_data['description']
+        matching = self.cleaned_data['description_match']
+
+        if account is None:
+            kwargs = self._cleaned_data_as_kwargs()
+            transactions = Transaction.objects.filter(**kwargs)
+        elif matching == "exact":
+            kwargs = self._cleaned_data_as_kwargs()
+            transactions = Transaction.objects.filter(account=account,
+                **kwargs)
+        else:
+            transactions = Transaction.objects.filter(**self._date_kwargs())
+            transactions = search_transactions(account, desc, matching,
+                transactions)
 
-        kwargs = self._cleaned_data_as_kwargs()
-        transactions = Transaction.objects.filter(**kwargs)
         if fields:
             transactions = transactions.values(*fields)
         return transactions
 
 
+class TransactionSelectionForm(forms.Form):
+    """This form selects all of an Account's ``Transactions`` that match
+    certain criteria, so an action can be applied to them on the server
+    (see ``actions``) without listing each one."""
+    PENDING_OPTIONS = [
+        ('', 'Pending or Cleared'),
+        ('pending', 'Pending'),
+        ('cleared', 'Cleared'),
+    ]
+    TYPE_OPTIONS = [('', 'Credits or Debits')] + \
+        list(Transaction.TRANSACTION_TYPE)
+
+    from_date = forms.DateField(required=False,
+        help_text="(optional) Match Transactions starting with this date. "
+                  "Format: mm/dd/YYY")
+    to_date = forms.DateField(required=False,
+        help_text="(optional) Match Transactions up to this date. "
+                  "Format: mm/dd/YYY")
+    pending = forms.ChoiceField(choices=PENDING_OPTIONS, required=False)
+    transaction_type = forms.TypedChoiceField(choices=TYPE_OPTIONS,
+        coerce=int, empty_value=None, required=False)
+    description = forms.CharField(required=False,
+        help_text="(optional) Match Transactions by Description")
+    description_match = forms.ChoiceField(required=False,
+        choices=TransactionReportForm.MATCHING_OPTIONS)
+    everything = forms.BooleanField(required=False,
+        help_text="Select every Transaction in the Account")
+
+    # The fields that narrow the selection.
+    FILTERS = ('from_date', 'to_date', 'pending', 'transaction_type',
+               'description')
+
+    def clean(self):
+        cleaned_data = super(TransactionSelectionForm, self).clean()
+        filters = [cleaned_data.get(name) for name in self.FILTERS]
+        if not cleaned_data.get('everything') and \
+                all(value in (None, '') for value in filters):
+            # An empty form would otherwise select the whole Account.
+            raise forms.ValidationError("Choose which Transactions to "
+                "select, or select every Transaction.")
+        return cleaned_data
+
+    def get_matching_transactions(self, account):
+        """Return a queryset of the Account's matching Transactions. This
+        should only be called after validation."""
+        data = self.cleaned_data
+        kwargs = {}
+        if data.get('from_date'):
+            kwargs['date__gte'] = data['from_date']
+        if data.get('to_date'):
+            kwargs['date__lte'] = data['to_date']
+        if data.get('pending'):
+            kwargs['pending'] = data['pending'] == 'pending'
+        if data.get('transaction_type') is not None:
+            kwargs['transaction_type'] = data['transaction_type']
+        transactions = Transaction.objects.filter(account=account, **kwargs)
+
+        desc = data.get('description')
+        matching = data.get('description_match') or 'iexact'
+        if desc and matching == 'exact':
+            transactions = transactions.filter(description=desc)
+        elif desc:
+            transactions = search_transactions(account, desc, matching,
+                transactions)
+        return transactions
+
+
+class TransactionActionForm(forms.Form):
+    """This form picks an action to apply to a selection of an Account's
+    ``Transactions``, along with the new type (for ``change-type``) or the
+    Account to move them to (for ``move``). See ``actions``."""
+    action = forms.ChoiceField(choices=ACTIONS)
+    transaction_type = forms.TypedChoiceField(
+        choices=Transaction.TRANSACTION_TYPE, coerce=int, empty_value=None,
+        required=False)
+    to_account = forms.ModelChoiceField(queryset=Account.objects.none(),
+        required=False)
+
+    def __init__(self, *args, **kwargs):
+        account = kwargs.pop('account')
+        super(TransactionActionForm, self).__init__(*args, **kwargs)
+        # Transactions can only be moved to the owner's other Accounts.
+        self.fields['to_account'].queryset = Account.objects.filter(
+            owner=account.owner_id).exclude(pk=account.pk)
+
+    def clean(self):
+        cleaned_data = super(TransactionActionForm, self).clean()
+        action = cleaned_data.get('action')
+        if action == 'change-type' and \
+                cleaned_data.get('transaction_type') is None:
+            raise forms.ValidationError("Choose a Transaction type.")
+        if action == 'move' and not cleaned_data.get('to_account'):
+            raise forms.ValidationError("Choose an Account to move to.")
+        return cleaned_data
+
+
 def modelform_handler(request, form_klass, instance=None, commit=True):
     """
     A convenience function to handle ModelForm creation and
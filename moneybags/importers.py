@@ -0,0 +1,417 @@
+"""
+Batched, streaming import of Transactions.
+
+Rows are streamed from one or more CSV files, parsed in chunks (optionally
+in a pool of worker processes), and written by a single process with
+``bulk_create`` in batches, each batch in its own database transaction.
+Imports are idempotent: rows whose fingerprint already exists are skipped.
+
+"""
+import os
+from collections import defaultdict, deque
+from datetime import datetime
+from decimal import Decimal
+from hashlib import sha1
+from multiprocessing import Pool
+from time import time
+from uuid import uuid4
+
+from django.db.transaction import commit_on_success
+
+from .models import (
+    Transaction,
+    apply_ledger_changes,
+    index_descriptions,
+    journal_inserted_transactions,
+    ledger_rows,
+    sync_recurring_transactions,
+)
+from .settings import (
+    AMOUNT_DECIMAL_PLACES,
+    IMPORT_BATCH_SIZE,
+    TRANSACTION_TYPE_DEBIT,
+    TRANSACTION_TYPE_CREDIT,
+)
+from .utils import (
+    chunked,
+    normalize_description,
+    payee_key,
+    read_csv_rows,
+    to_decimal,
+)
+
+
+class RowError(ValueError):
+    """Raised when a row of transaction data can't be imported."""
+
+
+def parse_row(row, date_format_string='%m/%d/%Y'):
+    """Convert a row of CSV data (date, check, description, debit, credit)
+    into a dict of ``Transaction`` field values. Raises ``RowError`` if the
+    row is invalid."""
+    if len(row) != 5:
+        raise RowError("expected 5 columns, found {0}".format(len(row)))
+    date, check, description, debit, credit = row
+
+    # Check for credits or Debits; One of these should be None
+    debit = to_decimal(debit)
+    credit = to_decimal(credit)
+    if debit is not None and credit is not None:
+        raise RowError("both a debit and a credit amount")
+    elif debit is None:
+        amount = credit
+        trans_type = TRANSACTION_TYPE_CREDIT
+    else:
+        amount = debit
+        trans_type = TRANSACTION_TYPE_DEBIT
+    if not amount:
+        raise RowError("no amount")
+
+    try:
+        date = datetime.strptime(date, date_format_string).date()
+    except ValueError:
+        raise RowError("invalid date")
+
+    try:
+        check_no = int(check)
+    except ValueError:
+        check_no = None
+
+    return {
+        'date': date,
+        'check_no': check_no,
+        'description': description,
+        'amount': amount,
+        'transaction_type': trans_type,
+    }
+
+
+def parse_chunk(chunk, date_format_string='%m/%d/%Y'):
+    """Parse a chunk of ``(source, line_no, row)`` tuples. Returns a tuple of
+    ``(parsed, rejected, seconds)`` where ``parsed`` is a list of
+    ``(source, values)``, ``values`` being a dict of field values, and
+    ``rejected`` a list of ``(source, line_no, reason, row)``.
+
+    This only does CPU work, so it can run in a worker process.
+
+    """
+    started = time()
+    parsed = []
+    rejected = []
+    for source, line_no, row in chunk:
+        try:
+            parsed.append((source, parse_row(row, date_format_string)))
+        except RowError as e:
+            rejected.append((source, line_no, str(e), row))
+    return parsed, rejected, time() - started
+
+
+def _parse_chunk_star(args):
+    """``Pool`` workers only get a single argument."""
+    return parse_chunk(*args)
+
+
+def iter_chunks(sources, chunk_size):
+    """Read ``(name, rows)`` sources in order and yield lists of at most
+    ``chunk_size`` ``(name, line_no, row)`` tuples."""
+    chunk = []
+    for name, rows in sources:
+        for line_no, row in enumerate(rows, 1):
+            chunk.append((name, line_no, row))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def find_csv_files(paths):
+    """Expand any directories in ``paths`` to the ``.csv`` files they contain
+    (sorted by name, so imports are repeatable)."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(n for n in os.listdir(path)
+                           if n.lower().endswith('.csv'))
+            files.extend(os.path.join(path, n) for n in names)
+        else:
+            files.append(path)
+    return files
+
+
+def _parse_in_order(chunks, date_format_string, workers, timings):
+    """Yield the result of ``parse_chunk`` for each chunk, in order.
+
+    With more than one worker, chunks are parsed in a process pool. Only a
+    few chunks are handed to the pool at a time, so memory use stays flat
+    no matter how much there is to parse.
+
+    """
+    if workers <= 1:
+        for chunk in _timed(chunks, timings, 'read'):
+            yield parse_chunk(chunk, date_format_string)
+        return
+
+    # The workers only parse rows and never use the database, so the
+    # parent's connection (and any transaction it's in) is left alone.
+    pool = Pool(workers)
+    try:
+        pending = deque()
+        for chunk in _timed(chunks, timings, 'read'):
+            pending.append(pool.apply_async(
+                _parse_chunk_star, [(chunk, date_format_string)]))
+            if len(pending) >= workers * 2:
+                yield _timed_get(pending.popleft(), timings)
+        while pending:
+            yield _timed_get(pending.popleft(), timings)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _timed(iterable, timings, stage):
+    """Iterate, adding the time spent waiting on ``iterable`` to
+    ``timings[stage]``."""
+    iterator = iter(iterable)
+    while True:
+        started = time()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            timings[stage] += time() - started
+        yield item
+
+
+def _timed_get(async_result, timings):
+    started = time()
+    value = async_result.get()
+    timings['wait'] += time() - started
+    return value
+
+
+class ImportResult(object):
+    """Counts and per-stage timings from an import, plus a (bounded) sample
+    of the rejected rows.
+
+    The ``timings`` stages are: ``read`` (reading CSV files), ``parse``
+    (parsing, summed across workers), ``wait`` (waiting on parse workers)
+    and ``write`` (database inserts).
+
+    """
+    max_samples = 20
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.skipped = 0
+        self.rejected = defaultdict(int)
+        self.samples = []
+        self.timings = defaultdict(float)
+        self.started = time()
+        self.finished = None
+
+    def reject(self, source, line_no, reason, row):
+        self.rejected[reason] += 1
+        if len(self.samples) < self.max_samples:
+            self.samples.append((source, line_no, reason, row))
+
+    @property
+    def num_rejected(self):
+        return sum(self.rejected.values())
+
+    @property
+    def elapsed(self):
+        return (self.finished or time()) - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / max(self.elapsed, 1e-6)
+
+    def summary(self):
+        lines = [
+            "Read {0} rows in {1:.1f}s ({2:.0f} rows/sec): "
+            "{3} created, {4} already imported, {5} rejected".format(
+                self.rows, self.elapsed, self.rows_per_second,
+                self.created, self.skipped, self.num_rejected)
+        ]
+        lines.append("Timings: " + ", ".join(
+            "{0} {1:.2f}s".format(stage, self.timings[stage])
+            for stage in ('read', 'parse', 'wait', 'write')
+        ))
+        for reason, count in sorted(self.rejected.items()):
+            lines.append("  {0}: {1}".format(reason, count))
+        for source, line_no, reason, row in self.samples:
+            lines.append("  {0}:{1} ({2}): {3}".format(
+                source, line_no, reason, row))
+        return "\n".join(lines) + "\n"
+
+
+def fingerprint(account_id, values, occurrence=0):
+    """Return a hex digest identifying an imported row: its account, date,
+    amount, type, check number and normalized description.
+
+    ``occurrence`` distinguishes identical rows within one source (say, two
+    coffees on the same day), so that they're both kept, while re-importing
+    the same rows still produces the same fingerprints. It counts the
+    earlier identical rows in the same run of rows with that date (see
+    ``import_sources``).
+
+    """
+    places = Decimal(10) ** -AMOUNT_DECIMAL_PLACES
+    key = u"|".join([
+        str(account_id),
+        values['date'].isoformat(),
+        str(Decimal(values['amount']).quantize(places)),
+        str(values['transaction_type']),
+        str(values['check_no'] or ''),
+        normalize_description(values['description']),
+        str(occurrence),
+    ])
+    return sha1(key.encode('utf-8')).hexdigest()
+
+
+def insert_transactions(transactions):
+    """Insert a batch of unsaved Transactions and add them to their
+    Accounts' stored totals, search indexes and RecurringTransactions. The
+    caller manages the database transaction (see ``write_batch``).
+
+    Transactions whose ``fingerprint`` already exists, or repeats one
+    earlier in the batch (e.g. from overlapping files), are skipped, using
+    one lookup for the whole batch. Any without a fingerprint are given a
+    random one, so they can be found again once inserted (to journal them,
+    for instance). Returns the number inserted.
+
+    """
+    for t in transactions:
+        if not t.fingerprint:
+            t.fingerprint = uuid4().hex
+    fingerprints = [t.fingerprint for t in transactions]
+    existing = set()
+    for chunk in chunked(fingerprints):
+        existing.update(Transaction.objects.filter(
+            fingerprint__in=chunk).values_list('fingerprint', flat=True))
+    unique = []
+    for t in transactions:
+        if t.fingerprint not in existing:
+            existing.add(t.fingerprint)
+            t.payee_key = payee_key(t.description)
+            unique.append(t)
+    transactions = unique
+
+    Transaction.objects.bulk_create(transactions)
+    journal_inserted_transactions(transactions)
+    sync_recurring_transactions(transactions, touch=False)
+    apply_ledger_changes(ledger_rows(transactions))
+    index_descriptions((t.account_id, t.description) for t in transactions)
+    return len(transactions)
+
+
+def write_batch(transactions):
+    """``insert_transactions`` in a single database transaction."""
+    with commit_on_success():
+        return insert_transactions(transactions)
+
+
+def import_transactions(account, rows, date_format_string='%m/%d/%Y',
+                        pending=True, batch_size=IMPORT_BATCH_SIZE,
+                        stdout=None, workers=1):
+    """Import rows of CSV data (see ``utils.load_csv_data``) into the given
+    Account, returning an ``ImportResult``.
+
+    * ``rows`` -- any iterable of 5-item rows; it is consumed lazily.
+    * ``pending`` -- (default is True) Whether or not to create pending
+      Transactions
+    * ``batch_size`` -- the number of rows to parse and insert at a time;
+      each batch is written in its own database transaction.
+    * ``stdout`` -- if given, progress is written here after each batch.
+    * ``workers`` -- the number of processes used to parse rows.
+
+    """
+    return import_sources(account, [('<rows>', rows)], date_format_string,
+                          pending, batch_size, stdout, workers)
+
+
+def import_files(account, paths, date_format_string='%m/%d/%Y',
+                 pending=True, batch_size=IMPORT_BATCH_SIZE, stdout=None,
+                 workers=1):
+    """Import one or more CSV files (or directories of them) into the given
+    Account. Files are imported in the order given, and directories in name
+    order, so the result is the same however many ``workers`` parse them.
+    See ``import_transactions`` for the other arguments."""
+    sources = [(path, read_csv_rows(path)) for path in find_csv_files(paths)]
+    return import_sources(account, sources, date_format_string, pending,
+                          batch_size, stdout, workers)
+
+
+def import_sources(account, sources, date_format_string='%m/%d/%Y',
+                   pending=True, batch_size=IMPORT_BATCH_SIZE, stdout=None,
+                   workers=1):
+    """Import ``(name, rows)`` sources into the given Account.
+
+    Rows are parsed in chunks of ``batch_size`` (in a process pool, if
+    ``workers`` is more than 1) while this process writes the parsed chunks
+    to the database, in order, one batch at a time.
+
+    Each row is given a ``fingerprint``, and rows that have already been
+    imported are skipped, so importing overlapping files is safe, in one
+    import or several. Identical rows are counted within each run of rows
+    with the same date in a source (see ``fingerprint``), so only the
+    current run's rows, and a count of the earlier runs of each date of the
+    source (statements are usually sorted, so there's one), are kept in
+    memory.
+
+    """
+    result = ImportResult()
+    occurrences = defaultdict(int)  # identical rows in the current run
+    runs = defaultdict(int)  # earlier runs of each date in the source
+    current_source = current_date = None
+    chunks = iter_chunks(sources, batch_size)
+    parsed_chunks = _parse_in_order(chunks, date_format_string, workers,
+                                    result.timings)
+    for parsed, rejected, parse_seconds in parsed_chunks:
+        result.rows += len(parsed) + len(rejected)
+        result.timings['parse'] += parse_seconds
+        for source, line_no, reason, row in rejected:
+            result.reject(source, line_no, reason, row)
+
+        if parsed:
+            started = time()
+            batch = []
+            for source, values in parsed:
+                if source != current_source:
+                    # Sources are read one after another, so a row's
+                    # occurrence only counts earlier rows of its own source.
+                    runs.clear()
+                    current_source = current_date = None
+                if values['date'] != current_date:
+                    if current_date is not None:
+                        runs[current_date] += 1
+                    occurrences.clear()
+                    current_source, current_date = source, values['date']
+                key = fingerprint(account.pk, values)
+                occurrence = occurrences[key]
+                if runs[current_date]:
+                    # A later run of a date (in an unsorted source)
+                    occurrence = "{0}.{1}".format(runs[current_date],
+                                                  occurrence)
+                values['fingerprint'] = fingerprint(
+                    account.pk, values, occurrence)
+                occurrences[key] += 1
+                batch.append(
+                    Transaction(account=account, pending=pending, **values))
+            created = write_batch(batch)
+            result.created += created
+            result.skipped += len(batch) - created
+            result.timings['write'] += time() - started
+
+        if stdout is not None:
+            stdout.write("Imported {0} rows ({1:.0f} rows/sec)\n".format(
+                result.created, result.rows_per_second))
+    result.finished = time()
+
+    if stdout is not None:
+        stdout.write(result.summary())
+    return result
@@ -0,0 +1,260 @@
+"""
+Optional query-count and timing instrumentation.
+
+``profile()`` records the number of queries, the total time spent in the
+database, the time spent rendering templates (with ``utils.rtr``) and the
+slowest queries run inside it. ``InstrumentationMiddleware`` profiles every
+moneybags view, and ``instrument_command`` every moneybags management
+command, when ``MONEYBAGS_INSTRUMENTATION`` is on. Finished profiles are sent
+to the sink named by ``MONEYBAGS_INSTRUMENTATION_SINK``.
+
+``query_budget()`` and ``QueryBudgetMixin`` fail a test if a block of code
+runs more queries than it should.
+
+"""
+import json
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from time import time
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_started
+from django.db import connections, reset_queries
+from django.utils.importlib import import_module
+
+from .settings import (
+    INSTRUMENTATION,
+    INSTRUMENTATION_FILE,
+    INSTRUMENTATION_SINK,
+    INSTRUMENTATION_SLOWEST,
+)
+
+logger = logging.getLogger('moneybags.instrumentation')
+
+_local = threading.local()
+
+
+class Profile(object):
+    """The queries and timings recorded for one view or command."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time()
+        self.elapsed = None
+        self.render_time = 0.0
+        self.queries = []
+
+    @property
+    def num_queries(self):
+        return len(self.queries)
+
+    @property
+    def db_time(self):
+        return sum(float(q['time']) for q in self.queries)
+
+    def slowest(self, count=INSTRUMENTATION_SLOWEST):
+        """The ``count`` slowest queries, slowest first."""
+        queries = sorted(self.queries, key=lambda q: float(q['time']),
+                         reverse=True)
+        return queries[:count]
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'started': self.started,
+            'elapsed': self.elapsed,
+            'num_queries': self.num_queries,
+            'db_time': self.db_time,
+            'render_time': self.render_time,
+            'slowest': [
+                {'sql': q['sql'], 'time': float(q['time'])}
+                for q in self.slowest()
+            ],
+        }
+
+
+def _stack():
+    if not hasattr(_local, 'profiles'):
+        _local.profiles = []
+    return _local.profiles
+
+
+def current_profile():
+    """Return the innermost active ``Profile`` in this thread, or None."""
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def timed_render():
+    """Add the time spent in this block to the active profiles' render
+    time. ``utils.rtr`` uses this."""
+    started = time()
+    try:
+        yield
+    finally:
+        for p in _stack():
+            p.render_time += time() - started
+
+
+def start_profile(name):
+    """Start recording a ``Profile``; pass it to ``finish_profile`` when
+    done. Queries are logged for every database while any profile is
+    active."""
+    p = Profile(name)
+    p._connections = []
+    for connection in connections.all():
+        p._connections.append((connection, connection.use_debug_cursor,
+                               len(connection.queries)))
+        connection.use_debug_cursor = True
+    _stack().append(p)
+    return p
+
+
+def finish_profile(p, sink=None):
+    """Stop recording ``p`` and send it to ``sink`` (if given)."""
+    p.elapsed = time() - p.started
+    for connection, use_debug_cursor, start in p._connections:
+        p.queries.extend(connection.queries[start:])
+        connection.use_debug_cursor = use_debug_cursor
+    stack = _stack()
+    if p in stack:
+        stack.remove(p)
+    if sink is not None:
+        sink.emit(p)
+    return p
+
+
+@contextmanager
+def profile(name, sink=None):
+    """Record the queries and timings of a block of code::
+
+        with profile('rebuild') as p:
+            ...
+        print(p.num_queries, p.db_time)
+
+    The ``Profile`` is sent to ``sink`` at the end, if one is given.
+
+    """
+    p = start_profile(name)
+    try:
+        yield p
+    finally:
+        finish_profile(p, sink)
+
+
+class LogSink(object):
+    """Logs a one-line summary of each profile (and its slowest queries at
+    DEBUG level) to the ``moneybags.instrumentation`` logger."""
+
+    def emit(self, p):
+        logger.info("%s: %d queries, %.1fms db, %.1fms render, %.1fms total",
+                    p.name, p.num_queries, p.db_time * 1000,
+                    p.render_time * 1000, p.elapsed * 1000)
+        for q in p.slowest():
+            logger.debug("  %sms: %s", q['time'], q['sql'])
+
+
+class JSONFileSink(object):
+    """Appends each profile to a file, as a line of JSON."""
+
+    def __init__(self, path=None):
+        self.path = path or INSTRUMENTATION_FILE
+
+    def emit(self, p):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(p.as_dict()) + '\n')
+
+
+class MemorySink(object):
+    """Keeps the most recent profiles (as dicts) in memory."""
+    profiles = deque(maxlen=1000)
+
+    def emit(self, p):
+        self.profiles.append(p.as_dict())
+
+
+def get_sink(path=None):
+    """Return an instance of the sink class at the given dotted path
+    (default: ``MONEYBAGS_INSTRUMENTATION_SINK``)."""
+    module_name, class_name = (path or INSTRUMENTATION_SINK).rsplit('.', 1)
+    return getattr(import_module(module_name), class_name)()
+
+
+class InstrumentationMiddleware(object):
+    """Profiles each request handled by a moneybags view. Only used if
+    ``MONEYBAGS_INSTRUMENTATION`` is on."""
+
+    def __init__(self):
+        if not INSTRUMENTATION:
+            raise MiddlewareNotUsed()
+        self.sink = get_sink()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if view_func.__module__.startswith('moneybags.'):
+            name = "{0}.{1}".format(view_func.__module__, view_func.__name__)
+            request._moneybags_profile = start_profile(name)
+
+    def process_response(self, request, response):
+        p = getattr(request, '_moneybags_profile', None)
+        if p is not None:
+            del request._moneybags_profile
+            finish_profile(p, self.sink)
+            response['X-Moneybags-Queries'] = str(p.num_queries)
+        return response
+
+
+def instrument_command(command_class):
+    """A class decorator for management commands, profiling each run of the
+    command if ``MONEYBAGS_INSTRUMENTATION`` is on."""
+    handle = command_class.handle
+    name = "command:" + command_class.__module__.rsplit('.', 1)[-1]
+
+    @wraps(handle)
+    def instrumented_handle(self, *args, **options):
+        if not INSTRUMENTATION:
+            return handle(self, *args, **options)
+        with profile(name, get_sink()):
+            return handle(self, *args, **options)
+
+    command_class.handle = instrumented_handle
+    return command_class
+
+
+@contextmanager
+def query_budget(budget, name='query budget'):
+    """Raise an ``AssertionError`` if the block runs more than ``budget``
+    queries. The error lists the queries that were run.
+
+    Queries made through the test ``Client`` are counted too, as the query
+    log isn't reset at the start of each request while this is active.
+
+    """
+    request_started.disconnect(reset_queries)
+    try:
+        with profile(name) as p:
+            yield p
+    finally:
+        request_started.connect(reset_queries)
+    if p.num_queries > budget:
+        queries = "\n".join(
+            "{0}. {1}".format(i, q['sql'])
+            for i, q in enumerate(p.queries, 1))
+        raise AssertionError(
+            "{0}: {1} queries run, but the budget is {2}:\n{3}".format(
+                name, p.num_queries, budget, queries))
+
+
+class QueryBudgetMixin(object):
+    """A ``TestCase`` mixin with an ``assertQueryBudget`` helper::
+
+        with self.assertQueryBudget(8):
+            self.client.get(url)
+
+    """
+
+    def assertQueryBudget(self, budget, name='query budget'):
+        return query_budget(budget, name)
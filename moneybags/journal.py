@@ -0,0 +1,124 @@
+"""
+Reading and compacting the change journal.
+
+Every create, update and delete of a Transaction or RecurringTransaction,
+including bulk ``update()``s, ``delete()``s and inserts, appends a
+``JournalEntry`` (see ``models.journal_changes``). Entries are numbered by
+an increasing sequence (their ``id``), so a consumer remembers the last
+sequence number it read in an Account and asks for the Account's changes
+after it with ``read_changes``. Appends to an Account are serialized (by
+locking its row), so its entries never become visible out of order, and
+one read past can't be missed. Entries of different Accounts aren't
+ordered with each other, so the journal is only read one Account at a
+time.
+
+The journal is kept small by ``compact_journal``, which merges old entries
+into one per Account, kind and (last) action, and ``prune_journal``, which
+drops entries older than the retention period. A consumer that hasn't read the
+journal within that period should sync from scratch.
+
+"""
+from collections import namedtuple
+
+from django.db.models import Max
+from django.db.transaction import commit_on_success
+
+from .models import JournalEntry, lock_accounts
+from .utils import chunked, iter_keyset_chunks, pack_ids
+
+Change = namedtuple('Change', [
+    'sequence', 'account_id', 'kind', 'action', 'object_id',
+])
+
+
+def read_changes(account, after=0, limit=1000):
+    """Return ``(changes, sequence)``: a list of the ``Change``s journaled
+    in ``account`` after the sequence number ``after``, oldest first, from
+    at most ``limit`` entries, and the sequence number to pass as ``after``
+    next time."""
+    entries = JournalEntry.objects.filter(account=account, id__gt=after)
+    changes = []
+    for entry in entries.order_by('id')[:limit]:
+        after = entry.pk
+        changes.extend(
+            Change(entry.pk, entry.account_id, entry.kind, entry.action, pk)
+            for pk in entry.get_object_ids())
+    return changes, after
+
+
+def _compact_account(entries):
+    """Merge a queryset of one Account's entries. Returns the number of
+    entries removed.
+
+    Each object's net change is its last journaled action (so an object
+    created and then updated is reported as updated; consumers treat an
+    update of an object they don't have as a create). The objects with the
+    same kind and last action are merged into one entry, which takes the
+    sequence number of the newest of their last entries: so a reader that
+    had read up to any sequence number still reads every change made after
+    it. These are all distinct sequence numbers of the removed entries,
+    since an entry has only one kind and action."""
+    last = {}  # (kind, object id) -> (sequence, action) of its last entry
+    sequences = []
+    newest = None
+    for chunk in iter_keyset_chunks(entries.order_by('id')):
+        for entry in chunk:
+            sequences.append(entry.pk)
+            newest = entry
+            for pk in entry.get_object_ids():
+                last[(entry.kind, pk)] = (entry.pk, entry.action)
+
+    merged = {}  # (kind, action) -> [sequence, object ids]
+    for (kind, pk), (sequence, action) in last.items():
+        group = merged.setdefault((kind, action), [sequence, []])
+        group[0] = max(group[0], sequence)
+        group[1].append(pk)
+    if len(merged) >= len(sequences):
+        return 0
+
+    for chunk in chunked(sequences):
+        JournalEntry.objects.filter(pk__in=chunk).delete()
+    JournalEntry.objects.bulk_create([
+        JournalEntry(pk=sequence, account_id=newest.account_id, kind=kind,
+                     action=action, object_ids=pack_ids(pks),
+                     created_on=newest.created_on)
+        for (kind, action), (sequence, pks) in sorted(merged.items())
+    ])
+    return len(sequences) - len(merged)
+
+
+def compact_journal(before, account=None, stdout=None):
+    """Merge each Account's entries written before ``before`` (a datetime)
+    into one entry per kind and action, holding each object's net change.
+    Each Account is compacted in its own database transaction. Returns the
+    number of entries removed."""
+    entries = JournalEntry.objects.filter(created_on__lt=before)
+    if account is not None:
+        entries = entries.filter(account=account)
+    account_ids = list(entries.order_by().values_list(
+        'account', flat=True).distinct())
+
+    removed = 0
+    for account_id in account_ids:
+        with commit_on_success():
+            # Wait for (and hold off) writers appending to the Account.
+            lock_accounts([account_id])
+            count = _compact_account(entries.filter(account=account_id))
+        removed += count
+        if stdout is not None and count:
+            stdout.write("Account {0}: merged {1} journal entries\n".format(
+                account_id, count))
+    return removed
+
+
+def prune_journal(before):
+    """Delete the entries written before ``before`` (a datetime), except
+    the newest entry, which is always kept so sequence numbers are never
+    reused. Returns the number of entries deleted."""
+    newest = JournalEntry.objects.aggregate(newest=Max('id'))['newest']
+    entries = JournalEntry.objects.filter(created_on__lt=before)
+    if newest is not None:
+        entries = entries.exclude(pk=newest)
+    count = entries.count()
+    entries.delete()
+    return count
@@ -0,0 +1,48 @@
+from datetime import timedelta
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from moneybags.instrumentation import instrument_command
+from moneybags.journal import compact_journal, prune_journal
+from moneybags.settings import JOURNAL_RETENTION_DAYS
+
+
+@instrument_command
+class Command(BaseCommand):
+    help = """Merge each Account's older change journal entries into one
+    entry per kind of object and action, and delete entries older than the
+    retention period. Run this from cron (e.g. daily).
+
+    Example Usage:
+
+        python manage.py compact_journal
+        python manage.py compact_journal --compact-days=1 --keep-days=30
+
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--compact-days',
+            action='store',
+            type='int',
+            dest='compact_days',
+            default=7,
+            help='Merge entries older than this many days.'),
+        make_option('--keep-days',
+            action='store',
+            type='int',
+            dest='keep_days',
+            default=JOURNAL_RETENTION_DAYS,
+            help='Delete entries older than this many days.'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        now = timezone.now()
+        merged = compact_journal(
+            now - timedelta(days=options['compact_days']),
+            stdout=self.stdout if verbosity > 1 else None)
+        deleted = prune_journal(now - timedelta(days=options['keep_days']))
+        if verbosity > 0:
+            self.stdout.write("Merged {0} and deleted {1} journal "
+                              "entries.\n".format(merged, deleted))
@@ -1,7 +1,53 @@
-from django.core.management.base import NoArgsCommand
-from moneybags.models import create_transactions_due_today
+from datetime import datetime
+from optparse import make_option
 
+from django.core.management.base import BaseCommand, CommandError
 
-class Command(NoArgsCommand):
-    def handle_noargs(self, **options):
-        create_transactions_due_today()
+from moneybags.instrumentation import instrument_command
+from moneybags.scheduler import create_due_transactions
+from moneybags.settings import SCHEDULER_BATCH_SIZE
+
+
+@instrument_command
+class Command(BaseCommand):
+    help = """Create Transactions for every RecurringTransaction that is
+    due, including any that were missed since this was last run. Run this
+    from cron (e.g. daily).
+
+    Example Usage:
+
+        python manage.py create_transactions
+        python manage.py create_transactions --date=2013-06-30
+
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--date',
+            action='store',
+            dest='date',
+            default=None,
+            help='Create Transactions due on or before this date '
+                 '(YYYY-MM-DD). Defaults to today.'),
+        make_option('--batch-size',
+            action='store',
+            type='int',
+            dest='batch_size',
+            default=SCHEDULER_BATCH_SIZE,
+            help='Number of RecurringTransactions to process at a time.'),
+    )
+
+    def handle(self, *args, **options):
+        today = None
+        if options.get('date'):
+            try:
+                today = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("Invalid date: {0}".format(options['date']))
+
+        verbosity = int(options.get('verbosity', 1))
+        created = create_due_transactions(
+            today=today,
+            batch_size=options.get('batch_size') or SCHEDULER_BATCH_SIZE,
+            stdout=self.stdout if verbosity > 1 else None
+        )
+        if verbosity > 0:
+            self.stdout.write("Created {0} transactions.\n".format(created))
@@ -0,0 +1,56 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from moneybags.detection import create_recurring_transactions, detect_recurring
+from moneybags.instrumentation import instrument_command
+from moneybags.models import Account
+
+
+@instrument_command
+class Command(BaseCommand):
+    args = "[<account_slug> ...]"
+    help = """Look for recurring series (paychecks, rent, subscriptions...)
+    in each Account's (or just the given Accounts') history, and list any
+    that don't have a RecurringTransaction yet. With --create, the
+    RecurringTransactions are created.
+
+    Example Usage:
+
+        python manage.py detect_recurring personal-checking
+        python manage.py detect_recurring --create --min-occurrences=4
+
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--create',
+            action='store_true',
+            dest='create',
+            default=False,
+            help='Create RecurringTransactions for the series found.'),
+        make_option('--min-occurrences',
+            action='store',
+            type='int',
+            dest='min_occurrences',
+            default=3,
+            help='The fewest Transactions that make a series.'),
+    )
+
+    def handle(self, *args, **options):
+        accounts = Account.objects.all()
+        if args:
+            accounts = accounts.filter(slug__in=args)
+
+        for account in accounts.iterator():
+            series = detect_recurring(account,
+                min_occurrences=options['min_occurrences'])
+            for s in series:
+                self.stdout.write(
+                    u"{0}: {1} ({2}) x{3}, last {4}, {5:.0%} regular\n".format(
+                        account.slug, s.description,
+                        s.frequency, s.occurrences, s.last_date,
+                        s.regularity))
+            if options['create'] and series:
+                rules = create_recurring_transactions(account, series)
+                self.stdout.write("{0}: created {1} recurring "
+                                  "transaction(s)\n".format(account.slug,
+                                                            len(rules)))
@@ -0,0 +1,101 @@
+from datetime import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from moneybags.benchmarks import (
+    BENCHMARK_USERNAME,
+    delete_ledger,
+    generate_ledger,
+)
+from moneybags.instrumentation import instrument_command
+
+
+@instrument_command
+class Command(BaseCommand):
+    help = """Fill the database with a synthetic ledger: Users, Accounts,
+    Transactions and RecurringTransactions with realistic payees, amounts
+    and dates. The same --seed (and --end) always generates the same data.
+    Use a scratch database!
+
+    Example Usage:
+
+        python manage.py generate_ledger --transactions=1000000
+        python manage.py generate_ledger --users=10 --accounts=3
+        python manage.py generate_ledger --delete
+
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--users',
+            action='store',
+            type='int',
+            dest='users',
+            default=1,
+            help='Number of Users to create.'),
+        make_option('--accounts',
+            action='store',
+            type='int',
+            dest='accounts',
+            default=1,
+            help='Number of Accounts to create for each User.'),
+        make_option('--transactions',
+            action='store',
+            type='int',
+            dest='transactions',
+            default=10000,
+            help='Number of Transactions to create in each Account.'),
+        make_option('--recurring',
+            action='store',
+            type='int',
+            dest='recurring',
+            default=8,
+            help='Number of RecurringTransactions in each Account.'),
+        make_option('--seed',
+            action='store',
+            type='int',
+            dest='seed',
+            default=0,
+            help='Seed for the random number generator.'),
+        make_option('--end',
+            action='store',
+            dest='end',
+            default=None,
+            help='The last day of the generated ledger (YYYY-MM-DD). '
+                 'Defaults to a fixed date, so runs are repeatable.'),
+        make_option('--username',
+            action='store',
+            dest='username',
+            default=BENCHMARK_USERNAME,
+            help='Prefix for the generated usernames.'),
+        make_option('--delete',
+            action='store_true',
+            dest='delete',
+            default=False,
+            help='Delete a previously generated ledger instead.'),
+    )
+
+    def handle(self, *args, **options):
+        username = options['username']
+        if options['delete']:
+            delete_ledger(username)
+            self.stdout.write("Deleted the ledger for {0}-*\n".format(
+                username))
+            return
+
+        end = None
+        if options.get('end'):
+            try:
+                end = datetime.strptime(options['end'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("Invalid date: {0}".format(options['end']))
+
+        generate_ledger(
+            users=options['users'],
+            accounts=options['accounts'],
+            transactions=options['transactions'],
+            recurring=options['recurring'],
+            seed=options['seed'],
+            end=end,
+            username=username,
+            stdout=self.stdout
+        )
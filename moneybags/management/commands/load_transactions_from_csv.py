@@ -1,18 +1,26 @@
+import os
+from optparse import make_option
+
 from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand, CommandError
 
+from moneybags.importers import import_files
+from moneybags.instrumentation import instrument_command
 from moneybags.models import Account
-from moneybags import utils
+from moneybags.settings import IMPORT_BATCH_SIZE
 
 User = get_user_model()
 
 
+@instrument_command
 class Command(BaseCommand):
-    args = "<username> <account_slug> <path_to_csv_file> [date_format]"
-    help = """This command will load transactions from a CSV file.
+    args = "<username> <account_slug> <path> [<path> ...] [date_format]"
+    help = """This command will load transactions from CSV files.
 
-    You must provide a username and an Account slug, and you may provide
-    and optional `date_format` that will be passed to `datetime.strptime`.
+    You must provide a username, an Account slug and one or more CSV files
+    or directories of CSV files, and you may provide and optional
+    `date_format` (or --date-format) that will be passed to
+    `datetime.strptime`.
 
     NOTE on dates:
         The default date format is "mm/dd/YYYY". If your CSV files use a
@@ -34,28 +42,65 @@ class Command(BaseCommand):
             ~/Desktop/business.csv
             "%b %d, %Y:
 
+    Or, for a directory of monthly statements:
+
+        python manage.py load_transactions_from_csv --workers=4
+            jdoe
+            personal-checking
+            /home/users/jdoe/statements/
+
+    Rows are streamed from the files and inserted in batches of
+    --batch-size rows. With --workers, rows are parsed in that many
+    processes while this one writes to the database; files are always
+    imported in the order given (directories in name order), so the result
+    is the same as a serial import. Invalid rows are skipped and summarized
+    at the end, along with the time spent in each stage.
+
     """
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+            action='store',
+            type='int',
+            dest='batch_size',
+            default=IMPORT_BATCH_SIZE,
+            help='Number of transactions to insert per batch.'),
+        make_option('--workers',
+            action='store',
+            type='int',
+            dest='workers',
+            default=1,
+            help='Number of processes used to parse rows.'),
+        make_option('--date-format',
+            action='store',
+            dest='date_format',
+            default=None,
+            help='The strptime format of the dates in the CSV files.'),
+    )
 
     def __init__(self, *args, **kwargs):
         """Initialize some attributes."""
         super(Command, self).__init__(*args, **kwargs)
         self.username = None
         self.account_slug = None
-        self.csv_file = None
+        self.csv_files = []
         self.date_format = None
 
     def _parse_args(self, args):
         """Unpack the arguments, storing values as attributes."""
-        if len(args) == 3:
-            self.username, self.account_slug, self.csv_file = args
-        elif len(args) == 4:
-            user, account, csv_file, date_format = args
-            self.username = user
-            self.account_slug = account
-            self.csv_file = csv_file
-            self.date_format = date_format
-        else:
+        if len(args) < 3:
             raise CommandError("Invalid arguments: {0}".format(args))
+        self.username, self.account_slug = args[:2]
+        self.csv_files = list(args[2:])
+
+        # A trailing date format (rather than a path) is still supported.
+        last = self.csv_files[-1]
+        if len(self.csv_files) > 1 and '%' in last and \
+                not os.path.exists(last):
+            self.date_format = self.csv_files.pop()
+
+        for path in self.csv_files:
+            if not os.path.exists(path):
+                raise CommandError("Could Not find file: '{0}'".format(path))
 
     def _get_user(self):
         try:
@@ -76,10 +121,14 @@ class Command(BaseCommand):
         self._parse_args(args)
         account = self._get_account()
 
-        transactions = utils.load_csv_data(self.csv_file)
-        if self.date_format is None:
-            args = (account, transactions)
-        else:
-            args = (account, transactions, self.date_format)
-        utils.create_transactions(*args, verbose=True)
+        kwargs = {
+            'batch_size': options.get('batch_size') or IMPORT_BATCH_SIZE,
+            'workers': options.get('workers') or 1,
+            'stdout': self.stdout,
+        }
+        date_format = options.get('date_format') or self.date_format
+        if date_format is not None:
+            kwargs['date_format_string'] = date_format
+
+        import_files(account, self.csv_files, **kwargs)
         self.stdout.write("\nDone!\n")
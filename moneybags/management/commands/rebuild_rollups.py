@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.transaction import commit_on_success
+
+from moneybags.instrumentation import instrument_command
+from moneybags.models import Account, rebuild_rollups
+
+
+@instrument_command
+class Command(BaseCommand):
+    args = "[<account_slug> ...]"
+    help = """Rebuild the monthly rollups for each Account (or just the
+    given Accounts) from its Transactions. Its balance checkpoints are
+    dropped, and added again when next needed.
+
+    Example Usage:
+
+        python manage.py rebuild_rollups
+        python manage.py rebuild_rollups personal-checking
+
+    """
+
+    def handle(self, *args, **options):
+        accounts = Account.objects.all()
+        if args:
+            accounts = accounts.filter(slug__in=args)
+
+        for account in accounts.iterator():
+            with commit_on_success():
+                months = rebuild_rollups(account)
+            self.stdout.write("{0} ({1}): {2} month(s)\n".format(
+                account.slug, account.pk, months))
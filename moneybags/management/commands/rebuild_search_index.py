@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.transaction import commit_on_success
+
+from moneybags.instrumentation import instrument_command
+from moneybags.models import Account, rebuild_search_index
+
+
+@instrument_command
+class Command(BaseCommand):
+    args = "[<account_slug> ...]"
+    help = """Rebuild the description search index for each Account (or
+    just the given Accounts) from its Transactions. This also drops any
+    descriptions that are no longer used, and fills in the payee keys used
+    to find similar Transactions and their recurring transactions.
+
+    Example Usage:
+
+        python manage.py rebuild_search_index
+        python manage.py rebuild_search_index personal-checking
+
+    """
+
+    def handle(self, *args, **options):
+        accounts = Account.objects.all()
+        if args:
+            accounts = accounts.filter(slug__in=args)
+
+        for account in accounts.iterator():
+            with commit_on_success():
+                descriptions = rebuild_search_index(account)
+            self.stdout.write("{0} ({1}): {2} description(s)\n".format(
+                account.slug, account.pk, descriptions))
@@ -0,0 +1,54 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from moneybags.instrumentation import instrument_command
+from moneybags.models import Account, Transaction
+
+
+@instrument_command
+class Command(BaseCommand):
+    args = "[<account_slug> ...]"
+    help = """Recompute the stored totals on each Account from its
+    Transactions and fix any that are out of date.
+
+    With --check, stale Accounts are only reported, and the command exits
+    with an error if any are found.
+
+    Example Usage:
+
+        python manage.py recompute_balances
+        python manage.py recompute_balances --check personal-checking
+
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--check',
+            action='store_true',
+            dest='check',
+            default=False,
+            help='Only report stale balances; do not fix them.'),
+    )
+
+    def handle(self, *args, **options):
+        check = options.get('check', False)
+        accounts = Account.objects.all()
+        if args:
+            accounts = accounts.filter(slug__in=args)
+        # Compute every Account's ledger totals in a single query
+        accounts = Transaction.objects.annotate_accounts(accounts)
+
+        stale = 0
+        for account in accounts.iterator():
+            old_balance = account.balance
+            if account.recompute_totals(commit=not check):
+                stale += 1
+                self.stdout.write("{0} ({1}): stored balance {2}\n".format(
+                    account.slug, account.pk, old_balance))
+
+        if check and stale:
+            raise CommandError("{0} stale balance(s) found".format(stale))
+        self.stdout.write("Checked {0} account(s), {1} {2}.\n".format(
+            accounts.count(),
+            stale,
+            "stale" if check else "fixed"
+        ))
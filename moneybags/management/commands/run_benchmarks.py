@@ -0,0 +1,103 @@
+import json
+from datetime import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from moneybags.benchmarks import compare_results, run_benchmarks
+from moneybags.instrumentation import instrument_command
+
+
+@instrument_command
+class Command(BaseCommand):
+    help = """Time get_balance, detail_account, transaction_report,
+    load_transactions_from_csv and create_transactions_due_today against
+    generated ledgers of each size. Use a scratch database!
+
+    Results (timings and query counts) are written as JSON with --output.
+    Given a --baseline file of earlier results, the command fails if any
+    median time has grown by more than --threshold.
+
+    Example Usage:
+
+        python manage.py run_benchmarks --sizes=1000,100000
+            --output=baseline.json
+        python manage.py run_benchmarks --sizes=1000,100000
+            --baseline=baseline.json --threshold=0.2
+
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--sizes',
+            action='store',
+            dest='sizes',
+            default='1000,10000',
+            help='Comma-separated numbers of Transactions to test with.'),
+        make_option('--repeat',
+            action='store',
+            type='int',
+            dest='repeat',
+            default=3,
+            help='Number of times to run each benchmark.'),
+        make_option('--seed',
+            action='store',
+            type='int',
+            dest='seed',
+            default=0,
+            help='Seed for the random number generator.'),
+        make_option('--end',
+            action='store',
+            dest='end',
+            default=None,
+            help='The last day of the generated ledger (YYYY-MM-DD). '
+                 'Defaults to a fixed date, so runs are repeatable.'),
+        make_option('--output',
+            action='store',
+            dest='output',
+            default=None,
+            help='Write the results to this JSON file.'),
+        make_option('--baseline',
+            action='store',
+            dest='baseline',
+            default=None,
+            help='Compare the results with this JSON file.'),
+        make_option('--threshold',
+            action='store',
+            type='float',
+            dest='threshold',
+            default=0.25,
+            help='Allowed slowdown, as a fraction of the baseline time.'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(s) for s in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError("Invalid sizes: {0}".format(options['sizes']))
+
+        end = None
+        if options.get('end'):
+            try:
+                end = datetime.strptime(options['end'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("Invalid date: {0}".format(options['end']))
+
+        results = run_benchmarks(sizes, repeat=options['repeat'],
+                                 seed=options['seed'], end=end,
+                                 stdout=self.stdout)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = compare_results(results, baseline,
+                                          options['threshold'])
+            for name, size, before, after in regressions:
+                self.stdout.write("REGRESSION {0} @ {1}: {2:.4f}s -> "
+                                  "{3:.4f}s\n".format(name, size, before,
+                                                      after))
+            if regressions:
+                raise CommandError("{0} benchmark(s) got slower".format(
+                    len(regressions)))
@@ -1,9 +1,22 @@
 import datetime
+from decimal import Decimal
 
 from django.contrib.auth import get_user_model
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import IntegrityError, connections, models, router
+from django.db.models import Avg, Count, F, Sum
+from django.db.models.query import QuerySet
+from django.db.transaction import (
+    commit_on_success,
+    commit_unless_managed,
+    is_managed,
+    savepoint,
+    savepoint_commit,
+    savepoint_rollback,
+)
 from django.template.defaultfilters import slugify
+from django.utils import six, timezone
+from django.utils.datastructures import SortedDict
 
 from .settings import (
     AMOUNT_DECIMAL_PLACES,
@@ -11,6 +24,15 @@ from .settings import (
     TRANSACTION_TYPE_DEBIT,
     TRANSACTION_TYPE_CREDIT,
 )
+from .recurrence import compile_rule
+from .utils import (
+    chunked,
+    normalize_description,
+    pack_ids,
+    payee_key,
+    unpack_ids,
+    url_builder,
+)
 
 User = get_user_model()
 
@@ -21,6 +43,31 @@ class Account(models.Model):
     slug = models.SlugField(max_length=255, db_index=True)
     owner = models.ForeignKey(User)
 
+    # Running totals, maintained by ``Transaction`` writes. See
+    # ``apply_ledger_changes`` and the ``recompute_balances`` command.
+    total_credits = models.DecimalField(max_digits=AMOUNT_MAX_DIGITS,
+        decimal_places=AMOUNT_DECIMAL_PLACES, default=0, editable=False,
+        help_text="Sum of all credits in this Account")
+    total_debits = models.DecimalField(max_digits=AMOUNT_MAX_DIGITS,
+        decimal_places=AMOUNT_DECIMAL_PLACES, default=0, editable=False,
+        help_text="Sum of all debits in this Account")
+    balance = models.DecimalField(max_digits=AMOUNT_MAX_DIGITS,
+        decimal_places=AMOUNT_DECIMAL_PLACES, default=0, editable=False,
+        help_text="Credits minus debits")
+    transaction_count = models.PositiveIntegerField(default=0,
+        editable=False, help_text="Number of Transactions in this Account")
+
+    # Bumped whenever this Account, or any of its Transactions or
+    # RecurringTransactions, are written. See ``touch_accounts``.
+    version = models.PositiveIntegerField(default=0, editable=False,
+        help_text="Changes whenever anything in this Account changes")
+    changed_on = models.DateTimeField(default=timezone.now, editable=False,
+        help_text="When anything in this Account last changed")
+
+    LEDGER_FIELDS = (
+        'total_credits', 'total_debits', 'balance', 'transaction_count'
+    )
+
     def __unicode__(self):
         return self.name
 
@@ -30,32 +77,732 @@ class Account(models.Model):
         verbose_name_plural = 'Accounts'
 
     def save(self, *args, **kwargs):
-        """ Generate the slug from the name """
+        """ Generate the slug from the name.
+
+        The stored totals and ``version`` are only ever changed with ``F()``
+        expressions, so an existing Account never writes its (possibly
+        stale) in-memory copy of them back to the database.
+        """
         self.slug = slugify(self.name)
+        self.__dict__.pop('_url_builders', None)
+        adding = self._state.adding
+        if not adding and 'update_fields' not in kwargs:
+            excluded = self.LEDGER_FIELDS + ('version', 'changed_on')
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.local_fields
+                if not f.primary_key and f.name not in excluded
+            ]
         super(Account, self).save(*args, **kwargs)
+        if not adding:
+            touch_accounts([self.pk])
 
     def get_absolute_url(self):
         return reverse('moneybags-detail-account', args=[self.slug])
 
+    def build_url(self, viewname, object_id):
+        """Return the URL for ``viewname`` with this Account's slug and the
+        given object id. The URL is only reversed once per view for each
+        Account instance, so listing many objects of one Account (see
+        ``attach_account``) doesn't call ``reverse()`` for every row."""
+        builders = self.__dict__.setdefault('_url_builders', {})
+        if viewname not in builders:
+            builders[viewname] = url_builder(viewname, self.slug)
+        return builders[viewname](object_id)
+
     def _get_debits(self):
-        """return the sum of all debits for this account"""
-        debits = self.transaction_set.filter(transaction_type=-1)
-        debits = debits.values_list('amount', flat=True)
-        return sum(list(debits))
+        """return the sum of all debits for this account, computed from the
+        ledger rather than the stored total"""
+        debits = self.transaction_set.filter(
+            transaction_type=TRANSACTION_TYPE_DEBIT)
+        return debits.aggregate(total=Sum('amount'))['total'] or 0
 
     def _get_credits(self):
-        """ return the sum of all credits for this account"""
-        credits = self.transaction_set.filter(transaction_type=1)
-        credits = credits.values_list('amount', flat=True)
-        return sum(list(credits))
+        """ return the sum of all credits for this account, computed from
+        the ledger rather than the stored total"""
+        credits = self.transaction_set.filter(
+            transaction_type=TRANSACTION_TYPE_CREDIT)
+        return credits.aggregate(total=Sum('amount'))['total'] or 0
 
     def get_balance(self):
-        credits = self._get_credits()
-        debits = self._get_debits()
-        return credits - debits
+        """Return the stored balance; this does not touch the ledger."""
+        return self.balance
+
+    def balance_as_of(self, as_of):
+        """Return the balance of the Transactions dated on or before
+        ``as_of``: the latest ``BalanceCheckpoint`` before it plus the
+        Transactions since, which are never more than a month's worth.
+        Missing checkpoints are added first (see ``update_checkpoints``)."""
+        checkpoint = self._checkpoint_before(as_of)
+        needed = _month_start(min(as_of, datetime.date.today()))
+        needed -= datetime.timedelta(days=1)
+        if checkpoint is None or checkpoint.date < needed:
+            if update_checkpoints(self):
+                checkpoint = self._checkpoint_before(as_of)
+
+        transactions = Transaction.objects.filter(account=self,
+                                                  date__lte=as_of)
+        balance = 0
+        if checkpoint is not None:
+            balance = checkpoint.balance
+            transactions = transactions.filter(date__gt=checkpoint.date)
+        for row in _ledger_totals(transactions):
+            if row['transaction_type'] == TRANSACTION_TYPE_CREDIT:
+                balance += row['total']
+            elif row['transaction_type'] == TRANSACTION_TYPE_DEBIT:
+                balance -= row['total']
+        return balance
+
+    def _checkpoint_before(self, as_of):
+        checkpoints = BalanceCheckpoint.objects.filter(account=self,
+            date__lte=as_of).order_by('-date')
+        checkpoints = list(checkpoints[:1])
+        return checkpoints[0] if checkpoints else None
+
+    def recompute_totals(self, commit=True):
+        """Recompute the stored totals from the ledger.
+
+        Returns True if the stored values were out of date. If ``commit`` is
+        False the stored values are only checked, not fixed.
+
+        """
+        if hasattr(self, 'ledger_credits'):
+            # Already annotated by ``Transaction.objects.annotate_accounts``
+            credits = _to_amount(self.ledger_credits)
+            debits = _to_amount(self.ledger_debits)
+            count = int(self.ledger_count)
+        else:
+            totals = Transaction.objects.totals(self)
+            credits, debits = totals['credits'], totals['debits']
+            count = totals['count']
+        stale = (credits != self.total_credits or
+                 debits != self.total_debits or
+                 credits - debits != self.balance or
+                 count != self.transaction_count)
+        if stale and commit:
+            Account.objects.filter(pk=self.pk).update(
+                total_credits=credits,
+                total_debits=debits,
+                balance=credits - debits,
+                transaction_count=count
+            )
+            self.total_credits = credits
+            self.total_debits = debits
+            self.balance = credits - debits
+            self.transaction_count = count
+        return stale
+
+
+class MonthlyRollupManager(models.Manager):
+
+    def yearly_totals(self, account):
+        """Return a list of ``(year, credits, debits, count)`` tuples for the
+        given Account, summed from its monthly rollups."""
+        years = SortedDict()
+        for rollup in self.filter(account=account):
+            credits, debits, count = years.get(rollup.month.year, (0, 0, 0))
+            years[rollup.month.year] = (credits + rollup.credits,
+                                        debits + rollup.debits,
+                                        count + rollup.count)
+        return [(year,) + totals for year, totals in years.items()]
+
+
+class MonthlyRollup(models.Model):
+    """Per-Account, per-month sums and counts of Transactions, split by type
+    and by pending status. These are kept up to date by every write to
+    ``Transaction`` (see ``apply_ledger_changes``) and can be rebuilt with
+    the ``rebuild_rollups`` command."""
+    account = models.ForeignKey(Account)
+    month = models.DateField(help_text="The first day of the month")
+
+    cleared_credits = models.DecimalField(max_digits=AMOUNT_MAX_DIGITS,
+        decimal_places=AMOUNT_DECIMAL_PLACES, default=0)
+    cleared_credit_count = models.IntegerField(default=0)
+    cleared_debits = models.DecimalField(max_digits=AMOUNT_MAX_DIGITS,
+        decimal_places=AMOUNT_DECIMAL_PLACES, default=0)
+    cleared_debit_count = models.IntegerField(default=0)
+    pending_credits = models.DecimalField(max_digits=AMOUNT_MAX_DIGITS,
+        decimal_places=AMOUNT_DECIMAL_PLACES, default=0)
+    pending_credit_count = models.IntegerField(default=0)
+    pending_debits = models.DecimalField(max_digits=AMOUNT_MAX_DIGITS,
+        decimal_places=AMOUNT_DECIMAL_PLACES, default=0)
+    pending_debit_count = models.IntegerField(default=0)
+
+    def __unicode__(self):
+        return u"{0}: {1:%B %Y}".format(self.account_id, self.month)
+
+    class Meta:
+        ordering = ['month']
+        unique_together = ['account', 'month']
+
+    objects = MonthlyRollupManager()
+
+    @staticmethod
+    def get_columns(transaction_type, pending):
+        """Return the names of the ``(sum, count)`` columns that Transactions
+        of the given type and pending status are added to, or None."""
+        if transaction_type == TRANSACTION_TYPE_CREDIT:
+            kind = 'credit'
+        elif transaction_type == TRANSACTION_TYPE_DEBIT:
+            kind = 'debit'
+        else:
+            return None
+        status = 'pending' if pending else 'cleared'
+        return ('{0}_{1}s'.format(status, kind),
+                '{0}_{1}_count'.format(status, kind))
+
+    @property
+    def credits(self):
+        return self.cleared_credits + self.pending_credits
+
+    @property
+    def debits(self):
+        return self.cleared_debits + self.pending_debits
+
+    @property
+    def net_change(self):
+        return self.credits - self.debits
+
+    @property
+    def count(self):
+        return (self.cleared_credit_count + self.cleared_debit_count +
+                self.pending_credit_count + self.pending_debit_count)
+
+
+class BalanceCheckpoint(models.Model):
+    """An Account's balance at the end of a month, including every
+    Transaction dated on or before ``date``. Checkpoints are only kept for
+    months that have ended; they're added from the ``MonthlyRollup``s by
+    ``update_checkpoints``, and any that a write changes are deleted (see
+    ``invalidate_checkpoints``)."""
+    account = models.ForeignKey(Account)
+    date = models.DateField(help_text="The last day of the month")
+    balance = models.DecimalField(max_digits=AMOUNT_MAX_DIGITS,
+        decimal_places=AMOUNT_DECIMAL_PLACES, default=0)
+    transaction_count = models.PositiveIntegerField(default=0)
+
+    def __unicode__(self):
+        return u"{0}: {1}".format(self.account_id, self.date)
+
+    class Meta:
+        ordering = ['date']
+        unique_together = ['account', 'date']
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month(month):
+    """The first day of the month after ``month`` (a first of the month)."""
+    return (month + datetime.timedelta(days=31)).replace(day=1)
+
+
+def update_checkpoints(account, today=None):
+    """Add an Account's missing ``BalanceCheckpoint``s, one for the end of
+    every month from its first ``MonthlyRollup`` up to the last month that
+    has ended, carrying on from its latest checkpoint. This is one query
+    for the latest checkpoint, one for the rollups after it, and one
+    insert. Returns the number of checkpoints added."""
+    until = _month_start(today or datetime.date.today())
+    latest = list(BalanceCheckpoint.objects.filter(
+        account=account).order_by('-date')[:1])
+    rollups = MonthlyRollup.objects.filter(account=account, month__lt=until)
+    balance = count = 0
+    month = None
+    if latest:
+        balance = latest[0].balance
+        count = latest[0].transaction_count
+        month = latest[0].date + datetime.timedelta(days=1)
+        if month >= until:
+            return 0
+        rollups = rollups.filter(month__gte=month)
+    rollups = dict((r.month, r) for r in rollups)
+    if month is None:
+        if not rollups:
+            return 0
+        month = min(rollups)
+
+    checkpoints = []
+    while month < until:
+        if month in rollups:
+            balance += rollups[month].net_change
+            count += rollups[month].count
+        checkpoints.append(BalanceCheckpoint(account_id=account.pk,
+            date=_next_month(month) - datetime.timedelta(days=1),
+            balance=balance, transaction_count=count))
+        month = _next_month(month)
+    sid = savepoint()
+    try:
+        BalanceCheckpoint.objects.bulk_create(checkpoints, batch_size=500)
+        savepoint_commit(sid)
+    except IntegrityError:
+        # Someone else added them first
+        savepoint_rollback(sid)
+        return 0
+    return len(checkpoints)
+
+
+def invalidate_checkpoints(rows):
+    """Delete the ``BalanceCheckpoint``s that the given ledger rows (see
+    ``apply_ledger_changes``) change: those on or after the earliest date
+    in each Account's rows. Checkpoints only exist for months that have
+    ended, so rows dated this month don't cost a query."""
+    this_month = _month_start(datetime.date.today())
+    earliest = {}
+    for row in rows:
+        if row['date'] < this_month:
+            day = earliest.get(row['account'])
+            if day is None or row['date'] < day:
+                earliest[row['account']] = row['date']
+    for account_id, day in earliest.items():
+        BalanceCheckpoint.objects.filter(account=account_id,
+                                         date__gte=day).delete()
+
+
+def rollup_rows(rows):
+    """Sum ledger rows into ``{(account_id, month): {column: value}}``."""
+    rollups = {}
+    for row in rows:
+        columns = MonthlyRollup.get_columns(row['transaction_type'],
+                                            row['pending'])
+        if columns is None:
+            continue
+        key = (row['account'], row['date'].replace(day=1))
+        values = rollups.setdefault(key, {})
+        for column, value in zip(columns, (row['total'], row['count'])):
+            values[column] = values.get(column, 0) + value
+    return rollups
+
+
+def _apply_rollup_changes(rows, sign=1):
+    """Add (or subtract) ledger rows to the ``MonthlyRollup`` rows, creating
+    any that don't exist yet. One query is issued per affected month."""
+    for (account_id, month), values in rollup_rows(rows).items():
+        values = dict((column, value * sign)
+                      for column, value in values.items() if value)
+        if not values:
+            continue
+        updates = dict((column, F(column) + value)
+                       for column, value in values.items())
+        rollups = MonthlyRollup.objects.filter(account=account_id, month=month)
+        if not rollups.update(**updates):
+            sid = savepoint()
+            try:
+                MonthlyRollup.objects.create(account_id=account_id,
+                                             month=month, **values)
+                savepoint_commit(sid)
+            except IntegrityError:
+                # Someone else created it first
+                savepoint_rollback(sid)
+                rollups.update(**updates)
+
+
+def rebuild_rollups(account):
+    """Replace an Account's ``MonthlyRollup``s with ones computed from its
+    Transactions, using one grouped query, and drop its ``BalanceCheckpoint``s
+    (they're added again when next needed). Returns the number of months."""
+    rows = _ledger_totals(Transaction.objects.filter(account=account))
+    rollups = [
+        MonthlyRollup(account_id=account_id, month=month, **values)
+        for (account_id, month), values in rollup_rows(rows).items()
+    ]
+    MonthlyRollup.objects.filter(account=account).delete()
+    MonthlyRollup.objects.bulk_create(rollups)
+    BalanceCheckpoint.objects.filter(account=account).delete()
+    return len(rollups)
+
+
+def touch_accounts(account_ids):
+    """Bump the ``version`` (and ``changed_on``) of the given Accounts, so
+    anything cached for them (see ``caching``) is no longer used."""
+    account_ids = list(set(account_ids))
+    now = timezone.now()
+    for chunk in chunked(account_ids):
+        Account.objects.filter(pk__in=chunk).update(
+            version=F('version') + 1, changed_on=now)
+
+
+def description_trigrams(description):
+    """Return the set of three-character substrings of a description, once
+    it's been lower-cased and its whitespace collapsed."""
+    text = normalize_description(description)
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+class DescriptionTrigram(models.Model):
+    """A trigram of one of the distinct Transaction descriptions in an
+    Account. Together these make an index that can find an Account's
+    descriptions by prefix, suffix, substring or word (see ``search``)."""
+    account = models.ForeignKey(Account)
+    trigram = models.CharField(max_length=3)
+    description = models.CharField(max_length=255)
+
+    def __unicode__(self):
+        return u"{0}: {1}".format(self.trigram, self.description)
+
+    class Meta:
+        unique_together = ['account', 'trigram', 'description']
+        index_together = [['account', 'description']]
+
+
+def index_descriptions(pairs):
+    """Add any of the given ``(account_id, description)`` pairs that aren't
+    already indexed to the ``DescriptionTrigram`` index. Already indexed
+    descriptions are found with one query per Account (per 500
+    descriptions), and the rest are inserted with ``bulk_create``."""
+    accounts = {}
+    for account_id, description in pairs:
+        if description_trigrams(description):
+            accounts.setdefault(account_id, set()).add(description)
+
+    for account_id, descriptions in accounts.items():
+        descriptions = list(descriptions)
+        indexed = set()
+        for chunk in chunked(descriptions):
+            indexed.update(DescriptionTrigram.objects.filter(
+                account=account_id, description__in=chunk
+            ).values_list('description', flat=True).distinct())
+
+        trigrams = [
+            DescriptionTrigram(account_id=account_id, trigram=trigram,
+                               description=description)
+            for description in descriptions if description not in indexed
+            for trigram in description_trigrams(description)
+        ]
+        sid = savepoint()
+        try:
+            DescriptionTrigram.objects.bulk_create(trigrams, batch_size=500)
+            savepoint_commit(sid)
+        except IntegrityError:
+            # Someone else indexed some of these first; add the rest singly.
+            savepoint_rollback(sid)
+            for trigram in trigrams:
+                sid = savepoint()
+                try:
+                    trigram.save()
+                    savepoint_commit(sid)
+                except IntegrityError:
+                    savepoint_rollback(sid)
+
+
+def rebuild_search_index(account):
+    """Replace an Account's ``DescriptionTrigram``s with ones for the
+    distinct descriptions of its Transactions (dropping any that are no
+    longer used), and fill in any stale ``payee_key``s (and
+    RecurringTransactions' ``desc_slug``s). Returns the number of distinct
+    descriptions."""
+    DescriptionTrigram.objects.filter(account=account).delete()
+    transactions = QuerySet(Transaction).filter(account=account)
+    descriptions = list(transactions.order_by().values_list(
+        'description', flat=True).distinct())
+    for chunk in chunked(descriptions, 5000):
+        index_descriptions((account.pk, d) for d in chunk)
+
+    # Only Transactions whose key is out of date are updated.
+    keys = transactions.order_by().values_list(
+        'description', 'payee_key').distinct()
+    for description, key in list(keys):
+        if key != payee_key(description):
+            transactions.filter(description=description).update(
+                payee_key=payee_key(description))
+
+    # A rule whose key is already taken by another rule is left alone.
+    rules = QuerySet(RecurringTransaction).filter(account=account)
+    taken = set(rules.values_list('desc_slug', flat=True))
+    for pk, description, slug in list(rules.values_list(
+            'pk', 'description', 'desc_slug')):
+        key = payee_key(description)
+        if key != slug and key not in taken:
+            rules.filter(pk=pk).update(desc_slug=key)
+            taken.add(key)
+    touch_accounts([account.pk])
+    return len(descriptions)
+
+
+def _to_amount(value):
+    """Coerce a raw database sum (which may be a float or an int on some
+    backends) into a Decimal with ``AMOUNT_DECIMAL_PLACES``."""
+    places = Decimal(10) ** -AMOUNT_DECIMAL_PLACES
+    return Decimal(str(value or 0)).quantize(places)
+
+
+# The values that ledger rows are grouped by.
+LEDGER_KEYS = ('account', 'transaction_type', 'pending', 'date')
+
+
+def _ledger_totals(queryset):
+    """Return the sum and count of ``amount`` for the given Transactions,
+    grouped by Account, type, pending status and date, as ``values()`` dicts
+    with ``account``, ``transaction_type``, ``pending``, ``date``, ``total``
+    and ``count`` keys. This is a single grouped query."""
+    rows = queryset.order_by().values(*LEDGER_KEYS)
+    return rows.annotate(total=Sum('amount'), count=Count('pk'))
+
+
+def ledger_rows(transactions):
+    """Return ledger rows (like those from ``_ledger_totals``) for in-memory
+    Transactions, e.g. ones about to be passed to ``bulk_create``, which
+    skips ``Transaction.save()``."""
+    totals = {}
+    for t in transactions:
+        key = (t.account_id, t.transaction_type, t.pending, t.date)
+        total, count = totals.get(key, (0, 0))
+        totals[key] = (total + t.amount, count + 1)
+    return [
+        dict(zip(LEDGER_KEYS, key), total=total, count=count)
+        for key, (total, count) in totals.items()
+    ]
+
+
+def apply_ledger_changes(rows, sign=1):
+    """Add (or, with ``sign=-1``, subtract) the given ledger rows to the
+    stored Account totals and to the ``MonthlyRollup``s, delete the
+    ``BalanceCheckpoint``s they change, and bump the Accounts' ``version``.
+    ``rows`` are dicts like those returned by ``_ledger_totals``. One
+    ``UPDATE`` is issued per affected Account, and one per month."""
+    rows = list(rows)
+    _apply_rollup_changes(rows, sign)
+    invalidate_checkpoints(rows)
+
+    changes = {}
+    for row in rows:
+        credits, debits, count = changes.get(row['account'], (0, 0, 0))
+        if row['transaction_type'] == TRANSACTION_TYPE_CREDIT:
+            credits += row['total'] * sign
+        elif row['transaction_type'] == TRANSACTION_TYPE_DEBIT:
+            debits += row['total'] * sign
+        count += row['count'] * sign
+        changes[row['account']] = (credits, debits, count)
+
+    now = timezone.now()
+    for account_id, (credits, debits, count) in changes.items():
+        Account.objects.filter(pk=account_id).update(
+            total_credits=F('total_credits') + credits,
+            total_debits=F('total_debits') + debits,
+            balance=F('balance') + (credits - debits),
+            transaction_count=F('transaction_count') + count,
+            version=F('version') + 1,
+            changed_on=now
+        )
+
+
+def in_transaction(func, *args, **kwargs):
+    """Call ``func`` in the current database transaction or, outside of
+    one, in a new one that's committed when it returns."""
+    if is_managed():
+        return func(*args, **kwargs)
+    with commit_on_success():
+        return func(*args, **kwargs)
+
+
+class JournalEntry(models.Model):
+    """An append-only record of the creates, updates or deletes of one kind
+    of object in an Account, by one write. The ``id`` is the entry's
+    sequence number, and ``object_ids`` holds the ids of the objects that
+    changed, packed into ranges (see ``utils.pack_ids``). See ``journal``
+    for reading and compacting the journal."""
+    TRANSACTION = 't'
+    RECURRING_TRANSACTION = 'r'
+    KIND_CHOICES = (
+        (TRANSACTION, 'Transaction'),
+        (RECURRING_TRANSACTION, 'Recurring Transaction'),
+    )
+    CREATE = 'c'
+    UPDATE = 'u'
+    DELETE = 'd'
+    ACTION_CHOICES = (
+        (CREATE, 'Create'),
+        (UPDATE, 'Update'),
+        (DELETE, 'Delete'),
+    )
+    account = models.ForeignKey(Account)
+    kind = models.CharField(max_length=1, choices=KIND_CHOICES)
+    action = models.CharField(max_length=1, choices=ACTION_CHOICES)
+    object_ids = models.TextField()
+    created_on = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __unicode__(self):
+        return u"{0}: {1} {2} {3}".format(self.pk, self.get_action_display(),
+            self.get_kind_display(), self.object_ids)
+
+    class Meta:
+        ordering = ['id']
+        index_together = [['account', 'id']]
+        verbose_name_plural = 'Journal entries'
+
+    def get_object_ids(self):
+        return unpack_ids(self.object_ids)
+
+
+def lock_accounts(account_ids):
+    """Lock the rows of the given Accounts (in id order, so two writers
+    can't deadlock) until the current database transaction ends."""
+    list(Account.objects.select_for_update().filter(
+        pk__in=sorted(set(account_ids))).order_by('pk').values_list('pk'))
+
+
+def _append_journal_entries(entries):
+    """Lock the entries' Accounts (see ``lock_accounts``) and insert
+    ``entries``."""
+    lock_accounts(entry.account_id for entry in entries)
+    JournalEntry.objects.bulk_create(entries)
+
+
+def journal_changes(kind, changes):
+    """Append ``JournalEntry``s for ``(account_id, action, object_id)``
+    changes to objects of one ``kind``: one entry per Account and action,
+    all inserted with a single query (after one to lock the Accounts).
+
+    Concurrent writers to an Account could otherwise commit ids out of
+    order, so that an entry appeared behind a reader of the Account's
+    journal that had already read past its id. The locks are held until
+    the write's database transaction commits; outside of one, the locks
+    and the insert are committed together. Writers to different Accounts
+    don't wait for each other, so ids are only committed in order within
+    each Account (see ``journal.read_changes``)."""
+    grouped = {}
+    for account_id, action, object_id in changes:
+        grouped.setdefault((account_id, action), []).append(object_id)
+    if not grouped:
+        return
+    now = timezone.now()
+    entries = [
+        JournalEntry(account_id=account_id, kind=kind, action=action,
+                     object_ids=pack_ids(ids), created_on=now)
+        for (account_id, action), ids in sorted(grouped.items())
+    ]
+    in_transaction(_append_journal_entries, entries)
+
+
+def updated_changes(pairs, account=None):
+    """Yield journal changes (see ``journal_changes``) for updates of
+    ``(account_id, object_id)`` pairs. If the objects were moved to
+    ``account`` (an Account or its id), they're journaled as deleted from
+    their old Account and created in the new one."""
+    account_id = getattr(account, 'pk', account)
+    for old_account_id, object_id in pairs:
+        if account_id is None or account_id == old_account_id:
+            yield (old_account_id, JournalEntry.UPDATE, object_id)
+        else:
+            yield (old_account_id, JournalEntry.DELETE, object_id)
+            yield (account_id, JournalEntry.CREATE, object_id)
+
+
+def journal_inserted_transactions(transactions):
+    """Journal the creation of Transactions just inserted with
+    ``bulk_create``, which doesn't set their ids, so they're found by their
+    ``fingerprint`` (one query per 500)."""
+    fingerprints = [t.fingerprint for t in transactions]
+    pairs = []
+    for chunk in chunked(fingerprints):
+        pairs.extend(Transaction.objects.filter(fingerprint__in=chunk
+            ).values_list('account', 'pk'))
+    journal_changes(JournalEntry.TRANSACTION, (
+        (account_id, JournalEntry.CREATE, pk) for account_id, pk in pairs))
+
+
+class TransactionQuerySet(QuerySet):
+    """A ``QuerySet`` whose bulk ``update()`` and ``delete()`` keep the
+    stored Account totals, monthly rollups, search index, versions and
+    journal correct, even though they skip ``Transaction.save()``."""
+
+    # Fields which contribute to an Account's totals or rollups.
+    LEDGER_FIELDS = (
+        'account', 'account_id', 'amount', 'transaction_type', 'pending',
+        'date',
+    )
+
+    # Fields which are copied to a recurring Transaction's
+    # RecurringTransaction.
+    RECURRING_FIELDS = (
+        'account', 'account_id', 'amount', 'transaction_type', 'date',
+        'description', 'recurring',
+    )
+
+    def _rows(self):
+        """The ``(account_id, pk)`` of each matching Transaction."""
+        return list(self.order_by().values_list('account', 'pk'))
+
+    def delete(self):
+        rows = self._rows()
+        totals = list(_ledger_totals(self))
+        super(TransactionQuerySet, self).delete()
+        apply_ledger_changes(totals, sign=-1)
+        journal_changes(JournalEntry.TRANSACTION, (
+            (account_id, JournalEntry.DELETE, pk) for account_id, pk in rows))
+    delete.alters_data = True
 
+    def update(self, sync_recurring=True, **kwargs):
+        """Update the matching Transactions, keeping everything derived from
+        them correct. With ``sync_recurring=False``, changes to recurring
+        Transactions aren't copied to RecurringTransactions (see
+        ``sync_recurring_transactions``), for callers that manage the rules
+        themselves."""
+        # Bulk updates show up in the API's changes feed too.
+        kwargs.setdefault('updated_on', timezone.now())
+        sync_recurring = sync_recurring and any(
+            f in kwargs for f in self.RECURRING_FIELDS)
 
-class TransactionManager(models.Manager):
+        # The filter may no longer match once updated, so remember the rows.
+        updated = self._rows()
+        pks = [pk for account_id, pk in updated]
+        accounts = set(account_id for account_id, pk in updated)
+        journal = updated_changes(updated,
+            kwargs.get('account', kwargs.get('account_id')))
+
+        description = kwargs.get('description')
+        if isinstance(description, six.string_types):
+            index_descriptions((a, description) for a in accounts)
+            kwargs['payee_key'] = payee_key(description)
+
+        if not any(f in kwargs for f in self.LEDGER_FIELDS):
+            rows = super(TransactionQuerySet, self).update(**kwargs)
+            if sync_recurring:
+                self._sync_recurring(pks)
+            journal_changes(JournalEntry.TRANSACTION, journal)
+            touch_accounts(accounts)
+            return rows
+
+        plain = QuerySet(self.model, using=self.db)
+        before = []
+        for chunk in chunked(pks):
+            before.extend(_ledger_totals(plain.filter(pk__in=chunk)))
+
+        rows = super(TransactionQuerySet, self).update(**kwargs)
+
+        if 'account' in kwargs or 'account_id' in kwargs:
+            # Moved Transactions need their descriptions indexed in their
+            # new Account.
+            for chunk in chunked(pks):
+                index_descriptions(plain.filter(pk__in=chunk).order_by(
+                    ).values_list('account', 'description').distinct())
+        if sync_recurring:
+            self._sync_recurring(pks)
+        apply_ledger_changes(before, sign=-1)
+        for chunk in chunked(pks):
+            apply_ledger_changes(_ledger_totals(plain.filter(pk__in=chunk)))
+        journal_changes(JournalEntry.TRANSACTION, journal)
+        return rows
+    update.alters_data = True
+
+    def _sync_recurring(self, pks):
+        """Update the RecurringTransactions of any of the given (just
+        updated) Transactions that are recurring. The caller bumps the
+        Accounts' ``version``."""
+        plain = QuerySet(self.model, using=self.db)
+        for chunk in chunked(pks):
+            sync_recurring_transactions(
+                plain.filter(pk__in=chunk, recurring=True), touch=False)
+
+
+class LedgerManager(models.Manager):
+    """Manager for Transactions that keeps Account totals in sync."""
+
+    def get_query_set(self):
+        return TransactionQuerySet(self.model, using=self._db)
+
+
+class TransactionManager(LedgerManager):
 
     def debits(self):
         return self.filter(transaction_type=-1)
@@ -63,8 +810,88 @@ class TransactionManager(models.Manager):
     def credits(self):
         return self.filter(transaction_type=1)
 
-    # TODO: put in aggregate functions here that accept account as input, and
-    #       give us the balance, total debits, total credits?
+    def totals(self, account=None):
+        """Return a dict containing the ``credits``, ``debits``,
+        ``balance`` and ``count`` of the given Account (or of every
+        Transaction, if no account is given). This is computed by the
+        database in a single grouped query."""
+        transactions = self.get_query_set()
+        if account is not None:
+            transactions = transactions.filter(account=account)
+
+        credits = debits = count = 0
+        for row in _ledger_totals(transactions):
+            if row['transaction_type'] == TRANSACTION_TYPE_CREDIT:
+                credits += row['total']
+            elif row['transaction_type'] == TRANSACTION_TYPE_DEBIT:
+                debits += row['total']
+            count += row['count']
+        return {'credits': credits, 'debits': debits,
+                'balance': credits - debits, 'count': count}
+
+    def balance(self, account):
+        return self.totals(account)['balance']
+
+    def summarize(self, transactions):
+        """Return the ``count``, ``total`` and ``average`` amount of the
+        given Transactions, computed by the database in one query."""
+        summary = transactions.order_by().aggregate(count=Count('pk'),
+            total=Sum('amount'), average=Avg('amount'))
+        summary['total'] = _to_amount(summary['total'])
+        summary['average'] = _to_amount(summary['average'])
+        return summary
+
+    def total_debits(self, account):
+        return self.totals(account)['debits']
+
+    def total_credits(self, account):
+        return self.totals(account)['credits']
+
+    def annotate_accounts(self, accounts):
+        """Annotate a queryset of Accounts with ``ledger_credits``,
+        ``ledger_debits``, ``ledger_balance`` and ``ledger_count``, computed
+        from each Account's Transactions with conditional aggregates. All of
+        the Accounts are fetched in one round trip.
+
+        Note that the annotated values are whatever the database returns for
+        a ``SUM`` (some backends return floats); see ``_to_amount``.
+
+        """
+        qn = connections[accounts.db].ops.quote_name
+        opts = self.model._meta
+        table = qn(opts.db_table)
+        sql = (
+            "SELECT COALESCE(SUM({case}), 0) FROM {table} "
+            "WHERE {table}.{account} = {accounts}.{pk}"
+        )
+        case = "CASE WHEN {table}.{type} = %s THEN {table}.{amount} ELSE 0 END"
+        signed = ("CASE WHEN {table}.{type} = %s THEN {table}.{amount} "
+                  "WHEN {table}.{type} = %s THEN -{table}.{amount} ELSE 0 END")
+        names = {
+            'table': table,
+            'account': qn(opts.get_field('account').column),
+            'type': qn(opts.get_field('transaction_type').column),
+            'amount': qn(opts.get_field('amount').column),
+            'accounts': qn(accounts.model._meta.db_table),
+            'pk': qn(accounts.model._meta.pk.column),
+        }
+
+        def subquery(expression):
+            return sql.format(case=expression.format(**names), **names)
+
+        return accounts.extra(
+            select=SortedDict([
+                ('ledger_credits', subquery(case)),
+                ('ledger_debits', subquery(case)),
+                ('ledger_balance', subquery(signed)),
+                ('ledger_count', subquery("1")),
+            ]),
+            select_params=(
+                TRANSACTION_TYPE_CREDIT,
+                TRANSACTION_TYPE_DEBIT,
+                TRANSACTION_TYPE_CREDIT, TRANSACTION_TYPE_DEBIT,
+            )
+        )
 
 
 class Transaction(models.Model):
@@ -80,9 +907,14 @@ class Transaction(models.Model):
         help_text="Optional: Check Number")
     description = models.CharField(max_length=255, db_index=True,
         help_text="Description for this Transaction")
+    payee_key = models.CharField(max_length=255, blank=True, editable=False,
+        help_text="The normalized payee; used to find similar Transactions")
     amount = models.DecimalField(max_digits=AMOUNT_MAX_DIGITS,
         decimal_places=AMOUNT_DECIMAL_PLACES,
         help_text="Amount of this Transaction")
+    fingerprint = models.CharField(max_length=40, unique=True, null=True,
+        blank=True, editable=False,
+        help_text="Identifies an imported row, so it's only imported once")
     recurring = models.BooleanField(blank=True, default=False, db_index=True,
         help_text="Is this a Recurring Transaction")
     pending = models.BooleanField(blank=True, default=True, db_index=True,
@@ -99,61 +931,138 @@ class Transaction(models.Model):
         )
 
     class Meta:
-        ordering = ['-date', 'check_no', 'description']
+        ordering = ['-date', 'check_no', 'description', 'id']
+        index_together = [['account', 'description'],
+                          ['account', 'payee_key']]
         verbose_name = 'Transaction'
         verbose_name_plural = 'Transaction'
 
+    def __init__(self, *args, **kwargs):
+        super(Transaction, self).__init__(*args, **kwargs)
+        self._loaded = self._get_field_values()
+
     def get_absolute_url(self):
-        args = [self.account.slug, self.id]
-        return reverse('moneybags-detail-transaction', args=args)
+        return self.account.build_url('moneybags-detail-transaction', self.id)
 
     def get_recurring_transaction_url(self):
-        args = [self.account.slug, self.id]
-        return reverse('moneybags-recurring-transaction', args=args)
+        return self.account.build_url('moneybags-recurring-transaction',
+                                      self.id)
 
     def save(self, *args, **kwargs):
         """
         Before saving an object, we set the sign of the amount based on the
         transaction type. We then create or update a RecurringTransaction
-        if neccessary.
+        if neccessary (see ``sync_recurring_transactions``), and update the
+        stored totals on the Account and the description search index.
+
+        The stored row is locked and read first, in the same database
+        transaction, so the totals are adjusted by what's actually stored
+        even if it was changed (e.g. by a bulk ``update()``) after this
+        Transaction was loaded. Fields that haven't been changed since then
+        are refreshed from it rather than written back, and a Transaction
+        with no changes at all isn't saved again.
         """
+        in_transaction(self._save, *args, **kwargs)
+
+    def _save(self, *args, **kwargs):
+        stored = self._get_stored_values()
+        if stored is not None and not self._state.adding:
+            changed = [f for f, value in self._loaded.items()
+                       if self.__dict__.get(f) != value]
+            if not changed and not kwargs:
+                return
+            for field in self._meta.fields:
+                name = field.attname
+                if name in self._loaded and name not in changed:
+                    if field.rel and stored[name] != self.__dict__[name]:
+                        self.__dict__.pop(field.get_cache_name(), None)
+                    setattr(self, name, stored[name])
+        old_state = self._get_ledger_state(stored)
+
+        self.payee_key = payee_key(self.description)
         super(Transaction, self).save(*args, **kwargs)
-        self._create_or_update_recurring_transaction()
+        if stored is None:
+            journal = [(self.account_id, JournalEntry.CREATE, self.pk)]
+        else:
+            journal = updated_changes([(stored['account_id'], self.pk)],
+                                      self.account_id)
+        journal_changes(JournalEntry.TRANSACTION, journal)
+        if self.recurring:
+            sync_recurring_transactions([self], touch=False)
 
-    def _create_or_update_recurring_transaction(self):
-        """
-        If this transaction is recurring, this method will fetch the
-        corresponding ``RecurringTransaction`` object, if it exists. If the
-        ``RecurringTrasaction`` object does not exist, it will be created.
+        new_state = (self._get_ledger_state(self.__dict__) or
+                     self._get_ledger_state(self._get_stored_values()))
+        if old_state != new_state:
+            if old_state is not None:
+                apply_ledger_changes([old_state], sign=-1)
+            apply_ledger_changes([new_state])
+        else:
+            touch_accounts([self.account_id])
 
-        In either case, the ``RecurringTransaction`` instance is updated with
-        values from this ``Transaction``.
+        if stored is None or (stored['account_id'], stored['description']) \
+                != (self.account_id, self.description):
+            index_descriptions([(self.account_id, self.description)])
+        self._loaded = self._get_field_values()
 
-        This method returns a tuple containing 2 objects:
+    def delete(self, *args, **kwargs):
+        """Delete this Transaction and remove what's stored for it (which is
+        locked and read first, as in ``save``) from the Account totals."""
+        in_transaction(self._delete, *args, **kwargs)
 
-        1. An instance of ``RecurringTransaction``
-        2. A boolean value indicating whether or not the object was created
-        """
-        if self.recurring:
-            desc_slug = slugify(self.description)
-            try:
-                rt = RecurringTransaction.objects.get(
-                    desc_slug=desc_slug,
-                    account=self.account,
-                    transaction_type=self.transaction_type
-                )
-            except RecurringTransaction.DoesNotExist:
-                rt = RecurringTransaction(
-                    desc_slug=desc_slug,
-                    account=self.account,
-                    transaction_type=self.transaction_type
-                )
-                rt.frequency_start_date = self.date
-
-            rt.description = self.description
-            rt.amount = self.amount
-            rt.last_transaction_date = self.date
-            rt.save()
+    def _delete(self, *args, **kwargs):
+        state = self._get_ledger_state(self._get_stored_values())
+        account_id = state['account'] if state else self.account_id
+        journal = [(account_id, JournalEntry.DELETE, self.pk)]
+        super(Transaction, self).delete(*args, **kwargs)
+        journal_changes(JournalEntry.TRANSACTION, journal)
+        if state is not None:
+            apply_ledger_changes([state], sign=-1)
+        else:
+            touch_accounts([account_id])
+        self._loaded = None
+
+    def _get_field_values(self):
+        """The (non-deferred) field values of this Transaction, keyed by
+        ``attname``, or ``None`` if it hasn't been saved."""
+        if self.pk is None:
+            return None
+        return dict((f.attname, self.__dict__[f.attname])
+                    for f in self._meta.fields if f.attname in self.__dict__)
+
+    def _get_stored_values(self):
+        """Like ``_get_field_values`` but read from the database, locking
+        the row until the current database transaction ends. ``None`` if
+        there's no row."""
+        if self.pk is None:
+            return None
+        fields = self._meta.fields
+        rows = Transaction.objects.select_for_update().filter(
+            pk=self.pk).values(*[f.name for f in fields])
+        for row in rows:
+            return dict((f.attname, row[f.name]) for f in fields)
+        return None
+
+    def _get_ledger_state(self, values):
+        """Return the contribution to an Account's totals of a Transaction
+        with the given field ``values`` (see ``_get_field_values``) as a
+        ledger row (see ``apply_ledger_changes``), or ``None`` if ``values``
+        is ``None`` or the ledger fields are missing."""
+        if values is None or values.get('id') is None:
+            return None
+        fields = ('account_id', 'transaction_type', 'pending', 'date',
+                  'amount')
+        values = [values.get(f) for f in fields]
+        if None in values:
+            return None
+        account_id, transaction_type, pending, date, amount = values
+        return {
+            'account': account_id,
+            'transaction_type': int(transaction_type),
+            'pending': bool(pending),
+            'date': self._meta.get_field('date').to_python(date),
+            'total': self._meta.get_field('amount').to_python(amount),
+            'count': 1,
+        }
 
     def is_credit(self):
         return self.transaction_type > 0
@@ -162,46 +1071,78 @@ class Transaction(models.Model):
         return abs(self.amount)
 
     def get_recurring_transaction(self):
-        rt = None
-        if self.recurring:
-            try:
-                rt = RecurringTransaction.objects.get(
-                    desc_slug=slugify(self.description),
-                    account=self.account,
-                    transaction_type=self.transaction_type
-                )
-            except RecurringTransaction.DoesNotExist:
-                # Ugh... create it?
-                rt = RecurringTransaction(
-                    desc_slug=slugify(self.description),
-                    account=self.account,
-                    transaction_type=self.transaction_type
-                )
-                rt.description = self.description
-                rt.amount = self.amount
-                rt.last_transaction_date = self.date
-                rt.frequency_start_date = self.date
-                rt.save()
-
-        return rt
+        """Return this recurring Transaction's ``RecurringTransaction``
+        (creating it if it's missing), or None if it isn't recurring."""
+        if not self.recurring:
+            return None
+        rules = RecurringTransaction.objects.filter(account=self.account_id,
+            desc_slug=payee_key(self.description))
+        rule = list(rules[:1])
+        if not rule:
+            sync_recurring_transactions([self])
+            rule = list(rules[:1])
+        return rule[0]
 
     def get_similar_transactions(self):
+        """Other Transactions of the same type with the same payee (see
+        ``utils.payee_key``) in this Account."""
         transactions = Transaction.objects.filter(
-            description=self.description,
             transaction_type=self.transaction_type,
-            account=self.account
+            account=self.account_id
         )
+        if self.payee_key:
+            transactions = transactions.filter(payee_key=self.payee_key)
+        else:  # Not filled in yet; see ``rebuild_search_index``
+            transactions = transactions.filter(description=self.description)
         transactions = transactions.exclude(id=self.id)
         return transactions
 
-    admin_objects = models.Manager()
+    admin_objects = LedgerManager()
     objects = TransactionManager()
 
 
+class RecurringTransactionQuerySet(QuerySet):
+    """A ``QuerySet`` whose bulk ``update()`` and ``delete()`` bump the
+    ``version`` of the affected Accounts, and are journaled."""
+
+    def _rows(self):
+        """The ``(account_id, pk)`` of each matching RecurringTransaction."""
+        return list(self.order_by().values_list('account', 'pk'))
+
+    def delete(self):
+        rows = self._rows()
+        super(RecurringTransactionQuerySet, self).delete()
+        journal_changes(JournalEntry.RECURRING_TRANSACTION, (
+            (account_id, JournalEntry.DELETE, pk) for account_id, pk in rows))
+        touch_accounts(account_id for account_id, pk in rows)
+    delete.alters_data = True
+
+    def update(self, **kwargs):
+        kwargs.setdefault('updated_on', timezone.now())
+        updated = self._rows()
+        rows = super(RecurringTransactionQuerySet, self).update(**kwargs)
+        journal_changes(JournalEntry.RECURRING_TRANSACTION, updated_changes(
+            updated, kwargs.get('account', kwargs.get('account_id'))))
+        touch_accounts(account_id for account_id, pk in updated)
+        return rows
+    update.alters_data = True
+
+
 class RecurringTransactionManager(models.Manager):
+    def get_query_set(self):
+        return RecurringTransactionQuerySet(self.model, using=self._db)
+
     def due_today(self):
         return self.filter(due_date=datetime.date.today())
 
+    def due(self, today=None):
+        """Everything that's due, including anything that was missed. A rule
+        without a frequency is only due once: not once its Transaction has
+        been created (its ``last_transaction_date`` has reached its
+        ``due_date``), even if that Transaction is later deleted."""
+        return self.filter(due_date__lte=today or datetime.date.today(
+            )).exclude(frequency='', last_transaction_date__gte=F('due_date'))
+
 
 class RecurringTransaction(models.Model):
     """This model provides a way to track recurring transactions. Note
@@ -223,7 +1164,7 @@ class RecurringTransaction(models.Model):
     description = models.CharField(max_length=255,
         help_text="This should match the description from the Transaction")
     desc_slug = models.SlugField(max_length=255,
-        help_text="A sluggified version of the description")
+        help_text="The payee key of the description (see utils.payee_key)")
     amount = models.DecimalField(max_digits=AMOUNT_MAX_DIGITS,
         decimal_places=AMOUNT_DECIMAL_PLACES,
         help_text="Amount to be paid")
@@ -259,15 +1200,28 @@ class RecurringTransaction(models.Model):
         return self.account.get_absolute_url()
 
     def get_edit_url(self):
-        args = [self.account.slug, self.id]
-        return reverse('moneybags-update-recurring-transaction', args=args)
+        return self.account.build_url(
+            'moneybags-update-recurring-transaction', self.id)
 
     def save(self, *args, **kwargs):
-        """Just ``slugify`` the Description."""
-        self.desc_slug = slugify(self.description)
-        self.due_date = self.get_due_date() or self.frequency_start_date or \
-            self.last_transaction_date
+        """Key the rule by its description's payee (see ``utils.payee_key``),
+        as its Transactions and detected series are."""
+        self.desc_slug = payee_key(self.description)
+        self.set_due_date()
+        action = JournalEntry.UPDATE
+        if self.pk is None:
+            action = JournalEntry.CREATE
         super(RecurringTransaction, self).save(*args, **kwargs)
+        journal_changes(JournalEntry.RECURRING_TRANSACTION,
+                        [(self.account_id, action, self.pk)])
+        touch_accounts([self.account_id])
+
+    def delete(self, *args, **kwargs):
+        account_id = self.account_id
+        journal = [(account_id, JournalEntry.DELETE, self.pk)]
+        super(RecurringTransaction, self).delete(*args, **kwargs)
+        journal_changes(JournalEntry.RECURRING_TRANSACTION, journal)
+        touch_accounts([account_id])
 
     def get_type(self):
         """credit if amount > 0, debit otherwise """
@@ -277,45 +1231,185 @@ class RecurringTransaction(models.Model):
 
     def get_due_date(self):
         """ Calculate the due date for this recurring transaction """
-        new_date = None
         prev_date = max(self.frequency_start_date, self.last_transaction_date)
-        if self.frequency == 'd':
-            new_date = prev_date + datetime.timedelta(days=1)
-        elif self.frequency == 'w':
-            new_date = prev_date + datetime.timedelta(days=7)
-        elif self.frequency == 'b':
-            new_date = prev_date + datetime.timedelta(days=14)
-        elif self.frequency == 'm':
-            new_date = prev_date + datetime.timedelta(365 / 12)
-        elif self.frequency == 'y':
-            new_date = prev_date + datetime.timedelta(days=365)
-        elif self.frequency == 'q':
-            new_date = prev_date + datetime.timedelta(days=90)
-
-        return new_date
+        return self.get_next_date(prev_date)
+
+    def set_due_date(self):
+        """ Set ``due_date`` from the frequency and the last transaction (or
+        to the start date, if there's no frequency)."""
+        self.due_date = self.get_due_date() or self.frequency_start_date or \
+            self.last_transaction_date
+
+    def get_recurrence(self):
+        """ Return the (cached) calendar rule for this recurring transaction,
+        anchored on ``frequency_start_date``, or None if there's no
+        frequency. See ``moneybags.recurrence``."""
+        return compile_rule(self.frequency, self.frequency_start_date)
+
+    def get_next_date(self, prev_date):
+        """ Return the first occurrence after ``prev_date``, or None if
+        there's no frequency."""
+        rule = self.get_recurrence()
+        if rule is None:
+            return None
+        return rule.next_after(prev_date)
+
+    def get_occurrences(self, start, end):
+        """ Return every occurrence from ``start`` to ``end``, inclusive."""
+        rule = self.get_recurrence()
+        if rule is None:
+            return []
+        return rule.between(start, end)
+
+    def get_next_occurrences(self, count, after=None):
+        """ Return the next ``count`` occurrences after ``after`` (by
+        default, after the last transaction)."""
+        rule = self.get_recurrence()
+        if rule is None:
+            return []
+        if after is None:
+            after = max(self.frequency_start_date, self.last_transaction_date)
+        return rule.next_n(after, count)
 
     objects = RecurringTransactionManager()
 
 
+def attach_account(objects, account):
+    """Set the ``account`` of each of the given Transactions (or
+    RecurringTransactions) to an Account instance that's already loaded,
+    so rendering them (e.g. ``get_absolute_url``) doesn't query for it
+    again. Returns the objects, as a list."""
+    objects = list(objects)
+    for obj in objects:
+        obj.account = account
+    return objects
+
+
+def _bulk_update(objects, fields):
+    """Write ``fields`` of each of the given (saved) objects, which must all
+    be of one model, with one ``UPDATE ... SET field = CASE pk WHEN ...``
+    query per chunk of objects, rather than one per object."""
+    objects = list(objects)
+    if not objects:
+        return
+    model = type(objects[0])
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    opts = model._meta
+    pk_column = qn(opts.pk.column)
+    fields = [opts.get_field(name) for name in fields]
+    # Stay under SQLite's limit of 999 parameters per query.
+    chunk_size = max(1, 900 // (2 * len(fields) + 1))
+
+    cursor = connection.cursor()
+    for chunk in chunked(objects, chunk_size):
+        assignments = []
+        params = []
+        for field in fields:
+            case = u"CASE {0} {1} END".format(
+                pk_column, u" ".join([u"WHEN %s THEN %s"] * len(chunk)))
+            if connection.vendor == 'postgresql':
+                # Parameters such as dates are sent as strings, which
+                # PostgreSQL won't put in a typed column without a cast.
+                case = u"CAST({0} AS {1})".format(
+                    case, field.db_type(connection))
+            assignments.append(u"{0} = {1}".format(qn(field.column), case))
+            for obj in chunk:
+                params.append(obj.pk)
+                params.append(field.get_db_prep_save(
+                    field.pre_save(obj, False), connection=connection))
+        params.extend(obj.pk for obj in chunk)
+        cursor.execute(u"UPDATE {0} SET {1} WHERE {2} IN ({3})".format(
+            qn(opts.db_table), u", ".join(assignments), pk_column,
+            u", ".join([u"%s"] * len(chunk))), params)
+    commit_unless_managed(using=using)
+
+
+def sync_recurring_transactions(transactions, touch=True):
+    """Create or update the ``RecurringTransaction`` for each of the given
+    Transactions that are recurring (others are ignored).
+
+    Transactions are grouped by Account and payee (see ``utils.payee_key``;
+    rules' ``desc_slug`` is the same key), and each group's
+    rule takes its description, amount, type and last transaction date
+    from the group's latest Transaction (and a new rule its start date
+    from the earliest). An existing rule is never moved
+    back to an earlier date. This takes a constant number of queries
+    however many Transactions there are (per 500 descriptions): one to
+    find the existing rules, a ``bulk_create`` for the new ones, an
+    ``UPDATE`` for the rest, two to journal them, and one to bump the
+    Accounts' ``version``, unless ``touch`` is False.
+
+    Returns the rules that were created or updated. (New rules are
+    inserted with ``bulk_create``, so they don't have a ``pk``.)
+
+    """
+    date_field = Transaction._meta.get_field('date')
+    latest = {}
+    first = {}
+    for t in transactions:
+        if not t.recurring:
+            continue
+        key = (t.account_id, payee_key(t.description))
+        day = date_field.to_python(t.date)
+        if key not in latest or day >= latest[key][0]:
+            latest[key] = (day, t)
+        first[key] = min(day, first.get(key, day))
+    if not latest:
+        return []
+
+    existing = {}
+    accounts = set(account_id for account_id, slug in latest)
+    slugs = list(set(slug for account_id, slug in latest))
+    for chunk in chunked(slugs):
+        for rule in RecurringTransaction.objects.filter(
+                account__in=accounts, desc_slug__in=chunk):
+            existing[(rule.account_id, rule.desc_slug)] = rule
+
+    created = []
+    updated = []
+    for (account_id, slug), (day, t) in latest.items():
+        rule = existing.get((account_id, slug))
+        if rule is None:
+            rule = RecurringTransaction(account_id=account_id,
+                desc_slug=slug,
+                frequency_start_date=first[(account_id, slug)])
+            created.append(rule)
+        elif day < rule.last_transaction_date:
+            continue
+        else:
+            updated.append(rule)
+        rule.description = t.description
+        rule.amount = t.amount
+        rule.transaction_type = t.transaction_type
+        rule.last_transaction_date = day
+        rule.set_due_date()
+
+    RecurringTransaction.objects.bulk_create(created)
+    _bulk_update(updated, ['description', 'amount', 'transaction_type',
+                           'last_transaction_date', 'due_date', 'updated_on'])
+
+    # ``bulk_create`` doesn't set ids; find the new rules' to journal them.
+    journal = [(r.account_id, JournalEntry.UPDATE, r.pk) for r in updated]
+    new_keys = set((r.account_id, r.desc_slug) for r in created)
+    new_slugs = list(set(r.desc_slug for r in created))
+    for chunk in chunked(new_slugs):
+        rows = RecurringTransaction.objects.filter(account__in=accounts,
+            desc_slug__in=chunk).values_list('account', 'desc_slug', 'pk')
+        journal.extend((account_id, JournalEntry.CREATE, pk)
+                       for account_id, slug, pk in rows
+                       if (account_id, slug) in new_keys)
+    journal_changes(JournalEntry.RECURRING_TRANSACTION, journal)
+    if touch:
+        touch_accounts(accounts)
+    return created + updated
+
+
 def create_transactions_due_today():
     """Create ``Transaction`` objects for all of the ``RecurringTransaction``'s
-    that are due today. This should be run as a a scheduled task.
+    that are due (including any that were missed). This should be run as a
+    a scheduled task. See ``scheduler.create_due_transactions``.
     """
-    for rt in RecurringTransaction.objects.due_today():
-        # Make sure it doesn't already exist!
-        transactions = Transaction.objects.filter(
-            date=rt.due_date,
-            description=rt.description,
-            amount=rt.amount,
-            recurring=True,
-            account=rt.account,
-            transaction_type=rt.transaction_type
-        )
-        if transactions.count() == 0:
-            new_trans = Transaction(date=rt.due_date, account=rt.account)
-            new_trans.description = rt.description
-            new_trans.amount = rt.amount
-            new_trans.recurring = True
-            new_trans.pending = True
-            new_trans.transaction_type = rt.transaction_type
-            new_trans.save()
+    from .scheduler import create_due_transactions
+    return create_due_transactions()
@@ -0,0 +1,132 @@
+"""
+Calendar-correct recurrence rules.
+
+A rule is a frequency (see ``RecurringTransaction.FREQUENCY_CHOICES``) and an
+anchor date; its occurrences are the anchor plus a whole number of steps.
+Daily, weekly and bi-weekly rules step by days. Monthly, quarterly and yearly
+rules step by calendar months from the anchor, keeping the anchor's day of
+the month, clamped to the end of shorter months (so a rule anchored on Jan 31
+falls on Feb 28, or Feb 29 in leap years, and then on Mar 31). Because every
+occurrence is computed from the anchor, rather than from the previous one,
+dates never drift.
+
+Occurrences are computed with integer arithmetic over day ordinals or month
+indexes, so enumerating years of occurrences for many rules is cheap.
+Compiled rules are cached.
+
+"""
+from calendar import monthrange
+from datetime import date, timedelta
+
+DAY_STEPS = {'d': 1, 'w': 7, 'b': 14}
+MONTH_STEPS = {'m': 1, 'q': 3, 'y': 12}
+
+_ONE_DAY = timedelta(days=1)
+
+# Compiled rules, keyed by (frequency, anchor).
+_cache = {}
+CACHE_SIZE = 10000
+
+
+class DayRecurrence(object):
+    """Occurrences every ``step`` days from ``anchor``."""
+
+    def __init__(self, anchor, step):
+        self.anchor = anchor
+        self.step = step
+        self._origin = anchor.toordinal()
+
+    def occurrence(self, index):
+        """Return the ``index``'th occurrence (the anchor is the 0th)."""
+        return date.fromordinal(self._origin + index * self.step)
+
+    def index_after(self, day):
+        """The index of the first occurrence after ``day``."""
+        offset = day.toordinal() - self._origin
+        if offset < 0:
+            return 0
+        return offset // self.step + 1
+
+    def between(self, start, end):
+        """Every occurrence from ``start`` to ``end``, inclusive."""
+        first = self.index_after(start - _ONE_DAY)
+        ordinals = range(self._origin + first * self.step,
+                         end.toordinal() + 1, self.step)
+        return [date.fromordinal(o) for o in ordinals]
+
+    def next_after(self, day):
+        return self.occurrence(self.index_after(day))
+
+    def next_n(self, day, count):
+        """The next ``count`` occurrences after ``day``."""
+        first = self.index_after(day)
+        return [self.occurrence(i) for i in range(first, first + count)]
+
+
+class MonthRecurrence(DayRecurrence):
+    """Occurrences every ``step`` calendar months from ``anchor``."""
+
+    def __init__(self, anchor, step):
+        self.anchor = anchor
+        self.step = step
+        self._origin = anchor.year * 12 + anchor.month - 1
+
+    def occurrence(self, index):
+        year, month = divmod(self._origin + index * self.step, 12)
+        month += 1
+        day = min(self.anchor.day, monthrange(year, month)[1])
+        return date(year, month, day)
+
+    def index_after(self, day):
+        months = day.year * 12 + day.month - 1 - self._origin
+        if months < 0:
+            return 0
+        # The occurrence in (or just before) ``day``'s month, then adjust.
+        index = months // self.step
+        while index > 0 and self.occurrence(index - 1) > day:
+            index -= 1
+        while self.occurrence(index) <= day:
+            index += 1
+        return index
+
+    def between(self, start, end):
+        first = self.index_after(start - _ONE_DAY)
+        last = self.index_after(end)
+        return [self.occurrence(i) for i in range(first, last)]
+
+
+def compile_rule(frequency, anchor):
+    """Return a (cached) recurrence for the given frequency and anchor date,
+    or None if there is no such frequency or no anchor."""
+    key = (frequency, anchor)
+    rule = _cache.get(key)
+    if rule is None and anchor is not None:
+        if frequency in DAY_STEPS:
+            rule = DayRecurrence(anchor, DAY_STEPS[frequency])
+        elif frequency in MONTH_STEPS:
+            rule = MonthRecurrence(anchor, MONTH_STEPS[frequency])
+        if rule is not None:
+            if len(_cache) >= CACHE_SIZE:
+                _cache.clear()
+            _cache[key] = rule
+    return rule
+
+
+def bulk_between(items, end):
+    """Enumerate occurrences for many rules at once.
+
+    ``items`` is an iterable of ``(key, frequency, anchor, start)`` tuples;
+    the result maps each ``key`` to the list of its occurrences from
+    ``start`` to ``end``, inclusive. Rules that share a frequency, anchor and
+    start are only enumerated once.
+
+    """
+    computed = {}
+    results = {}
+    for key, frequency, anchor, start in items:
+        signature = (frequency, anchor, start)
+        if signature not in computed:
+            rule = compile_rule(frequency, anchor)
+            computed[signature] = rule.between(start, end) if rule else []
+        results[key] = computed[signature]
+    return results
@@ -0,0 +1,136 @@
+"""
+Creates the Transactions that ``RecurringTransaction``s say are due.
+
+Rules are processed in batches. For each batch, every missed occurrence up to
+today is enumerated, existing Transactions are found with one query, the new
+ones are inserted with ``bulk_create``, and the rules' due dates are moved
+forward with a handful of ``update()`` queries.
+
+"""
+from collections import defaultdict
+from datetime import date
+from uuid import uuid4
+
+from django.db.transaction import commit_on_success
+from django.utils import timezone
+
+from .models import (
+    RecurringTransaction,
+    Transaction,
+    apply_ledger_changes,
+    index_descriptions,
+    journal_inserted_transactions,
+    ledger_rows,
+)
+from .recurrence import bulk_between
+from .settings import SCHEDULER_BATCH_SIZE
+from .utils import payee_key
+
+
+def get_occurrences(rules, today):
+    """Return a dict mapping each rule's pk to every date from its
+    ``due_date`` up to ``today`` on which it should have created a
+    Transaction. A rule without a frequency is only due on its due date,
+    and only until it has fired (see ``RecurringTransactionManager.due``)."""
+    items = [
+        (rule.pk, rule.frequency, rule.frequency_start_date, rule.due_date)
+        for rule in rules
+    ]
+    occurrences = bulk_between(items, today)
+    for rule in rules:
+        if rule.get_recurrence() is None and rule.due_date <= today and \
+                rule.last_transaction_date < rule.due_date:
+            occurrences[rule.pk] = [rule.due_date]
+    return occurrences
+
+
+def _existing_keys(rules, today):
+    """Return the set of ``(account_id, date, description, amount,
+    transaction_type)`` keys of recurring Transactions which already exist
+    for the given rules, using a single query."""
+    start = min(rule.due_date for rule in rules)
+    transactions = Transaction.objects.filter(
+        recurring=True,
+        account__in=set(rule.account_id for rule in rules),
+        description__in=set(rule.description for rule in rules),
+        date__gte=start,
+        date__lte=today
+    )
+    fields = ('account', 'date', 'description', 'amount', 'transaction_type')
+    return set(transactions.values_list(*fields))
+
+
+def process_batch(rules, today):
+    """Create the missing Transactions for a batch of due rules, and move
+    their due dates forward. Returns the number of Transactions created."""
+    existing = _existing_keys(rules, today)
+    occurrences = get_occurrences(rules, today)
+
+    new_transactions = []
+    advanced = defaultdict(list)  # (last date, due date) -> rule pks
+    for rule in rules:
+        dates = occurrences[rule.pk]
+        for day in dates:
+            key = (rule.account_id, day, rule.description, rule.amount,
+                   rule.transaction_type)
+            if key in existing:
+                continue
+            new_transactions.append(Transaction(
+                account_id=rule.account_id,
+                date=day,
+                description=rule.description,
+                payee_key=payee_key(rule.description),
+                fingerprint=uuid4().hex,
+                amount=rule.amount,
+                recurring=True,
+                pending=True,
+                transaction_type=rule.transaction_type
+            ))
+
+        last_date = dates[-1] if dates else rule.last_transaction_date
+        due_date = (rule.get_next_date(last_date) or
+                    rule.frequency_start_date or last_date)
+        advanced[(last_date, due_date)].append(rule.pk)
+
+    with commit_on_success():
+        Transaction.objects.bulk_create(new_transactions)
+        journal_inserted_transactions(new_transactions)
+        apply_ledger_changes(ledger_rows(new_transactions))
+        index_descriptions((t.account_id, t.description)
+                           for t in new_transactions)
+
+        now = timezone.now()
+        for (last_date, due_date), pks in advanced.items():
+            RecurringTransaction.objects.filter(pk__in=pks).update(
+                last_transaction_date=last_date,
+                due_date=due_date,
+                updated_on=now
+            )
+    return len(new_transactions)
+
+
+def create_due_transactions(today=None, batch_size=SCHEDULER_BATCH_SIZE,
+                            stdout=None):
+    """Create Transactions for every ``RecurringTransaction`` that is due on
+    or before ``today`` (default: today), including any occurrences that
+    were missed because this wasn't run. Safe to run more than once a day.
+
+    Returns the number of Transactions created.
+
+    """
+    today = today or date.today()
+    due = RecurringTransaction.objects.due(today).order_by('pk')
+
+    created = 0
+    last_pk = 0
+    while True:
+        rules = list(due.filter(pk__gt=last_pk)[:batch_size])
+        if not rules:
+            break
+        last_pk = rules[-1].pk
+        created += process_batch(rules, today)
+        if stdout is not None:
+            stdout.write("Processed {0} recurring transactions, "
+                         "created {1} transactions\n".format(
+                             len(rules), created))
+    return created
@@ -0,0 +1,82 @@
+"""
+Case-insensitive search of an Account's Transaction descriptions.
+
+Each Account's distinct descriptions are broken into trigrams and stored in
+the ``DescriptionTrigram`` table, which is kept up to date as Transactions
+are written. A search looks up the trigrams of the query to find candidate
+descriptions with a single indexed query, checks each candidate in Python,
+and then finds the matching Transactions using the ``(account,
+description)`` index. This works the same on every database backend.
+
+"""
+import re
+
+from django.db.models import Count
+
+from .models import DescriptionTrigram, Transaction, description_trigrams
+from .utils import normalize_description
+
+# Beyond this many matching descriptions a search is too broad for the index
+# to help, so the database is asked to scan the Account's descriptions.
+MAX_INDEXED_MATCHES = 500
+
+
+def _word_regex(query):
+    return r'(^|\s){0}(\s|$)'.format(re.escape(query))
+
+
+# The ways descriptions can be matched, with the equivalent (unindexed)
+# lookups.
+MATCH_LOOKUPS = {
+    'iexact': lambda q: {'description__iexact': q},
+    'startswith': lambda q: {'description__istartswith': q},
+    'endswith': lambda q: {'description__iendswith': q},
+    'contains': lambda q: {'description__icontains': q},
+    'word': lambda q: {'description__iregex': _word_regex(q)},
+}
+
+
+def description_matches(description, query, match):
+    """Does a description match the (normalized) query?"""
+    text = normalize_description(description)
+    if match == 'iexact':
+        return text == query
+    elif match == 'startswith':
+        return text.startswith(query)
+    elif match == 'endswith':
+        return text.endswith(query)
+    elif match == 'word':
+        return u" {0} ".format(query) in u" {0} ".format(text)
+    return query in text
+
+
+def matching_descriptions(account, query, match='contains'):
+    """Return the distinct descriptions in the given Account that match the
+    query. ``match`` is one of ``MATCH_LOOKUPS``."""
+    query = normalize_description(query)
+    trigrams = description_trigrams(query)
+    if trigrams:
+        rows = DescriptionTrigram.objects.filter(
+            account=account, trigram__in=trigrams
+        ).values('description').annotate(
+            num_trigrams=Count('trigram')
+        ).filter(num_trigrams=len(trigrams))
+        candidates = (row['description'] for row in rows)
+    else:
+        # Queries this short have no trigrams; check every description.
+        candidates = Transaction.objects.filter(account=account).order_by(
+            ).values_list('description', flat=True).distinct()
+    return [d for d in candidates if description_matches(d, query, match)]
+
+
+def search_transactions(account, query, match='contains', queryset=None):
+    """Return the Transactions in the given Account (optionally, within
+    ``queryset``) whose description matches the query."""
+    if queryset is None:
+        queryset = Transaction.objects.all()
+    queryset = queryset.filter(account=account)
+
+    descriptions = matching_descriptions(account, query, match)
+    if len(descriptions) > MAX_INDEXED_MATCHES:
+        return queryset.filter(**MATCH_LOOKUPS[match](query))
+    return queryset.filter(description__in=descriptions)
@@ -13,3 +13,58 @@ AMOUNT_DECIMAL_PLACES = getattr(settings,
     'MONEYBAGS_AMOUNT_DECIMAL_PLACES', 2)
 AMOUNT_MAX_DIGITS = getattr(settings,
     'MONEYBAGS_AMOUNT_MAX_DIGITS', 20)
+
+# Use keyset (cursor) pagination for transaction listings, rather than
+# numbered pages. Keyset pages stay fast no matter how deep they are.
+KEYSET_PAGINATION = getattr(settings,
+    'MONEYBAGS_KEYSET_PAGINATION', False)
+
+# The number of Transactions inserted per query (and per database
+# transaction) when importing.
+IMPORT_BATCH_SIZE = getattr(settings,
+    'MONEYBAGS_IMPORT_BATCH_SIZE', 1000)
+
+# The number of Transactions read per query when streaming an export.
+EXPORT_CHUNK_SIZE = getattr(settings,
+    'MONEYBAGS_EXPORT_CHUNK_SIZE', 1000)
+
+# The number of Transactions changed per query (and per database
+# transaction) by the bulk actions on an Account's page.
+BULK_ACTION_CHUNK_SIZE = getattr(settings,
+    'MONEYBAGS_BULK_ACTION_CHUNK_SIZE', 1000)
+
+# The most rows in a page of an API listing, and the most Transactions that
+# can be created or updated by one API request.
+API_PAGE_SIZE = getattr(settings,
+    'MONEYBAGS_API_PAGE_SIZE', 100)
+API_BATCH_SIZE = getattr(settings,
+    'MONEYBAGS_API_BATCH_SIZE', 500)
+
+# The number of RecurringTransactions processed at a time when creating
+# the Transactions that are due.
+SCHEDULER_BATCH_SIZE = getattr(settings,
+    'MONEYBAGS_SCHEDULER_BATCH_SIZE', 200)
+
+# How many days of the change journal to keep (see the ``compact_journal``
+# command). Clients that haven't synced for longer must sync from scratch.
+JOURNAL_RETENTION_DAYS = getattr(settings,
+    'MONEYBAGS_JOURNAL_RETENTION_DAYS', 90)
+
+# How long (in seconds) to cache computed values, like balance forecasts.
+# Cached values are also invalidated whenever the data behind them changes.
+CACHE_TIMEOUT = getattr(settings,
+    'MONEYBAGS_CACHE_TIMEOUT', 60 * 60 * 24)
+
+# Record query counts and timings for each moneybags view (with
+# ``moneybags.instrumentation.InstrumentationMiddleware``) and management
+# command, and send them to a sink: the dotted path of a class with an
+# ``emit(profile)`` method. ``JSONFileSink`` writes to
+# ``MONEYBAGS_INSTRUMENTATION_FILE``.
+INSTRUMENTATION = getattr(settings,
+    'MONEYBAGS_INSTRUMENTATION', False)
+INSTRUMENTATION_SINK = getattr(settings,
+    'MONEYBAGS_INSTRUMENTATION_SINK', 'moneybags.instrumentation.LogSink')
+INSTRUMENTATION_FILE = getattr(settings,
+    'MONEYBAGS_INSTRUMENTATION_FILE', 'moneybags-profile.json')
+INSTRUMENTATION_SLOWEST = getattr(settings,
+    'MONEYBAGS_INSTRUMENTATION_SLOWEST', 5)
@@ -1 +1,26 @@
+from .actions import TestApplyAction
+from .api import TestAPI
+from .benchmarks import TestCompareResults, TestLedgerGenerator
+from .caching import TestAccountVersion
+from .detection import TestDetectRecurring, TestGuessFrequency
+from .forecast import TestComputeForecast
+from .importers import TestImportFiles, TestImportTransactions
+from .instrumentation import TestInstrumentation
+from .journal import TestJournal
+from .models import (
+    TestAccountBalance,
+    TestBalanceCheckpoints,
+    TestMonthlyRollups,
+    TestSyncRecurringTransactions,
+    TestTransactionManagerTotals,
+)
+from .recurrence import TestRecurrence
+from .scheduler import TestCreateDueTransactions
+from .search import TestSearchTransactions
+from .utils import (
+    TestKeysetPagination,
+    TestPackIds,
+    TestPayeeKey,
+    TestURLBuilder,
+)
 from .views import TestViews
@@ -0,0 +1,75 @@
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from moneybags.actions import action_values, apply_action
+from moneybags.models import (
+    Account,
+    MonthlyRollup,
+    RecurringTransaction,
+    Transaction,
+)
+from moneybags.settings import TRANSACTION_TYPE_CREDIT, TRANSACTION_TYPE_DEBIT
+User = get_user_model()
+
+
+class TestApplyAction(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser",
+            email="testuser@example.com", password="sekrit")
+        self.account = Account.objects.create(name="Checking",
+            owner=self.user)
+        self.savings = Account.objects.create(name="Savings",
+            owner=self.user)
+        for i in range(1, 8):
+            Transaction.objects.create(account=self.account,
+                date=date(2013, 1, i), description="Phone Bill",
+                amount=Decimal("10.00"),
+                transaction_type=TRANSACTION_TYPE_DEBIT)
+
+    def _reload(self, account):
+        return Account.objects.get(pk=account.pk)
+
+    def test_action_values(self):
+        self.assertEqual(action_values('remove-pending'), {'pending': False})
+        self.assertEqual(action_values('delete'), None)
+        self.assertRaises(ValueError, action_values, 'change-type')
+        self.assertRaises(ValueError, action_values, 'explode')
+
+    def test_apply_action_in_chunks(self):
+        transactions = Transaction.objects.filter(account=self.account)
+        changed = apply_action(transactions.filter(date__lte=date(2013, 1, 5)),
+                               'change-type', TRANSACTION_TYPE_CREDIT,
+                               chunk_size=2)
+        self.assertEqual(changed, 5)
+        self.assertEqual(self._reload(self.account).get_balance(),
+                         Decimal("30.00"))
+
+        # Only the rows that change are counted
+        self.assertEqual(apply_action(transactions, 'change-type',
+            TRANSACTION_TYPE_CREDIT, chunk_size=2), 2)
+
+        # Mark them recurring, and there's a rule for them
+        apply_action(transactions, 'mark-recurring', chunk_size=3)
+        rule = RecurringTransaction.objects.get(account=self.account)
+        self.assertEqual(rule.last_transaction_date, date(2013, 1, 7))
+
+    def test_move_and_delete(self):
+        transactions = Transaction.objects.filter(account=self.account)
+        apply_action(transactions.filter(date__gte=date(2013, 1, 4)), 'move',
+                     to_account=self.savings, chunk_size=3)
+        self.assertEqual(self._reload(self.account).transaction_count, 3)
+        savings = self._reload(self.savings)
+        self.assertEqual(savings.transaction_count, 4)
+        self.assertEqual(savings.get_balance(), Decimal("-40.00"))
+        rollup = MonthlyRollup.objects.get(account=self.savings)
+        self.assertEqual(rollup.count, 4)
+
+        self.assertEqual(apply_action(Transaction.objects.filter(
+            account=self.savings), 'delete', chunk_size=3), 4)
+        self.assertEqual(self._reload(self.savings).get_balance(), 0)
+        self.assertEqual(self._reload(self.account).get_balance(),
+                         Decimal("-30.00"))
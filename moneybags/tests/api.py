@@ -0,0 +1,159 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from moneybags.models import Account, RecurringTransaction, Transaction
+User = get_user_model()
+
+
+class TestAPI(TestCase):
+    urls = 'moneybags.api_urls'
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser",
+            email="testuser@example.com", password="sekrit")
+        self.account = Account.objects.create(name="Checking",
+            owner=self.user)
+        assert self.client.login(username="testuser", password="sekrit")
+
+    def _get(self, name, data=None, **kwargs):
+        resp = self.client.get(reverse(name, **kwargs), data or {})
+        self.assertEqual(resp.status_code, 200)
+        return json.loads(resp.content.decode('utf-8'))
+
+    def _post(self, name, items, status=200):
+        url = reverse(name, args=[self.account.slug])
+        resp = self.client.post(url, json.dumps(items),
+                                content_type='application/json')
+        self.assertEqual(resp.status_code, status)
+        return json.loads(resp.content.decode('utf-8'))
+
+    def test_requires_login(self):
+        self.client.logout()
+        resp = self.client.get(reverse('moneybags-api-list-accounts'))
+        self.assertEqual(resp.status_code, 401)
+
+    def test_accounts(self):
+        Account.objects.create(name="Someone Else's",
+            owner=User.objects.create_user("other", password="other"))
+        data = self._get('moneybags-api-list-accounts')
+        self.assertEqual([a['slug'] for a in data['results']], ['checking'])
+        self.assertEqual(data['results'][0]['balance'], "0.00")
+
+    def test_balance_as_of(self):
+        Transaction.objects.create(account=self.account,
+            date=date(2013, 1, 5), description="Paycheck",
+            amount=Decimal("100.00"), transaction_type=1)
+        args = [self.account.slug]
+        data = self._get('moneybags-api-detail-account',
+                         {'as_of': '2013-01-04'}, args=args)
+        self.assertEqual(data['balance_as_of'], "0.00")
+        self.assertEqual(data['balance'], "100.00")
+        resp = self.client.get(reverse('moneybags-api-detail-account',
+                                       args=args), {'as_of': '2013-02-30'})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_batch_create_and_update(self):
+        items = [
+            {'date': '2013-01-{0:02d}'.format(i), 'description': 'Coffee',
+             'amount': '3.50', 'transaction_type': -1,
+             'client_id': 'coffee-{0}'.format(i)}
+            for i in range(1, 6)
+        ]
+        data = self._post('moneybags-api-transactions', items)
+        self.assertEqual(len(data['results']), 5)
+        self.assertEqual(data['results'][0]['date'], '2013-01-01')
+        self.assertTrue(data['results'][0]['pending'])
+        account = Account.objects.get(pk=self.account.pk)
+        self.assertEqual(account.get_balance(), Decimal("-17.50"))
+
+        # Retrying the batch doesn't create anything new
+        again = self._post('moneybags-api-transactions', items)
+        self.assertEqual(again['results'], data['results'])
+        self.assertEqual(Transaction.objects.count(), 5)
+
+        # Update one, and create another
+        first = data['results'][0]
+        data = self._post('moneybags-api-transactions', [
+            {'id': first['id'], 'amount': '4.00', 'pending': False},
+            {'date': '2013-01-31', 'description': 'Paycheck',
+             'amount': '100', 'transaction_type': 1},
+        ])
+        self.assertEqual(data['results'][0]['amount'], '4.00')
+        self.assertFalse(data['results'][0]['pending'])
+        self.assertEqual(data['results'][0]['description'], 'Coffee')
+        account = Account.objects.get(pk=self.account.pk)
+        self.assertEqual(account.get_balance(), Decimal("82.00"))
+
+        # An invalid batch changes nothing
+        data = self._post('moneybags-api-transactions', [
+            {'id': first['id'], 'amount': '5.00'},
+            {'date': 'yesterday', 'description': 'Bad'},
+        ], status=400)
+        self.assertEqual(sorted(data['errors']), ['1'])
+        self.assertEqual(Transaction.objects.get(pk=first['id']).amount, 4)
+
+    def test_cursor_listing_and_changes(self):
+        for i in range(1, 6):
+            Transaction.objects.create(account=self.account,
+                date=date(2013, 1, i), description="Coffee", amount=1,
+                transaction_type=-1)
+        args = [self.account.slug]
+
+        page = self._get('moneybags-api-transactions', {'limit': 3},
+                         args=args)
+        self.assertEqual([t['date'] for t in page['results']],
+                         ['2013-01-05', '2013-01-04', '2013-01-03'])
+        page = self._get('moneybags-api-transactions',
+                         {'limit': 3, 'cursor': page['next']}, args=args)
+        self.assertEqual(len(page['results']), 2)
+        self.assertEqual(page['next'], None)
+
+        changes = self._get('moneybags-api-changes', args=args)
+        self.assertEqual(len(changes['transactions']), 5)
+        self.assertFalse(changes['more'])
+        self.assertEqual(changes['recurring_since'], None)
+        since = {'transactions_since': changes['transactions_since']}
+
+        # Nothing changed
+        changes = self._get('moneybags-api-changes', since, args=args)
+        self.assertEqual(changes['transactions'], [])
+        self.assertEqual(changes['transactions_since'],
+                         since['transactions_since'])
+
+        # Only what changed (including by a bulk update) is sent
+        Transaction.objects.filter(date=date(2013, 1, 2)).update(
+            pending=False)
+        RecurringTransaction.objects.create(account=self.account,
+            description="Rent", amount=1000, transaction_type=-1,
+            frequency='m', frequency_start_date=date(2013, 1, 1),
+            last_transaction_date=date(2013, 1, 1))
+        changes = self._get('moneybags-api-changes', since, args=args)
+        self.assertEqual([t['date'] for t in changes['transactions']],
+                         ['2013-01-02'])
+        self.assertEqual([r['description']
+                          for r in changes['recurring_transactions']],
+                         ['Rent'])
+
+    def test_journal(self):
+        args = [self.account.slug]
+        for i in range(1, 4):
+            Transaction.objects.create(account=self.account,
+                date=date(2013, 1, i), description="Coffee",
+                amount=Decimal("3.50"), transaction_type=-1)
+        data = self._get('moneybags-api-journal', {'limit': 2}, args=args)
+        self.assertEqual([c['action'] for c in data['changes']],
+                         ['create', 'create'])
+        self.assertTrue(data['more'])
+
+        Transaction.objects.filter(account=self.account).delete()
+        data = self._get('moneybags-api-journal', {'after': data['after']},
+                         args=args)
+        self.assertEqual([(c['type'], c['action']) for c in data['changes']],
+                         [('transaction', 'create')] +
+                         [('transaction', 'delete')] * 3)
+        self.assertFalse(data['more'])
@@ -0,0 +1,52 @@
+from datetime import date
+
+from django.test import SimpleTestCase, TestCase
+
+from moneybags.benchmarks import (
+    LEDGER_END,
+    LedgerGenerator,
+    compare_results,
+    delete_ledger,
+    generate_ledger,
+)
+from moneybags.models import Account, RecurringTransaction, Transaction
+
+
+class TestLedgerGenerator(TestCase):
+
+    def test_generate_ledger(self):
+        accounts = generate_ledger(users=2, accounts=2, transactions=30,
+                                   recurring=3, batch_size=7)
+        self.assertEqual(len(accounts), 4)
+        self.assertEqual(Transaction.objects.count(), 120)
+        self.assertEqual(RecurringTransaction.objects.count(), 12)
+        for account in Account.objects.all():
+            self.assertEqual(account.transaction_count, 30)
+            self.assertFalse(account.recompute_totals(commit=False))
+
+        delete_ledger()
+        self.assertEqual(Account.objects.count(), 0)
+
+    def test_generator_is_reproducible(self):
+        first = list(LedgerGenerator(seed=42).csv_rows(50))
+        self.assertEqual(first, list(LedgerGenerator(seed=42).csv_rows(50)))
+        self.assertNotEqual(first, list(LedgerGenerator(seed=1).csv_rows(50)))
+
+        # The ledger doesn't depend on when it's generated
+        generator = LedgerGenerator(seed=42)
+        self.assertEqual(generator.end, LEDGER_END)
+        end = date(2020, 6, 30)
+        values = LedgerGenerator(seed=42, end=end).transaction_values()
+        self.assertTrue(values['date'] <= end)
+
+
+class TestCompareResults(SimpleTestCase):
+
+    def test_compare_results(self):
+        baseline = [{'name': 'a', 'size': 10, 'median': 1.0},
+                    {'name': 'b', 'size': 10, 'median': 1.0}]
+        results = [{'name': 'a', 'size': 10, 'median': 1.1},
+                   {'name': 'b', 'size': 10, 'median': 2.0},
+                   {'name': 'c', 'size': 10, 'median': 5.0}]
+        self.assertEqual(compare_results(results, baseline, 0.25),
+                         [('b', 10, 1.0, 2.0)])
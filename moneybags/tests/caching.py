@@ -0,0 +1,66 @@
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from moneybags.caching import get_or_set
+from moneybags.models import Account, RecurringTransaction, Transaction
+User = get_user_model()
+
+
+class TestAccountVersion(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser",
+            email="testuser@example.com", password="sekrit")
+        self.account = Account.objects.create(name="Checking",
+            owner=self.user)
+
+    def _version(self):
+        return Account.objects.get(pk=self.account.pk).version
+
+    def assertBumps(self, func):
+        before = self._version()
+        func()
+        self.assertGreater(self._version(), before)
+
+    def test_writes_bump_the_version(self):
+        t = Transaction(account=self.account, date=date(2013, 1, 1),
+            description="Coffee", amount=3, transaction_type=-1)
+        self.assertBumps(t.save)
+
+        def rename():
+            t.description = "Tea"
+            t.save()
+        self.assertBumps(rename)
+
+        transactions = Transaction.objects.filter(account=self.account)
+        self.assertBumps(lambda: transactions.update(pending=False))
+        self.assertBumps(lambda: transactions.update(check_no=12))
+
+        rule = RecurringTransaction(account=self.account,
+            description="Rent", amount=500, transaction_type=-1,
+            frequency='m', frequency_start_date=date(2013, 1, 1),
+            last_transaction_date=date(2013, 1, 1))
+        self.assertBumps(rule.save)
+        rules = RecurringTransaction.objects.filter(account=self.account)
+        self.assertBumps(lambda: rules.update(amount=600))
+        self.assertBumps(rules.delete)
+
+        self.assertBumps(transactions.delete)
+
+    def test_get_or_set(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        account = Account.objects.get(pk=self.account.pk)
+        self.assertEqual(get_or_set(account, 'test', compute), 1)
+        self.assertEqual(get_or_set(account, 'test', compute), 1)
+
+        Transaction.objects.create(account=account, date=date(2013, 1, 1),
+            description="Coffee", amount=3, transaction_type=-1)
+        account = Account.objects.get(pk=self.account.pk)
+        self.assertEqual(get_or_set(account, 'test', compute), 2)
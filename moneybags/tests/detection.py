@@ -0,0 +1,77 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+
+from moneybags.detection import (
+    create_recurring_transactions,
+    detect_recurring,
+    guess_frequency,
+)
+from moneybags.models import Account, RecurringTransaction, Transaction
+User = get_user_model()
+
+
+class TestGuessFrequency(SimpleTestCase):
+
+    def test_guess_frequency(self):
+        self.assertEqual(guess_frequency([7, 7, 7]), ('w', 1.0))
+        self.assertEqual(guess_frequency([31, 28, 31, 30]), ('m', 1.0))
+        self.assertEqual(guess_frequency([14, 14, 13, 40]), ('b', 0.75))
+        self.assertEqual(guess_frequency([3, 50, 11]), (None, 0))
+        self.assertEqual(guess_frequency([]), (None, 0))
+
+
+class TestDetectRecurring(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser",
+            email="testuser@example.com", password="sekrit")
+        self.account = Account.objects.create(name="Checking",
+            owner=self.user)
+        start = date(2013, 1, 4)
+        for i in range(6):
+            # A bi-weekly paycheck, and rent on the 1st of each month.
+            self._create(start + timedelta(days=14 * i),
+                         "PAYROLL #{0}".format(1000 + i), "2100.00", 1)
+            self._create(date(2013, i + 1, 1), "Rent", "1450.00", -1)
+            # Coffee at random intervals isn't a series
+            self._create(start + timedelta(days=i * i), "Coffee", "3.50", -1)
+
+    def _create(self, day, description, amount, transaction_type):
+        Transaction.objects.create(account=self.account, date=day,
+            description=description, amount=Decimal(amount),
+            transaction_type=transaction_type)
+
+    def test_detect_and_create(self):
+        series = detect_recurring(self.account)
+        found = dict((s.payee_key, s) for s in series)
+        self.assertEqual(sorted(found), ['payroll', 'rent'])
+        self.assertEqual(found['payroll'].frequency, 'b')
+        self.assertEqual(found['payroll'].description, "PAYROLL #1005")
+        self.assertEqual(found['rent'].frequency, 'm')
+        self.assertEqual(found['rent'].last_date, date(2013, 6, 1))
+
+        rules = create_recurring_transactions(self.account, series)
+        self.assertEqual(len(rules), 2)
+        self.assertEqual(RecurringTransaction.objects.count(), 2)
+        self.assertEqual(Transaction.objects.filter(recurring=True).count(),
+                         12)
+
+        # Series with rules aren't proposed again
+        self.assertEqual(detect_recurring(self.account), [])
+
+        # Even once later occurrences have different descriptions
+        self._create(date(2013, 3, 29), "PAYROLL #1006", "2100.00", 1)
+        self.assertEqual(detect_recurring(self.account), [])
+
+        # A later recurring paycheck is matched to the detected rule by
+        # payee too, rather than getting a rule of its own.
+        t = Transaction.objects.create(account=self.account,
+            date=date(2013, 4, 12), description="PAYROLL #1007",
+            amount=Decimal("2100.00"), transaction_type=1, recurring=True)
+        self.assertEqual(RecurringTransaction.objects.count(), 2)
+        rule = t.get_recurring_transaction()
+        self.assertEqual(rule.frequency, 'b')
+        self.assertEqual(rule.last_transaction_date, date(2013, 4, 12))
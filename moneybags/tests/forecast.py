@@ -0,0 +1,44 @@
+from datetime import date
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from moneybags.forecast import compute_forecast
+
+
+class TestComputeForecast(SimpleTestCase):
+
+    def test_compute_forecast(self):
+        rules = [
+            {'pk': 1, 'frequency': 'm', 'due_date': date(2013, 2, 1),
+             'frequency_start_date': date(2013, 1, 1),
+             'last_transaction_date': date(2013, 1, 1),
+             'amount': Decimal("1000.00"), 'transaction_type': 1},
+            {'pk': 2, 'frequency': 'w', 'due_date': date(2013, 1, 14),
+             'frequency_start_date': date(2013, 1, 7),
+             'last_transaction_date': date(2013, 1, 7),
+             'amount': Decimal("100.00"), 'transaction_type': -1},
+            # Overdue, with no frequency, and not yet recorded; applied on
+            # the first day.
+            {'pk': 3, 'frequency': '', 'due_date': date(2013, 1, 10),
+             'frequency_start_date': date(2013, 1, 10),
+             'last_transaction_date': None,
+             'amount': Decimal("5.00"), 'transaction_type': -1},
+            # Yearly, with no occurrence in the forecast; never applied.
+            {'pk': 4, 'frequency': 'y', 'due_date': date(2013, 2, 1),
+             'frequency_start_date': date(2012, 6, 1),
+             'last_transaction_date': date(2012, 6, 1),
+             'amount': Decimal("500.00"), 'transaction_type': -1},
+            # No frequency, and already recorded (so it's in the balance).
+            {'pk': 5, 'frequency': '', 'due_date': date(2013, 1, 12),
+             'frequency_start_date': date(2013, 1, 12),
+             'last_transaction_date': date(2013, 1, 12),
+             'amount': Decimal("75.00"), 'transaction_type': -1},
+        ]
+        series = compute_forecast(Decimal("50.00"), rules,
+                                  date(2013, 1, 14), 31)
+        self.assertEqual(len(series), 31)
+        self.assertEqual(series[0], (date(2013, 1, 14), Decimal("-55.00")))
+        self.assertEqual(series[-1][0], date(2013, 2, 13))
+        # 4 more weekly debits, and one monthly credit
+        self.assertEqual(series[-1][1], Decimal("545.00"))
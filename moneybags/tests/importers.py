@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from moneybags.importers import import_files, import_transactions
+from moneybags.models import Account, Transaction
+from moneybags.settings import IMPORT_BATCH_SIZE
+from moneybags.utils import read_csv_rows
+User = get_user_model()
+
+CSV_DATA = """01/02/2013,,Coffee Shop,$3.50,
+01/03/2013,1001,Rent,"$1,200.00",
+01/04/2013,,Paycheck,,$2500.00
+not a date,,Broken,$1.00,
+01/05/2013,,Both,$1.00,$2.00
+01/06/2013,,Too Short
+"""
+
+
+class TestImportTransactions(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser",
+            email="testuser@example.com", password="sekrit")
+        self.account = Account.objects.create(name="Checking",
+            owner=self.user)
+        fd, self.path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            f.write(CSV_DATA)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_import(self):
+        result = import_transactions(self.account, read_csv_rows(self.path),
+                                     batch_size=2)
+        self.assertEqual(result.rows, 6)
+        self.assertEqual(result.created, 3)
+        self.assertEqual(result.num_rejected, 3)
+        self.assertEqual(Transaction.objects.count(), 3)
+
+        rent = Transaction.objects.get(description="Rent")
+        self.assertEqual(rent.check_no, 1001)
+        self.assertEqual(rent.amount, Decimal("1200.00"))
+        self.assertEqual(rent.date, date(2013, 1, 3))
+
+        account = Account.objects.get(pk=self.account.pk)
+        self.assertEqual(account.balance, Decimal("1296.50"))
+        self.assertEqual(account.transaction_count, 3)
+
+    def test_reimport_skips_existing_rows(self):
+        import_transactions(self.account, read_csv_rows(self.path))
+        result = import_transactions(self.account, read_csv_rows(self.path))
+        self.assertEqual(result.created, 0)
+        self.assertEqual(result.skipped, 3)
+        self.assertEqual(Transaction.objects.count(), 3)
+
+    def test_identical_rows_are_kept(self):
+        rows = [["01/02/2013", "", "Coffee", "$3.50", ""]] * 2
+        result = import_transactions(self.account, rows)
+        self.assertEqual(result.created, 2)
+
+        # Overlapping exports only add the new rows
+        rows.append(["01/02/2013", "", "Coffee", "$3.50", ""])
+        result = import_transactions(self.account, rows)
+        self.assertEqual(result.created, 1)
+        self.assertEqual(result.skipped, 2)
+
+
+class TestImportFiles(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser",
+            email="testuser@example.com", password="sekrit")
+        self.directory = tempfile.mkdtemp()
+        for month in range(1, 4):
+            name = "2013-{0:02d}.csv".format(month)
+            with open(os.path.join(self.directory, name), 'w') as f:
+                for day in range(1, 29):
+                    f.write("{0:02d}/{1:02d}/2013,,Payee {1},${2}.00,\n"
+                            .format(month, day, month * day))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _import(self, name, workers, batch_size=10):
+        account = Account.objects.create(name=name, owner=self.user)
+        result = import_files(account, [self.directory],
+                              batch_size=batch_size, workers=workers)
+        rows = Transaction.objects.filter(account=account).order_by('pk')
+        fields = ('date', 'description', 'amount', 'transaction_type')
+        return result, list(rows.values_list(*fields))
+
+    def test_overlapping_files(self):
+        # The last day of January is in both files
+        overlap = os.path.join(self.directory, "2013-01-overlap.csv")
+        with open(overlap, 'w') as f:
+            f.write("01/28/2013,,Payee 28,$28.00,\n")
+            f.write("01/28/2013,,Payee 28,$28.00,\n")
+            f.write("01/29/2013,,Payee 29,$29.00,\n")
+            # Not the same row as the first, in a later run of its date
+            f.write("01/28/2013,,Payee 28,$28.00,\n")
+        # In separate batches, and in the same batch
+        for batch_size in (10, IMPORT_BATCH_SIZE):
+            result, rows = self._import("Overlapping {0}".format(batch_size),
+                                        workers=1, batch_size=batch_size)
+            self.assertEqual(result.created, 87)
+            self.assertEqual(result.skipped, 1)
+            self.assertEqual(len(rows), 87)
+
+    def test_parallel_matches_serial(self):
+        serial_result, serial = self._import("Serial", workers=1)
+        parallel_result, parallel = self._import("Parallel", workers=2)
+        self.assertEqual(serial_result.created, 84)
+        self.assertEqual(parallel_result.created, 84)
+        self.assertEqual(serial, parallel)
+        self.assertEqual(serial[0][0], date(2013, 1, 1))
@@ -0,0 +1,49 @@
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from moneybags.instrumentation import (
+    MemorySink,
+    QueryBudgetMixin,
+    profile,
+    query_budget,
+)
+from moneybags.models import Account
+User = get_user_model()
+
+
+class TestInstrumentation(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser",
+            email="testuser@example.com", password="sekrit")
+        for i in range(5):
+            Account.objects.create(name="Account {0}".format(i),
+                owner=self.user)
+        assert self.client.login(username="testuser", password="sekrit")
+
+    def test_profile(self):
+        sink = MemorySink()
+        with profile('test', sink) as p:
+            list(Account.objects.all())
+            with profile('inner') as inner:
+                Account.objects.count()
+        self.assertEqual(p.num_queries, 2)
+        self.assertEqual(inner.num_queries, 1)
+        self.assertEqual(sink.profiles[-1]['name'], 'test')
+        self.assertEqual(sink.profiles[-1]['num_queries'], 2)
+
+    def test_query_budget(self):
+        with self.assertRaises(AssertionError):
+            with query_budget(1):
+                Account.objects.count()
+                Account.objects.count()
+
+    def test_list_accounts_query_budget(self):
+        # session, user, the ETag/Last-Modified summary of the user's
+        # Accounts (see ``conditional.accounts_etag``) and the accounts;
+        # not one query per Account.
+        with self.assertQueryBudget(4) as p:
+            resp = self.client.get(reverse("moneybags-list-accounts"))
+        self.assertEqual(resp.status_code, 200)
+        self.assertGreater(p.render_time, 0)
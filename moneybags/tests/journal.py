@@ -0,0 +1,134 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+
+from moneybags.importers import write_batch
+from moneybags.journal import compact_journal, prune_journal, read_changes
+from moneybags.models import (
+    Account,
+    JournalEntry,
+    Transaction,
+)
+from moneybags.settings import TRANSACTION_TYPE_DEBIT
+User = get_user_model()
+
+T = JournalEntry.TRANSACTION
+R = JournalEntry.RECURRING_TRANSACTION
+CREATE, UPDATE, DELETE = (JournalEntry.CREATE, JournalEntry.UPDATE,
+                          JournalEntry.DELETE)
+
+
+class TestJournal(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser",
+            email="testuser@example.com", password="sekrit")
+        self.account = Account.objects.create(name="Checking",
+            owner=self.user)
+        self.savings = Account.objects.create(name="Savings",
+            owner=self.user)
+
+    def _transaction(self, day=1, **kwargs):
+        kwargs.setdefault('account', self.account)
+        return Transaction(date=date(2013, 1, day), description="Phone Bill",
+            amount=Decimal("10.00"), transaction_type=TRANSACTION_TYPE_DEBIT,
+            **kwargs)
+
+    def _changes(self, account=None, after=0):
+        changes, after = read_changes(account or self.account, after)
+        return [(c.kind, c.action, c.object_id) for c in changes]
+
+    def test_save_and_delete(self):
+        t = self._transaction()
+        t.save()
+        t.amount = Decimal("12.00")
+        t.save()
+        t.account = self.savings
+        t.save()
+        pk = t.pk  # delete() clears it
+        t.delete()
+        self.assertEqual(self._changes(), [
+            (T, CREATE, pk),
+            (T, UPDATE, pk),
+            (T, DELETE, pk),
+        ])
+        self.assertEqual(self._changes(self.savings), [
+            (T, CREATE, pk),
+            (T, DELETE, pk),
+        ])
+
+    def test_bulk_writes(self):
+        write_batch([self._transaction(day) for day in range(1, 6)])
+        pks = list(Transaction.objects.order_by('pk').values_list('pk',
+                                                                flat=True))
+        self.assertEqual(JournalEntry.objects.count(), 1)
+        self.assertEqual(JournalEntry.objects.get().get_object_ids(), pks)
+        changes, after = read_changes(self.account)
+
+        transactions = Transaction.objects.filter(account=self.account)
+        transactions.filter(pk__in=pks[:2]).update(pending=False)
+        transactions.filter(pk__in=pks[2:4]).update(account=self.savings)
+        transactions.filter(pk=pks[4]).delete()
+        self.assertEqual(self._changes(after=after), [
+            (T, UPDATE, pks[0]),
+            (T, UPDATE, pks[1]),
+            (T, DELETE, pks[2]),
+            (T, DELETE, pks[3]),
+            (T, DELETE, pks[4]),
+        ])
+        self.assertEqual(self._changes(self.savings), [
+            (T, CREATE, pks[2]),
+            (T, CREATE, pks[3]),
+        ])
+
+    def test_recurring(self):
+        t = self._transaction(recurring=True)
+        t.save()
+        rule = t.get_recurring_transaction()
+        self.assertIn((R, CREATE, rule.pk), self._changes())
+
+    def test_read_in_pages(self):
+        for day in range(1, 4):
+            self._transaction(day).save()
+        changes, after = read_changes(self.account, limit=2)
+        self.assertEqual(len(changes), 2)
+        changes, after = read_changes(self.account, after, limit=2)
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(read_changes(self.account, after), ([], after))
+        self.assertEqual(read_changes(self.savings), ([], 0))
+
+    def test_compact_journal(self):
+        first, second, third = [self._transaction(day) for day in (1, 2, 3)]
+        for t in (first, second, third):
+            t.save()
+        second.amount = Decimal("20.00")
+        second.save()
+        third.amount = Decimal("30.00")
+        third.save()
+        third_pk = third.pk
+        third.delete()
+        newest = JournalEntry.objects.order_by('-id')[0].pk
+
+        tomorrow = timezone.now() + timedelta(days=1)
+        second_updated = JournalEntry.objects.filter(action=UPDATE)[0].pk
+        self.assertEqual(compact_journal(tomorrow), 3)
+        self.assertEqual(self._changes(), [
+            (T, CREATE, first.pk),
+            (T, UPDATE, second.pk),
+            (T, DELETE, third_pk),
+        ])
+        # Each merged entry keeps the sequence number of its objects' last
+        # change, so a reader who had read past the create of ``second``
+        # still reads its update.
+        self.assertEqual(self._changes(after=second_updated - 1), [
+            (T, UPDATE, second.pk),
+            (T, DELETE, third_pk),
+        ])
+        self.assertEqual(JournalEntry.objects.order_by('-id')[0].pk, newest)
+        self.assertEqual(compact_journal(tomorrow), 0)
+
+        self.assertEqual(prune_journal(tomorrow), 2)
+        self.assertEqual(JournalEntry.objects.get().pk, newest)
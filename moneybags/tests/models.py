@@ -0,0 +1,354 @@
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from moneybags.models import (
+    Account,
+    BalanceCheckpoint,
+    MonthlyRollup,
+    RecurringTransaction,
+    Transaction,
+    rebuild_rollups,
+    sync_recurring_transactions,
+    update_checkpoints,
+)
+from moneybags.settings import TRANSACTION_TYPE_CREDIT, TRANSACTION_TYPE_DEBIT
+User = get_user_model()
+
+
+class TestAccountBalance(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser",
+            email="testuser@example.com", password="sekrit")
+        self.account = Account.objects.create(name="Checking",
+            owner=self.user)
+
+    def _create(self, amount, transaction_type, account=None):
+        return Transaction.objects.create(
+            account=account or self.account,
+            date=date(2013, 1, 1),
+            description="Test",
+            amount=Decimal(amount),
+            transaction_type=transaction_type
+        )
+
+    def _reload(self):
+        return Account.objects.get(pk=self.account.pk)
+
+    def test_save_updates_totals(self):
+        self._create("100.00", TRANSACTION_TYPE_CREDIT)
+        self._create("30.00", TRANSACTION_TYPE_DEBIT)
+        account = self._reload()
+        self.assertEqual(account.total_credits, Decimal("100.00"))
+        self.assertEqual(account.total_debits, Decimal("30.00"))
+        self.assertEqual(account.get_balance(), Decimal("70.00"))
+
+    def test_edit_and_delete_update_totals(self):
+        t = self._create("100.00", TRANSACTION_TYPE_CREDIT)
+        t.amount = Decimal("40.00")
+        t.transaction_type = TRANSACTION_TYPE_DEBIT
+        t.save()
+        self.assertEqual(self._reload().get_balance(), Decimal("-40.00"))
+
+        t.delete()
+        self.assertEqual(self._reload().get_balance(), Decimal("0"))
+
+    def test_save_after_bulk_update(self):
+        t = self._create("100.00", TRANSACTION_TYPE_CREDIT)
+        Transaction.objects.filter(pk=t.pk).update(pending=False,
+            amount=Decimal("50.00"))
+        t.description = "Renamed"
+        t.save()  # must not write the stale amount or pending flag
+        stored = Transaction.objects.get(pk=t.pk)
+        self.assertEqual((stored.amount, stored.pending),
+                         (Decimal("50.00"), False))
+        self.assertEqual(self._reload().get_balance(), Decimal("50.00"))
+
+        Transaction.objects.filter(pk=t.pk).update(amount=Decimal("20.00"))
+        t.delete()
+        self.assertEqual(self._reload().get_balance(), Decimal("0"))
+
+    def test_bulk_update_and_delete_update_totals(self):
+        other = Account.objects.create(name="Savings", owner=self.user)
+        self._create("10.00", TRANSACTION_TYPE_CREDIT)
+        self._create("20.00", TRANSACTION_TYPE_CREDIT)
+
+        Transaction.objects.filter(account=self.account).update(
+            account=other)
+        self.assertEqual(self._reload().get_balance(), Decimal("0"))
+        self.assertEqual(Account.objects.get(pk=other.pk).get_balance(),
+                         Decimal("30.00"))
+
+        Transaction.objects.filter(account=other).delete()
+        self.assertEqual(Account.objects.get(pk=other.pk).get_balance(),
+                         Decimal("0"))
+
+    def test_account_save_keeps_totals(self):
+        account = self._reload()
+        self._create("15.00", TRANSACTION_TYPE_CREDIT)
+        account.name = "Renamed"
+        account.save()  # must not write the stale, in-memory balance
+        self.assertEqual(self._reload().get_balance(), Decimal("15.00"))
+
+    def test_recompute_totals(self):
+        self._create("25.00", TRANSACTION_TYPE_CREDIT)
+        Account.objects.filter(pk=self.account.pk).update(balance=0)
+        account = self._reload()
+        self.assertTrue(account.recompute_totals(commit=False))
+        self.assertTrue(account.recompute_totals())
+        self.assertFalse(self._reload().recompute_totals())
+        self.assertEqual(self._reload().get_balance(), Decimal("25.00"))
+
+
+class TestTransactionManagerTotals(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser",
+            email="testuser@example.com", password="sekrit")
+        self.checking = Account.objects.create(name="Checking",
+            owner=self.user)
+        self.savings = Account.objects.create(name="Savings",
+            owner=self.user)
+        for account, amount, transaction_type in [
+                (self.checking, "100.00", TRANSACTION_TYPE_CREDIT),
+                (self.checking, "40.00", TRANSACTION_TYPE_DEBIT),
+                (self.savings, "5.00", TRANSACTION_TYPE_DEBIT)]:
+            Transaction.objects.create(account=account, date=date(2013, 1, 1),
+                description="Test", amount=Decimal(amount),
+                transaction_type=transaction_type)
+
+    def test_totals(self):
+        totals = Transaction.objects.totals(self.checking)
+        self.assertEqual(totals['credits'], Decimal("100.00"))
+        self.assertEqual(totals['debits'], Decimal("40.00"))
+        self.assertEqual(Transaction.objects.balance(self.checking),
+                         Decimal("60.00"))
+
+    def test_annotate_accounts(self):
+        accounts = Transaction.objects.annotate_accounts(
+            Account.objects.filter(owner=self.user))
+        with self.assertNumQueries(1):
+            balances = dict((a.name, Decimal(str(a.ledger_balance)))
+                            for a in accounts)
+        self.assertEqual(balances, {
+            'Checking': Decimal("60.00"),
+            'Savings': Decimal("-5.00"),
+        })
+
+
+class TestMonthlyRollups(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser",
+            email="testuser@example.com", password="sekrit")
+        self.account = Account.objects.create(name="Checking",
+            owner=self.user)
+
+    def _create(self, day, amount, transaction_type, pending=True):
+        return Transaction.objects.create(account=self.account, date=day,
+            description="Test", amount=Decimal(amount), pending=pending,
+            transaction_type=transaction_type)
+
+    def _rollups(self):
+        fields = [f.name for f in MonthlyRollup._meta.fields
+                  if f.name not in ('id', 'account')]
+        rollups = MonthlyRollup.objects.filter(account=self.account)
+        return [r for r in rollups.values(*fields)
+                if any(r[f] for f in fields if f != 'month')]
+
+    def test_rollups_are_maintained(self):
+        t = self._create(date(2013, 1, 5), "10.00", TRANSACTION_TYPE_CREDIT)
+        self._create(date(2013, 1, 20), "4.00", TRANSACTION_TYPE_DEBIT)
+        self._create(date(2013, 2, 1), "7.00", TRANSACTION_TYPE_DEBIT, False)
+
+        january = MonthlyRollup.objects.get(month=date(2013, 1, 1))
+        self.assertEqual(january.pending_credits, Decimal("10.00"))
+        self.assertEqual(january.pending_debit_count, 1)
+        self.assertEqual(january.net_change, Decimal("6.00"))
+
+        # Clearing, moving and deleting Transactions updates the rollups
+        Transaction.objects.filter(date__lt=date(2013, 2, 1)).update(
+            pending=False)
+        t.date = date(2013, 2, 10)
+        t.save()
+        january = MonthlyRollup.objects.get(month=date(2013, 1, 1))
+        self.assertEqual(january.cleared_debits, Decimal("4.00"))
+        self.assertEqual(january.credits, Decimal("0"))
+        february = MonthlyRollup.objects.get(month=date(2013, 2, 1))
+        self.assertEqual(february.cleared_credits, Decimal("10.00"))
+        self.assertEqual(february.count, 2)
+
+        Transaction.objects.filter(transaction_type=TRANSACTION_TYPE_DEBIT
+            ).delete()
+        self.assertEqual(MonthlyRollup.objects.yearly_totals(self.account),
+                         [(2013, Decimal("10.00"), Decimal("0"), 1)])
+
+    def test_save_after_bulk_update_keeps_rollups(self):
+        t = self._create(date(2013, 1, 5), "10.00", TRANSACTION_TYPE_CREDIT)
+        Transaction.objects.filter(pk=t.pk).update(pending=False)
+        t.date = date(2013, 2, 10)  # t still thinks it's pending
+        t.save()
+        maintained = self._rollups()
+        for rollup in maintained:
+            for name, value in rollup.items():
+                if name != 'month':
+                    self.assertGreaterEqual(value, 0, name)
+        february = MonthlyRollup.objects.get(month=date(2013, 2, 1))
+        self.assertEqual(february.cleared_credits, Decimal("10.00"))
+        rebuild_rollups(self.account)
+        self.assertEqual(self._rollups(), maintained)
+
+    def test_rebuild_matches_maintained_rollups(self):
+        self._create(date(2013, 1, 5), "10.00", TRANSACTION_TYPE_CREDIT)
+        self._create(date(2013, 3, 5), "2.50", TRANSACTION_TYPE_DEBIT, False)
+        maintained = self._rollups()
+        self.assertEqual(rebuild_rollups(self.account), 2)
+        self.assertEqual(self._rollups(), maintained)
+
+
+class TestBalanceCheckpoints(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser",
+            email="testuser@example.com", password="sekrit")
+        self.account = Account.objects.create(name="Checking",
+            owner=self.user)
+        for day, amount, transaction_type in [
+                (date(2013, 1, 5), "100.00", TRANSACTION_TYPE_CREDIT),
+                (date(2013, 1, 20), "30.00", TRANSACTION_TYPE_DEBIT),
+                (date(2013, 2, 10), "20.00", TRANSACTION_TYPE_DEBIT),
+                (date(2013, 3, 3), "5.00", TRANSACTION_TYPE_CREDIT)]:
+            self._create(day, amount, transaction_type)
+
+    def _create(self, day, amount, transaction_type):
+        return Transaction.objects.create(account=self.account, date=day,
+            description="Test", amount=Decimal(amount),
+            transaction_type=transaction_type)
+
+    def _checkpoints(self):
+        checkpoints = BalanceCheckpoint.objects.filter(account=self.account)
+        return dict(checkpoints.values_list('date', 'balance'))
+
+    def test_balance_as_of(self):
+        self.assertEqual(self.account.balance_as_of(date(2012, 12, 31)), 0)
+        self.assertEqual(self.account.balance_as_of(date(2013, 1, 19)),
+                         Decimal("100.00"))
+        self.assertEqual(self.account.balance_as_of(date(2013, 1, 31)),
+                         Decimal("70.00"))
+        self.assertEqual(self.account.balance_as_of(date(2013, 2, 28)),
+                         Decimal("50.00"))
+        self.assertEqual(self.account.balance_as_of(date.today()),
+                         Decimal("55.00"))
+
+        checkpoints = self._checkpoints()
+        self.assertEqual(min(checkpoints), date(2013, 1, 31))
+        self.assertEqual(checkpoints[date(2013, 2, 28)], Decimal("50.00"))
+        self.assertEqual(update_checkpoints(self.account), 0)
+
+        # The nearest checkpoint, then the Transactions since it
+        with self.assertNumQueries(2):
+            self.assertEqual(self.account.balance_as_of(date(2013, 3, 15)),
+                             Decimal("55.00"))
+
+    def test_backdated_writes_invalidate_later_checkpoints(self):
+        update_checkpoints(self.account)
+        count = len(self._checkpoints())
+
+        # Writes dated this month don't change any checkpoint
+        self._create(date.today(), "1.00", TRANSACTION_TYPE_DEBIT)
+        self.assertEqual(len(self._checkpoints()), count)
+
+        t = self._create(date(2013, 2, 1), "10.00", TRANSACTION_TYPE_DEBIT)
+        self.assertEqual(list(self._checkpoints()), [date(2013, 1, 31)])
+        self.assertEqual(self.account.balance_as_of(date(2013, 2, 28)),
+                         Decimal("40.00"))
+        self.assertEqual(self.account.balance_as_of(date.today()),
+                         Decimal("44.00"))
+        self.assertEqual(len(self._checkpoints()), count)
+
+        Transaction.objects.filter(pk=t.pk).update(date=date(2013, 1, 1))
+        self.assertEqual(self._checkpoints(), {})
+        self.assertEqual(self.account.balance_as_of(date(2013, 1, 31)),
+                         Decimal("60.00"))
+        self.assertEqual(self.account.balance_as_of(date.today()),
+                         Decimal("44.00"))
+
+
+class TestSyncRecurringTransactions(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser",
+            email="testuser@example.com", password="sekrit")
+        self.account = Account.objects.create(name="Checking",
+            owner=self.user)
+
+    def _transaction(self, day, description, amount, recurring=True):
+        return Transaction(account=self.account, date=day,
+            description=description, amount=Decimal(amount),
+            transaction_type=TRANSACTION_TYPE_DEBIT, recurring=recurring)
+
+    def test_save_creates_and_updates_rule(self):
+        t = self._transaction(date(2013, 1, 1), "Rent", "1450.00")
+        t.save()
+        rule = RecurringTransaction.objects.get(account=self.account)
+        self.assertEqual(rule.desc_slug, "rent")
+        self.assertEqual(rule.frequency_start_date, date(2013, 1, 1))
+        self.assertEqual(rule.due_date, date(2013, 1, 1))
+
+        t = self._transaction(date(2013, 2, 1), "RENT", "1500.00")
+        t.save()
+        rule = RecurringTransaction.objects.get(account=self.account)
+        self.assertEqual(rule.description, "RENT")
+        self.assertEqual(rule.amount, Decimal("1500.00"))
+        self.assertEqual(rule.last_transaction_date, date(2013, 2, 1))
+        self.assertEqual(t.get_recurring_transaction().pk, rule.pk)
+
+        # An older Transaction doesn't move the rule back.
+        self._transaction(date(2012, 12, 1), "Rent", "1400.00").save()
+        rule = RecurringTransaction.objects.get(account=self.account)
+        self.assertEqual(rule.last_transaction_date, date(2013, 2, 1))
+
+    def test_bulk_sync(self):
+        self._transaction(date(2013, 1, 1), "Rent", "1450.00").save()
+        transactions = [
+            self._transaction(date(2013, 2, 1), "Rent", "1450.00"),
+            self._transaction(date(2013, 3, 1), "Rent", "1475.00"),
+            self._transaction(date(2013, 1, 15), "Phone", "65.00"),
+            self._transaction(date(2013, 2, 15), "Phone", "70.00"),
+            self._transaction(date(2013, 2, 20), "Coffee", "3.50",
+                              recurring=False),
+        ]
+        # Find, create, update, find the new ids, lock the Account, journal,
+        # and bump the Account's version.
+        with self.assertNumQueries(7):
+            rules = sync_recurring_transactions(transactions)
+        self.assertEqual(len(rules), 2)
+
+        rules = dict((r.desc_slug, r) for r in
+                     RecurringTransaction.objects.filter(account=self.account))
+        self.assertEqual(sorted(rules), ["phone", "rent"])
+        self.assertEqual(rules["rent"].amount, Decimal("1475.00"))
+        self.assertEqual(rules["rent"].last_transaction_date, date(2013, 3, 1))
+        self.assertEqual(rules["phone"].amount, Decimal("70.00"))
+        self.assertEqual(rules["phone"].frequency_start_date,
+                         date(2013, 1, 15))
+
+    def test_bulk_update_syncs_rules(self):
+        t = self._transaction(date(2013, 1, 1), "Rent", "1450.00")
+        t.save()
+        Transaction.objects.filter(pk=t.pk).update(amount=Decimal("1500"),
+                                                   date=date(2013, 2, 1))
+        rule = RecurringTransaction.objects.get(account=self.account)
+        self.assertEqual(rule.amount, Decimal("1500.00"))
+        self.assertEqual(rule.last_transaction_date, date(2013, 2, 1))
+
+        # Unless the caller manages the rules itself
+        phone = self._transaction(date(2013, 1, 15), "Phone", "65.00",
+                                  recurring=False)
+        phone.save()
+        Transaction.objects.filter(pk=phone.pk).update(recurring=True,
+                                                       sync_recurring=False)
+        self.assertEqual(RecurringTransaction.objects.count(), 1)
@@ -0,0 +1,54 @@
+from datetime import date
+
+from django.test import SimpleTestCase
+
+from moneybags.recurrence import bulk_between, compile_rule
+
+
+class TestRecurrence(SimpleTestCase):
+
+    def test_monthly_clamps_to_month_end(self):
+        rule = compile_rule('m', date(2012, 1, 31))
+        self.assertEqual(rule.next_n(date(2012, 1, 31), 4), [
+            date(2012, 2, 29),
+            date(2012, 3, 31),
+            date(2012, 4, 30),
+            date(2012, 5, 31),
+        ])
+
+    def test_monthly_does_not_drift(self):
+        rule = compile_rule('m', date(2013, 1, 15))
+        dates = rule.between(date(2013, 1, 1), date(2022, 12, 31))
+        self.assertEqual(len(dates), 120)
+        self.assertTrue(all(d.day == 15 for d in dates))
+
+    def test_yearly_leap_day(self):
+        rule = compile_rule('y', date(2012, 2, 29))
+        self.assertEqual(rule.next_after(date(2012, 2, 29)), date(2013, 2, 28))
+        self.assertEqual(rule.next_after(date(2015, 3, 1)), date(2016, 2, 29))
+
+    def test_quarterly(self):
+        rule = compile_rule('q', date(2013, 11, 30))
+        self.assertEqual(rule.next_n(date(2013, 11, 30), 2), [
+            date(2014, 2, 28),
+            date(2014, 5, 30),
+        ])
+
+    def test_days(self):
+        rule = compile_rule('b', date(2013, 1, 1))
+        self.assertEqual(rule.next_after(date(2012, 6, 1)), date(2013, 1, 1))
+        self.assertEqual(rule.between(date(2013, 1, 2), date(2013, 2, 1)),
+                         [date(2013, 1, 15), date(2013, 1, 29)])
+
+    def test_unknown_frequency(self):
+        self.assertEqual(compile_rule('', date(2013, 1, 1)), None)
+
+    def test_bulk_between(self):
+        results = bulk_between([
+            (1, 'w', date(2013, 1, 1), date(2013, 1, 1)),
+            (2, 'w', date(2013, 1, 1), date(2013, 1, 1)),
+            (3, 'y', date(2013, 1, 1), date(2013, 1, 2)),
+        ], date(2013, 1, 31))
+        self.assertEqual(len(results[1]), 5)
+        self.assertEqual(results[1], results[2])
+        self.assertEqual(results[3], [])
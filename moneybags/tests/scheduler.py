@@ -0,0 +1,75 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from moneybags.models import Account, RecurringTransaction, Transaction
+from moneybags.scheduler import create_due_transactions
+User = get_user_model()
+
+
+class TestCreateDueTransactions(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser",
+            email="testuser@example.com", password="sekrit")
+        self.account = Account.objects.create(name="Checking",
+            owner=self.user)
+        self.today = date(2013, 6, 30)
+        self.rule = RecurringTransaction.objects.create(
+            account=self.account,
+            description="Allowance",
+            amount=Decimal("10.00"),
+            frequency='w',
+            frequency_start_date=date(2013, 6, 1),
+            last_transaction_date=date(2013, 6, 1),
+            transaction_type=-1
+        )
+
+    def test_catches_up_missed_occurrences(self):
+        self.assertEqual(self.rule.due_date, date(2013, 6, 8))
+        self.assertEqual(create_due_transactions(self.today), 4)
+
+        dates = Transaction.objects.filter(account=self.account).order_by(
+            'date').values_list('date', flat=True)
+        self.assertEqual(list(dates), [
+            date(2013, 6, 8) + timedelta(days=7 * i) for i in range(4)
+        ])
+
+        rule = RecurringTransaction.objects.get(pk=self.rule.pk)
+        self.assertEqual(rule.last_transaction_date, date(2013, 6, 29))
+        self.assertEqual(rule.due_date, date(2013, 7, 6))
+        self.assertEqual(Account.objects.get(pk=self.account.pk).balance,
+                         Decimal("-40.00"))
+
+    def test_does_not_duplicate(self):
+        Transaction.objects.create(account=self.account, date=date(2013, 6, 8),
+            description="Allowance", amount=Decimal("10.00"), recurring=True,
+            transaction_type=-1)
+        # Saving a recurring Transaction moved the rule forward itself.
+        RecurringTransaction.objects.filter(pk=self.rule.pk).update(
+            due_date=date(2013, 6, 8))
+
+        self.assertEqual(create_due_transactions(self.today), 3)
+        self.assertEqual(create_due_transactions(self.today), 0)
+        self.assertEqual(Transaction.objects.count(), 4)
+
+    def test_one_off_fires_once(self):
+        rule = RecurringTransaction.objects.create(account=self.account,
+            description="Deposit", amount=Decimal("50.00"), frequency='',
+            frequency_start_date=date(2013, 6, 15),
+            last_transaction_date=date(2013, 6, 1), transaction_type=1)
+        self.assertEqual(rule.due_date, date(2013, 6, 15))
+        self.assertEqual(create_due_transactions(self.today), 5)
+        deposit = Transaction.objects.get(description="Deposit")
+        self.assertEqual(deposit.date, date(2013, 6, 15))
+
+        # Once it has fired, it isn't due again, even if its Transaction is
+        # deleted.
+        due = RecurringTransaction.objects.due(self.today)
+        self.assertNotIn(rule.pk, [r.pk for r in due])
+        deposit.delete()
+        self.assertEqual(create_due_transactions(self.today), 0)
+        self.assertFalse(Transaction.objects.filter(
+            description="Deposit").exists())
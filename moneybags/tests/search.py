@@ -0,0 +1,75 @@
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from moneybags.forms import TransactionReportForm
+from moneybags.models import (
+    Account,
+    DescriptionTrigram,
+    Transaction,
+    rebuild_search_index,
+)
+from moneybags.search import matching_descriptions, search_transactions
+User = get_user_model()
+
+
+class TestSearchTransactions(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser",
+            email="testuser@example.com", password="sekrit")
+        self.account = Account.objects.create(name="Checking",
+            owner=self.user)
+        self.other = Account.objects.create(name="Savings", owner=self.user)
+        for description in ["Corner Coffee Shop", "COFFEE  shop #2",
+                            "Coffeehouse", "Rent"]:
+            self._create(self.account, description)
+        self._create(self.other, "Corner Coffee Shop")
+
+    def _create(self, account, description, day=date(2013, 1, 1)):
+        return Transaction.objects.create(account=account, date=day,
+            description=description, amount=1, transaction_type=-1)
+
+    def _search(self, query, match):
+        return sorted(matching_descriptions(self.account, query, match))
+
+    def test_match_types(self):
+        self.assertEqual(self._search("coffee", "startswith"),
+                         ["COFFEE  shop #2", "Coffeehouse"])
+        self.assertEqual(self._search("Coffee Shop", "endswith"),
+                         ["Corner Coffee Shop"])
+        self.assertEqual(self._search("coffee shop", "contains"),
+                         ["COFFEE  shop #2", "Corner Coffee Shop"])
+        self.assertEqual(self._search("coffee", "word"),
+                         ["COFFEE  shop #2", "Corner Coffee Shop"])
+        self.assertEqual(self._search("rent", "iexact"), ["Rent"])
+        self.assertEqual(self._search("#2", "endswith"), ["COFFEE  shop #2"])
+
+    def test_search_is_scoped_to_account(self):
+        transactions = search_transactions(self.account, "corner", "contains")
+        self.assertEqual([t.account for t in transactions], [self.account])
+
+    def test_index_is_maintained(self):
+        t = self._create(self.account, "Bakery")
+        self.assertEqual(self._search("baker", "startswith"), ["Bakery"])
+
+        t.description = "Bagels"
+        t.save()
+        self.assertEqual(self._search("bagel", "contains"), ["Bagels"])
+
+        Transaction.objects.filter(pk=t.pk).update(description="Donuts")
+        self.assertEqual(self._search("donut", "contains"), ["Donuts"])
+
+        # Rebuilding drops descriptions that are no longer used
+        self.assertEqual(rebuild_search_index(self.account), 5)
+        self.assertFalse(DescriptionTrigram.objects.filter(
+            account=self.account, description="Bakery").exists())
+
+    def test_report_form(self):
+        form = TransactionReportForm({'description': 'shop',
+                                      'description_match': 'endswith'})
+        self.assertTrue(form.is_valid())
+        transactions = form.get_matching_transactions(account=self.account)
+        self.assertEqual(transactions.count(), 1)
+        self.assertEqual(form.get_matching_transactions().count(), 2)
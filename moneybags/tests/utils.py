@@ -0,0 +1,100 @@
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.test import SimpleTestCase, TestCase
+from django.test.client import RequestFactory
+
+from moneybags.models import Account, Transaction
+from moneybags.utils import (
+    iter_keyset_chunks,
+    keyset_paginate_queryset,
+    pack_ids,
+    payee_key,
+    unpack_ids,
+    url_builder,
+)
+User = get_user_model()
+
+
+class TestKeysetPagination(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testuser",
+            email="testuser@example.com", password="sekrit")
+        self.account = Account.objects.create(name="Checking",
+            owner=self.user)
+        start = date(2013, 1, 1)
+        for i in range(23):
+            Transaction.objects.create(
+                account=self.account,
+                date=start + timedelta(days=i % 5),
+                check_no=(i if i % 3 else None),
+                description="Payee {0}".format(i % 4),
+                amount=i + 1,
+                transaction_type=1
+            )
+        self.factory = RequestFactory()
+
+    def _page(self, cursor=None):
+        data = {'cursor': cursor} if cursor else {}
+        request = self.factory.get('/', data)
+        transactions = Transaction.objects.filter(account=self.account)
+        return keyset_paginate_queryset(request, transactions, num_items=5,
+                                        count=self.account.transaction_count)
+
+    def test_walk_forward_and_back(self):
+        expected = list(Transaction.objects.filter(account=self.account))
+
+        pages = [self._page()]
+        while pages[-1].has_next():
+            pages.append(self._page(pages[-1].next_token))
+        seen = [t for page in pages for t in page]
+        self.assertEqual(seen, expected)
+        self.assertFalse(pages[0].has_previous())
+
+        # ...and back again, from the last page.
+        page = pages[-1]
+        for previous in reversed(pages[:-1]):
+            page = self._page(page.previous_token)
+            self.assertEqual(list(page), list(previous))
+
+    def test_estimated_num_pages(self):
+        self.account = Account.objects.get(pk=self.account.pk)
+        self.assertEqual(self._page().estimated_num_pages, 5)
+
+    def test_bad_token_gives_first_page(self):
+        self.assertEqual(list(self._page('bogus')), list(self._page()))
+
+    def test_iter_keyset_chunks(self):
+        transactions = Transaction.objects.filter(account=self.account)
+        chunks = list(iter_keyset_chunks(transactions, chunk_size=5))
+        self.assertEqual([len(c) for c in chunks], [5, 5, 5, 5, 3])
+        self.assertEqual([t for c in chunks for t in c], list(transactions))
+
+
+class TestURLBuilder(SimpleTestCase):
+
+    def test_url_builder(self):
+        build = url_builder('moneybags-detail-transaction', 'my-account')
+        for pk in (1, 42, 918273):
+            self.assertEqual(build(pk), reverse(
+                'moneybags-detail-transaction', args=['my-account', pk]))
+
+
+class TestPayeeKey(SimpleTestCase):
+
+    def test_payee_key(self):
+        self.assertEqual(payee_key("COFFEE SHOP #123"), "coffee-shop")
+        self.assertEqual(payee_key("Coffee  Shop 456"), "coffee-shop")
+        self.assertEqual(payee_key("POS *4411 Coffee Shop"), "pos-coffee-shop")
+        self.assertEqual(payee_key("1234"), "1234")
+
+
+class TestPackIds(SimpleTestCase):
+
+    def test_pack_ids(self):
+        self.assertEqual(pack_ids([9, 1, 3, 2, 7, 10, 3]), "1-3,7,9-10")
+        self.assertEqual(pack_ids([]), "")
+        self.assertEqual(unpack_ids("1-3,7,9-10"), [1, 2, 3, 7, 9, 10])
+        self.assertEqual(unpack_ids(""), [])
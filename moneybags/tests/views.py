@@ -1,14 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+from datetime import date
+
 from django.contrib.auth import get_user_model
 from django.core.urlresolvers import reverse
 from django.test import TestCase, Client
 
-from moneybags.models import Account
+from moneybags.instrumentation import QueryBudgetMixin
+from moneybags.models import Account, RecurringTransaction, Transaction
 User = get_user_model()
 
 
-class TestViews(TestCase):
+class TestViews(QueryBudgetMixin, TestCase):
     url = 'moneybags.urls'
 
     def setUp(self):
@@ -66,3 +69,203 @@ class TestViews(TestCase):
         self.assertTemplateUsed(resp, "moneybags/list_accounts.html")
         self.assertIn("accounts", resp.context)
         self.assertIn(acct, resp.context['accounts'])
+
+    def test_detail_account_formset_is_page_sized(self):
+        acct = Account.objects.create(name="Test Account", owner=self.user)
+        for i in range(60):
+            Transaction.objects.create(account=acct, date=date(2013, 1, 1),
+                description="Test {0}".format(i), amount=1,
+                transaction_type=1)
+
+        url = reverse("moneybags-detail-account", args=[acct.slug])
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.context['formset'].forms), 50)
+        for t in resp.context['transactions'].object_list:
+            self.assertEqual(t.checkbox_form.initial['object_id'], t.id)
+
+    def test_detail_account_caches_the_page(self):
+        acct = Account.objects.create(name="Test Account", owner=self.user)
+        Transaction.objects.create(account=acct, date=date(2013, 1, 1),
+            description="Test", amount=1, transaction_type=1)
+        url = reverse("moneybags-detail-account", args=[acct.slug])
+        self.client.get(url)
+
+        # Only the cached page of Transactions is shown; they aren't queried
+        with self.assertQueryBudget(9) as p:
+            resp = self.client.get(url)
+        self.assertContains(resp, "Test")
+        self.assertEqual([q['sql'] for q in p.queries
+                          if '"moneybags_transaction"' in q['sql']], [])
+
+    def test_export_transaction_report(self):
+        acct = Account.objects.create(name="Test Account", owner=self.user)
+        Transaction.objects.create(account=acct, date=date(2013, 1, 2),
+            description="Coffee", amount="3.50", transaction_type=-1)
+        Transaction.objects.create(account=acct, date=date(2013, 1, 1),
+            check_no=101, description="Coffee", amount=20,
+            transaction_type=1)
+        Transaction.objects.create(account=acct, date=date(2013, 1, 1),
+            description="Rent", amount=500, transaction_type=-1)
+        query = {'description': 'coff', 'description_match': 'startswith'}
+
+        url = reverse("moneybags-export-transaction-report",
+                      args=[acct.slug, 'csv'])
+        resp = self.client.get(url, query)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp['Content-Type'], 'text/csv')
+        self.assertEqual(b''.join(resp.streaming_content).splitlines(), [
+            b'01/02/2013,,Coffee,3.50,',
+            b'01/01/2013,101,Coffee,,20.00',
+        ])
+
+        url = reverse("moneybags-export-transaction-report",
+                      args=[acct.slug, 'ndjson'])
+        resp = self.client.get(url, query)
+        lines = b''.join(resp.streaming_content).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn(b'"amount": "3.50"', lines[0])
+
+        # An invalid report redirects back to the report form
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 302)
+
+    def test_detail_account_query_count_is_constant(self):
+        acct = Account.objects.create(name="Test Account", owner=self.user)
+        url = reverse("moneybags-detail-account", args=[acct.slug])
+        num_queries = []
+        for count in (2, 40):
+            for i in range(count):
+                Transaction.objects.create(account=acct,
+                    date=date(2013, 1, 1), description="Test", amount=1,
+                    transaction_type=1)
+            RecurringTransaction.objects.create(account=acct,
+                description="Rule {0}".format(count), amount=1,
+                transaction_type=-1, frequency='m',
+                frequency_start_date=date.today(),
+                last_transaction_date=date.today())
+            with self.assertQueryBudget(9) as p:
+                resp = self.client.get(url)
+            first = Transaction.objects.all()[0]
+            self.assertContains(resp, reverse(
+                "moneybags-detail-transaction", args=[acct.slug, first.pk]))
+            num_queries.append(p.num_queries)
+        self.assertEqual(num_queries[0], num_queries[1])
+
+    def test_update_transactions(self):
+        acct = Account.objects.create(name="Checking", owner=self.user)
+        savings = Account.objects.create(name="Savings", owner=self.user)
+        for day in (1, 15):
+            for month in (1, 2, 3):
+                Transaction.objects.create(account=acct,
+                    date=date(2013, month, day), description="Coffee",
+                    amount=2, transaction_type=-1)
+        other = Transaction.objects.create(account=savings,
+            date=date(2013, 1, 1), description="Interest", amount=1,
+            transaction_type=1)
+        url = reverse("moneybags-update-transactions", args=[acct.slug])
+
+        # Checked rows are only changed in the given Account
+        data = {
+            'action': 'remove-pending',
+            'form-TOTAL_FORMS': 1,
+            'form-INITIAL_FORMS': 1,
+            'form-0-object_id': other.pk,
+            'form-0-value': 'on',
+        }
+        resp = self.client.post(url, data)
+        self.assertRedirects(resp, acct.get_absolute_url())
+        self.assertTrue(Transaction.objects.get(pk=other.pk).pending)
+
+        # Clear everything pending before March
+        data = {
+            'action': 'remove-pending',
+            'selection': 'matching',
+            'select-to_date': '02/28/2013',
+            'select-pending': 'pending',
+        }
+        self.client.post(url, data)
+        cleared = Transaction.objects.filter(account=acct, pending=False)
+        self.assertEqual(cleared.count(), 4)
+
+        # Move March's Transactions to savings
+        data = {
+            'action': 'move',
+            'to_account': savings.pk,
+            'selection': 'matching',
+            'select-from_date': '03/01/2013',
+            'select-description': 'coffee',
+            'select-description_match': 'iexact',
+        }
+        self.client.post(url, data)
+        acct = Account.objects.get(pk=acct.pk)
+        savings = Account.objects.get(pk=savings.pk)
+        self.assertEqual(acct.transaction_count, 4)
+        self.assertEqual(acct.get_balance(), -8)
+        self.assertEqual(savings.transaction_count, 3)
+        self.assertEqual(savings.get_balance(), -3)
+
+        # An empty selection doesn't select the whole Account...
+        data = {'action': 'change-type', 'selection': 'matching',
+                'transaction_type': 1}
+        self.client.post(url, data)
+        self.assertEqual(Account.objects.get(pk=acct.pk).get_balance(), -8)
+
+        # ...unless every Transaction is asked for. Changing the type needs
+        # a type.
+        data = {'action': 'change-type', 'selection': 'matching',
+                'select-everything': 'on'}
+        self.client.post(url, data)
+        self.assertEqual(Account.objects.get(pk=acct.pk).get_balance(), -8)
+        data['transaction_type'] = 1
+        self.client.post(url, data)
+        self.assertEqual(Account.objects.get(pk=acct.pk).get_balance(), 8)
+
+    def test_conditional_get(self):
+        acct = Account.objects.create(name="Test Account", owner=self.user)
+        url = reverse("moneybags-detail-account", args=[acct.slug])
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        etag = resp['ETag']
+
+        # An unchanged Account gets a 304, with one query for the Account
+        # (plus the session and user).
+        with self.assertQueryBudget(3):
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+        # Other pages and changed Accounts are sent in full.
+        resp = self.client.get(url, {'page': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        Transaction.objects.create(account=acct, date=date(2013, 1, 1),
+            description="Test", amount=1, transaction_type=1)
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+
+        url = reverse("moneybags-list-accounts")
+        etag = self.client.get(url)['ETag']
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        Account.objects.create(name="Another Account", owner=self.user)
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_detail_transaction_similar_transactions(self):
+        acct = Account.objects.create(name="Test Account", owner=self.user)
+        for i in range(30):
+            t = Transaction.objects.create(account=acct,
+                date=date(2013, 1, 1), amount=i + 1, transaction_type=-1,
+                description="COFFEE SHOP #{0}".format(i % 3))
+        Transaction.objects.create(account=acct, date=date(2013, 1, 1),
+            description="Rent", amount=500, transaction_type=-1)
+
+        url = reverse("moneybags-detail-transaction", args=[acct.slug, t.pk])
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.context['similar_transactions']), 25)
+        summary = resp.context['similar_summary']
+        self.assertEqual(summary['count'], 29)
+        self.assertEqual(summary['total'], sum(range(1, 30)))
+        self.assertEqual(summary['average'], 15)
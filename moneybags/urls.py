@@ -6,6 +6,9 @@ from django.views.generic import TemplateView
 # /<account_slug>/update/
 # /<account_slug>/new/
 # /<account_slug>/report/
+# /<account_slug>/report.csv
+# /<account_slug>/report.ndjson
+# /<account_slug>/forecast/
 # /<account_slug>/transaction/<transaction_id>/
 # /<account_slug>/recurring/<transaction_id>/
 # /<account_slug>/<transaction_id>/
@@ -35,6 +38,14 @@ urlpatterns = patterns('moneybags.views',
         'transaction_report',
         name='moneybags-transaction-report'),
 
+    url(r'^(?P<account_slug>.*)/report\.(?P<fmt>csv|ndjson)$',
+        'export_transaction_report',
+        name='moneybags-export-transaction-report'),
+
+    url(r'^(?P<account_slug>.*)/forecast/$',
+        'forecast_account',
+        name='moneybags-forecast-account'),
+
     url(r'^(?P<account_slug>.*)/transaction/(?P<transaction_id>\d+)/$',
         'detail_transaction',
         name='moneybags-detail-transaction'),
@@ -1,18 +1,70 @@
 from collections import namedtuple
 from csv import reader
-from datetime import datetime
 from decimal import Decimal, InvalidOperation
+from math import ceil
+from django.core import signing
+from django.core.exceptions import ValidationError
 from django.core.paginator import EmptyPage, Paginator, PageNotAnInteger
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.db.models import Q
 from django.shortcuts import render_to_response
 from django.template import RequestContext
+from django.template.defaultfilters import slugify
 from re import sub as regex_sub
 from sys import stdout
 
+from .instrumentation import timed_render
 
-from .settings import (
-    TRANSACTION_TYPE_DEBIT,
-    TRANSACTION_TYPE_CREDIT,
-)
+
+def chunked(items, size=500):
+    """Yield successive lists of at most ``size`` items. The default size
+    keeps ``__in`` lookups under SQLite's limit on query parameters."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def pack_ids(ids):
+    """Pack integer ids into a compact string of comma-separated ids and
+    ranges, e.g. ``[1, 2, 3, 7, 9, 10]`` becomes ``"1-3,7,9-10"``."""
+    parts = []
+    start = end = None
+    for i in sorted(set(ids)):
+        if end is not None and i == end + 1:
+            end = i
+            continue
+        if start is not None:
+            parts.append(str(start) if start == end else
+                         "{0}-{1}".format(start, end))
+        start = end = i
+    if start is not None:
+        parts.append(str(start) if start == end else
+                     "{0}-{1}".format(start, end))
+    return ",".join(parts)
+
+
+def unpack_ids(packed):
+    """Return the list of ids in a string from ``pack_ids``."""
+    ids = []
+    for part in packed.split(","):
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        ids.extend(range(int(start), int(end or start) + 1))
+    return ids
+
+
+def normalize_description(description):
+    """Lower-case a description and collapse any runs of whitespace."""
+    return ' '.join(description.lower().split())
+
+
+def payee_key(description):
+    """Return a key identifying the payee of a transaction description: it's
+    slugified, after dropping anything numeric (like store, reference or
+    card numbers), so "COFFEE SHOP #123" and "Coffee Shop 456" match."""
+    key = slugify(regex_sub(r'[#*]?\d+', ' ', description))
+    return (key or slugify(description))[:255]
 
 
 def paginate_queryset(request, queryset, num_items=50, page_var='page'):
@@ -38,16 +90,288 @@ def paginate_queryset(request, queryset, num_items=50, page_var='page'):
     return results
 
 
+class KeysetPage(object):
+    """A page of results from ``keyset_paginate_queryset``.
+
+    Unlike a ``Page`` from Django's ``Paginator``, this knows nothing about
+    page numbers; it only knows how to get to the next and previous pages.
+
+    """
+    is_keyset = True
+
+    def __init__(self, object_list, next_token=None, previous_token=None,
+                 estimated_num_pages=None, querydict=None,
+                 cursor_var='cursor'):
+        self.object_list = object_list
+        self.next_token = next_token
+        self.previous_token = previous_token
+        self.estimated_num_pages = estimated_num_pages
+        self._querydict = querydict
+        self._cursor_var = cursor_var
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_token is not None
+
+    def has_previous(self):
+        return self.previous_token is not None
+
+    def _querystring(self, token):
+        querydict = self._querydict.copy()
+        querydict[self._cursor_var] = token
+        return querydict.urlencode()
+
+    def next_querystring(self):
+        """The querystring for the next page (keeps any other GET vars)."""
+        if self.has_next():
+            return self._querystring(self.next_token)
+
+    def previous_querystring(self):
+        """The querystring for the previous page."""
+        if self.has_previous():
+            return self._querystring(self.previous_token)
+
+
+KEYSET_SALT = 'moneybags.utils.keyset'
+
+
+def _keyset_ordering(queryset):
+    """Return the queryset's ordering as a list of ``(field_name,
+    descending)`` tuples, always ending with the primary key so that every
+    row has a unique position."""
+    opts = queryset.model._meta
+    ordering = queryset.query.order_by or opts.ordering
+    keys = []
+    for name in ordering:
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        if name == 'pk':
+            name = opts.pk.name
+        keys.append((name, descending))
+    if opts.pk.name not in [name for name, descending in keys]:
+        keys.append((opts.pk.name, False))
+    return keys
+
+
+def _keyset_value(obj, name):
+    """Read a field's value from a model instance or a ``values()`` dict."""
+    if isinstance(obj, dict):
+        return obj[name]
+    return getattr(obj, name)
+
+
+def _beyond(name, value, ascending, nulls_largest):
+    """Return a ``Q`` matching rows that sort after ``value`` in the given
+    direction, or None if no row can. NULLs sort as the largest value if
+    ``nulls_largest`` is set, as the smallest otherwise."""
+    if value is None:
+        if ascending == nulls_largest:
+            return None
+        return Q(**{name + '__isnull': False})
+
+    q = Q(**{name + ('__gt' if ascending else '__lt'): value})
+    if ascending == nulls_largest:
+        q |= Q(**{name + '__isnull': True})
+    return q
+
+
+def _keyset_filter(keys, values, forward, nulls_largest):
+    """Return a ``Q`` matching rows after (if ``forward``) or before the row
+    whose ordering key is ``values``."""
+    result = None
+    equal = Q()
+    for (name, descending), value in zip(keys, values):
+        beyond = _beyond(name, value, descending != forward, nulls_largest)
+        if beyond is not None:
+            clause = equal & beyond
+            result = clause if result is None else result | clause
+        if value is None:
+            equal &= Q(**{name + '__isnull': True})
+        else:
+            equal &= Q(**{name: value})
+    if result is None:
+        # Nothing sorts after this row.
+        result = Q(pk__in=[])
+    return result
+
+
+def _encode_keyset_token(keys, obj, forward):
+    values = []
+    for name, descending in keys:
+        value = _keyset_value(obj, name)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        values.append(value)
+    return signing.dumps([values, forward], salt=KEYSET_SALT, compress=True)
+
+
+def _decode_keyset_token(keys, model, token):
+    """Return ``(values, forward)`` from a token, or None if it's invalid."""
+    try:
+        values, forward = signing.loads(token, salt=KEYSET_SALT)
+        if len(values) != len(keys):
+            return None
+        values = [
+            None if value is None else
+            model._meta.get_field(name).to_python(value)
+            for (name, descending), value in zip(keys, values)
+        ]
+    except (signing.BadSignature, ValidationError, ValueError, TypeError):
+        return None
+    return values, bool(forward)
+
+
+def keyset_token(queryset, obj):
+    """Return a token for the position just after ``obj`` (a row of the
+    queryset), for ``keyset_paginate_queryset``. Unlike a page's
+    ``next_token``, this is available even for the last row, e.g. to
+    resume a feed of rows added later."""
+    return _encode_keyset_token(_keyset_ordering(queryset), obj, True)
+
+
+def keyset_paginate_queryset(request, queryset, num_items=50,
+                             cursor_var='cursor', count=None):
+    """Given a queryset of objects, return a ``KeysetPage`` of results.
+
+    Rather than counting rows and using ``OFFSET``, this seeks directly to
+    the rows after (or before) the last row of the previous page using the
+    queryset's ordering (e.g. ``Transaction.Meta.ordering``), so deep pages
+    cost the same as the first one.
+
+    * ``request`` -- an HTTPRequest object; Used to retrieve the cursor
+    * ``queryset`` -- a QuerySet of model objects (or of ``values()``
+      dicts that include every ordering field).
+    * ``num_items`` -- the number of items to show, per page.
+    * ``cursor_var`` -- the name of the querystring variable for the
+      (opaque) cursor token.
+    * ``count`` -- (optional) a known or estimated total number of rows,
+      used to fill in ``estimated_num_pages``.
+
+    """
+    keys = _keyset_ordering(queryset)
+    model = queryset.model
+    nulls_largest = getattr(
+        connections[queryset.db].features, 'nulls_order_largest', False)
+    queryset = queryset.order_by(
+        *[('-' if descending else '') + name for name, descending in keys])
+
+    cursor = None
+    token = request.GET.get(cursor_var)
+    if token:
+        cursor = _decode_keyset_token(keys, model, token)
+
+    forward = True
+    if cursor is not None:
+        values, forward = cursor
+        queryset = queryset.filter(
+            _keyset_filter(keys, values, forward, nulls_largest))
+    if not forward:
+        queryset = queryset.reverse()
+
+    # Fetch one extra row to find out if there's another page.
+    object_list = list(queryset[:num_items + 1])
+    has_more = len(object_list) > num_items
+    object_list = object_list[:num_items]
+    if not forward:
+        object_list.reverse()
+
+    next_token = previous_token = None
+    if object_list:
+        if has_more or not forward:
+            next_token = _encode_keyset_token(keys, object_list[-1], True)
+        if cursor is not None and (has_more or forward):
+            previous_token = _encode_keyset_token(keys, object_list[0], False)
+
+    estimated_num_pages = None
+    if count is not None:
+        estimated_num_pages = max(1, int(ceil(count / float(num_items))))
+
+    return KeysetPage(object_list, next_token, previous_token,
+                      estimated_num_pages, request.GET, cursor_var)
+
+
+def iter_keyset_chunks(queryset, chunk_size=1000):
+    """Yield every row of a queryset in lists of at most ``chunk_size``,
+    in the queryset's ordering.
+
+    Each chunk is a separate query that seeks past the last row of the
+    previous chunk (see ``keyset_paginate_queryset``), so only one chunk is
+    ever held in memory, however many rows match, and no cursor is held open
+    between chunks.
+
+    """
+    keys = _keyset_ordering(queryset)
+    nulls_largest = getattr(
+        connections[queryset.db].features, 'nulls_order_largest', False)
+    queryset = queryset.order_by(
+        *[('-' if descending else '') + name for name, descending in keys])
+
+    chunk = list(queryset[:chunk_size])
+    while chunk:
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        values = [_keyset_value(chunk[-1], name) for name, descending in keys]
+        chunk = list(queryset.filter(
+            _keyset_filter(keys, values, True, nulls_largest))[:chunk_size])
+
+
+# A stand-in for the object id when reversing a URL in ``url_builder``.
+URL_BUILDER_SENTINEL = 918273645546372819
+
+
+def url_builder(viewname, *args):
+    """Return a function that builds the URL for ``viewname`` given
+    ``args`` followed by an object id, i.e. ``build(object_id) ==
+    reverse(viewname, args=args + (object_id,))``.
+
+    ``reverse()`` is only called once, so this is much faster when building
+    a URL for every row of a list. The object id must be the last (and a
+    numeric) argument of the URL.
+
+    """
+    url = reverse(viewname, args=list(args) + [URL_BUILDER_SENTINEL])
+    prefix, suffix = url.rsplit(str(URL_BUILDER_SENTINEL), 1)
+
+    def build(object_id):
+        return u"{0}{1}{2}".format(prefix, object_id, suffix)
+    return build
+
+
 def rtr(request, template, data):
     """A shortcut for ``render_to_response`` using ``RequestContext``."""
     args = (template, data)
     kwargs = {"context_instance": RequestContext(request)}
-    return render_to_response(*args, **kwargs)
+    with timed_render():
+        return render_to_response(*args, **kwargs)
+
+
+CSVTransaction = namedtuple('Transaction',
+                            'date, check, description, debit, credit')
+
+
+def read_csv_rows(path_to_csv_file):
+    """Yield each row of a CSV file as a list of strings. The file is read
+    lazily and closed once every row has been read."""
+    with open(path_to_csv_file, "rb") as csv_file:
+        for row in reader(csv_file):
+            yield row
 
 
 def load_csv_data(path_to_csv_file):
-    """Loads data from a CSV file, returning a list of ``namedtuple``s
-    containing transaction data.
+    """Loads data from a CSV file, yielding ``namedtuple``s containing
+    transaction data. Rows are read lazily, so the file is never held in
+    memory.
 
     The CSV should be organized like a checkbook register with the following
     columns:
@@ -59,11 +383,8 @@ def load_csv_data(path_to_csv_file):
     * Credit Amount
 
     """
-    fields = 'date, check, description, debit, credit'
-    Transaction = namedtuple('Transaction', fields)
-
-    csv_reader = reader(open(path_to_csv_file, "rb"))
-    return map(Transaction._make, csv_reader)
+    for row in read_csv_rows(path_to_csv_file):
+        yield CSVTransaction._make(row)
 
 
 def to_decimal(value, formatting_chars=['$', ',']):
@@ -86,53 +407,24 @@ def create_transactions(account, transactions, date_format_string='%m/%d/%Y',
     list of transaction data.
 
     * ``account`` -- The ``Account`` under which to group Transactions.
-    * ``transactions`` -- a list of ``namedtuple``s like that returned from
-      ``load_csv_data``.
+    * ``transactions`` -- an iterable of ``namedtuple``s like that returned
+      from ``load_csv_data``.
     * ``pending`` -- (default is True) Whether or not to create pending
       Transactions
     * ``date_format_string`` -- used by strptime; the format to convert a
       string into a datetime object. Default is '%m/%d/%Y'
-    * ``verbose`` -- (default is False) Print info to stdout upon creation of
-      each transaction.
+    * ``verbose`` -- (default is False) Print progress and a summary of
+      rejected rows to stdout.
 
-    """
+    This is a thin wrapper around ``importers.import_transactions``, which
+    returns an ``ImportResult``.
 
-    for trans in transactions:
-        # Check for credits or Debits; One of these should be None
-        debit = to_decimal(trans.debit)
-        credit = to_decimal(trans.credit)
-        if debit is None:
-            # we've got a credit
-            amount = credit
-            trans_type = TRANSACTION_TYPE_CREDIT
-        elif credit is None:
-            # We've got a debit
-            amount = debit
-            trans_type = TRANSACTION_TYPE_DEBIT
-        else:
-            # This is an invalid transaction, skip it.
-            amount = None
-            if verbose:
-                stdout.write("---> Amount is NONE for {0}!\n".format(trans))
-
-        try:
-            check_no = int(trans.check)
-        except ValueError:
-            check_no = None
-
-        if amount:
-            account.transaction_set.create(
-                date=datetime.strptime(trans.date, date_format_string),
-                check_no=check_no,
-                description=trans.description,
-                amount=amount,
-                pending=pending,
-                transaction_type=trans_type
-            )
-            if verbose:
-                m = "Created: {date} / {desc} / ${amt}\n".format(
-                    date=trans.date,
-                    desc=trans.description,
-                    amt=amount
-                )
-                stdout.write(m)
+    """
+    from .importers import import_transactions
+    return import_transactions(
+        account,
+        transactions,
+        date_format_string=date_format_string,
+        pending=pending,
+        stdout=stdout if verbose else None
+    )
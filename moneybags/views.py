@@ -2,13 +2,24 @@ from datetime import date
 
 from django.contrib.auth.decorators import login_required
 from django.forms.formsets import formset_factory
+from django.core.urlresolvers import reverse
 from django.shortcuts import get_object_or_404, redirect
+from django.views.decorators.http import condition
 
 from models import Account, Transaction, RecurringTransaction
+from models import attach_account
+from actions import apply_action
+from caching import get_page, get_upcoming_recurring_transactions
+from conditional import account_etag, account_last_modified
+from conditional import accounts_etag, accounts_last_modified
+from exports import export_response
+from forecast import forecast_balance
 from forms import AccountForm, TransactionForm, TransactionCheckBoxForm
 from forms import RecurringTransactionForm, TransactionReportForm
+from forms import TransactionActionForm, TransactionSelectionForm
 from forms import modelform_handler
-from utils import paginate_queryset, rtr
+from settings import CACHE_TIMEOUT, KEYSET_PAGINATION
+from utils import keyset_paginate_queryset, paginate_queryset, rtr
 
 
 @login_required
@@ -28,27 +39,58 @@ def create_transaction(request, account_slug):
 
 
 @login_required
+@condition(etag_func=account_etag,
+           last_modified_func=account_last_modified)
 def transaction_report(request, account_slug):
     account = get_object_or_404(Account, slug=account_slug, owner=request.user)
     transactions = None
     if request.method == "POST":
         form = TransactionReportForm(request.POST)
-        if form.is_valid():
-            fields = ('date', 'check_no', 'description', 'amount')
-            transactions = form.get_matching_transactions(fields=fields)
+    elif 'description' in request.GET:
+        form = TransactionReportForm(request.GET)
     else:
         form = TransactionReportForm()
 
-    data = {'account': account, 'form': form, 'transactions': transactions}
+    if form.is_bound and form.is_valid():
+        fields = ('id', 'date', 'check_no', 'description', 'amount', 'pending')
+        transactions = form.get_matching_transactions(fields=fields,
+            account=account)
+        transactions = keyset_paginate_queryset(request, transactions,
+            num_items=100)
+
+    data = {
+        'account': account,
+        'form': form,
+        'querystring': request.GET.urlencode(),
+        'transactions': transactions,
+    }
     return rtr(request, 'moneybags/transaction_report.html', data)
 
 
+@login_required
+@condition(etag_func=account_etag,
+           last_modified_func=account_last_modified)
+def export_transaction_report(request, account_slug, fmt):
+    """Download every Transaction matching a report as CSV or NDJSON. The
+    export is streamed, so it works for any number of matching rows."""
+    account = get_object_or_404(Account, slug=account_slug, owner=request.user)
+    form = TransactionReportForm(request.GET)
+    if not form.is_valid():
+        url = reverse('moneybags-transaction-report', args=[account.slug])
+        return redirect("{0}?{1}".format(url, request.GET.urlencode()))
+
+    transactions = form.get_matching_transactions(account=account)
+    filename = "{0}-report.{1}".format(account.slug, fmt)
+    return export_response(transactions, fmt, filename)
+
+
 @login_required
 def recurring_transaction(request, account_slug, transaction_id):
     """Create or Update a RecurringTransaction, given a Transaction's `id`."""
     account = get_object_or_404(Account, slug=account_slug, owner=request.user)
     transaction = get_object_or_404(Transaction, pk=transaction_id,
         account=account)
+    transaction.account = account
     recurring_transaction = transaction.get_recurring_transaction()
 
     form, updated_transaction = modelform_handler(
@@ -71,6 +113,7 @@ def update_recurring_transaction(request, account_slug,
     account = get_object_or_404(Account, slug=account_slug, owner=request.user)
     recurring_transaction = get_object_or_404(RecurringTransaction,
         pk=recurring_transaction_id, account=account)
+    recurring_transaction.account = account
 
     form, updated_transaction = modelform_handler(
         request,
@@ -90,6 +133,8 @@ def update_recurring_transaction(request, account_slug,
 
 
 @login_required
+@condition(etag_func=accounts_etag,
+           last_modified_func=accounts_last_modified)
 def list_accounts(request):
     """Lists Accounts owned by the authenticated User."""
     data = {'accounts': Account.objects.filter(owner=request.user)}
@@ -109,6 +154,8 @@ def create_account(request):
 
 
 @login_required
+@condition(etag_func=account_etag,
+           last_modified_func=account_last_modified)
 def detail_account(request, account_slug):
     """List recent debits, credits, and any upcoming recurring transactions."""
     account = get_object_or_404(Account, slug=account_slug, owner=request.user)
@@ -124,80 +171,141 @@ def detail_account(request, account_slug):
     # BUT, the recurringTransaction will still have the wrong date. Either the
     # model, or the managment command needs to update it's due date,
 
-    transactions = Transaction.objects.filter(account=account)
-    recurring_transactions = RecurringTransaction.objects.filter(
-        due_date__gte=today,
-        account=account
-    )
+    recurring_transactions = get_upcoming_recurring_transactions(account,
+        today)
+
+    # Paginate the list of Transactions; each page is cached (until the
+    # Account changes), so it's only queried when it isn't.
+    def paginate():
+        transactions = Transaction.objects.filter(account=account)
+        if KEYSET_PAGINATION or 'cursor' in request.GET:
+            return keyset_paginate_queryset(request, transactions,
+                count=account.transaction_count)
+        return paginate_queryset(request, transactions)
+    page_key = request.GET.urlencode()
+    transactions = get_page(account, 'transactions', paginate, [page_key])
+    transactions.object_list = attach_account(transactions.object_list,
+                                              account)
 
     # Create a FormSet using a TransactionCheckBoxForm for each Transaction
-    # listed.
+    # on this page, and attach each form to its Transaction.
     TransactionFormSet = formset_factory(TransactionCheckBoxForm, extra=0)
-    initial_data = [{'value': False, 'object_id': t.id} for t in transactions]
+    initial_data = [
+        {'value': False, 'object_id': t.id} for t in transactions.object_list
+    ]
     formset = TransactionFormSet(initial=initial_data)
-
-    # Paginate the list of Transactions
-    transactions = paginate_queryset(request, transactions)
+    for t, form in zip(transactions.object_list, formset.forms):
+        t.checkbox_form = form
 
     data = {
         'account': account,
+        'action_form': TransactionActionForm(account=account),
         'balance': balance,
+        'cache_timeout': CACHE_TIMEOUT,
         'formset': formset,
+        'page_key': page_key,
         'overdrawn': not balance > 0,
         'recurring_transactions': recurring_transactions,
+        'selection_form': TransactionSelectionForm(prefix='select'),
         'today': today,
         'transactions': transactions,
     }
     return rtr(request, 'moneybags/detail_account.html', data)
 
 
+@login_required
+@condition(etag_func=account_etag,
+           last_modified_func=account_last_modified)
+def forecast_account(request, account_slug):
+    """Chart the projected balance of an Account, based on its recurring
+    transactions. Use ``?days=N`` to change how far ahead to look."""
+    account = get_object_or_404(Account, slug=account_slug, owner=request.user)
+    try:
+        days = min(max(int(request.GET.get('days', 365)), 1), 5 * 365)
+    except ValueError:
+        days = 365
+
+    forecast = forecast_balance(account, days=days)
+    lowest = min(forecast, key=lambda point: point[1])
+    data = {
+        'account': account,
+        'days': days,
+        'forecast': forecast,
+        'lowest': lowest,
+    }
+    return rtr(request, 'moneybags/forecast_account.html', data)
+
+
 @login_required
 def update_transactions(request, account_slug):
-    """Update one or more Transactions for the given Account. The types of
-    updates may include:
+    """Apply an action to a selection of the given Account's Transactions.
+    The selection is either the rows checked on the Account's page, or
+    (with ``selection=matching``) every Transaction matching a
+    ``TransactionSelectionForm`` (which must set a filter, or ask for
+    every Transaction), resolved on the server. The actions
+    include:
 
     - deleting transactions
-    - changes to pending status.
+    - changes to pending status, type or recurring status
+    - moving transactions to another of the user's accounts.
 
     """
     account = get_object_or_404(Account, slug=account_slug, owner=request.user)
 
-    cleaned_data = None
     if request.method == 'POST' and 'action' in request.POST:
-        action = request.POST.get('action', None)
-
-        TransactionFormSet = formset_factory(TransactionCheckBoxForm, extra=0)
-        formset = TransactionFormSet(request.POST, request.FILES)
-
-        if action and formset.is_valid():
-            cleaned_data = formset.cleaned_data
-            # Cleaned data is a list of dictionaries of the form:
-            #   {'object_id':X, 'value':False }
-            #
-            # Perform the action on the objects whose values are `True`
-            ids = [d['object_id'] for d in cleaned_data if d['value']]
-
-            # NOTE: the following perform BULK operations, so they don't
-            # execute Transaction.save()
-            if action == 'delete':
-                Transaction.objects.filter(id__in=ids).delete()
-            elif action == 'remove-pending':
-                Transaction.objects.filter(id__in=ids).update(pending=False)
+        form = TransactionActionForm(request.POST, account=account)
+
+        transactions = None
+        if request.POST.get('selection') == 'matching':
+            selection = TransactionSelectionForm(request.POST,
+                prefix='select')
+            if selection.is_valid():
+                transactions = selection.get_matching_transactions(account)
+        else:
+            TransactionFormSet = formset_factory(TransactionCheckBoxForm,
+                extra=0)
+            formset = TransactionFormSet(request.POST, request.FILES)
+            if formset.is_valid():
+                # Cleaned data is a list of dictionaries of the form:
+                #   {'object_id':X, 'value':False }
+                #
+                # Perform the action on the objects whose values are `True`
+                ids = [d['object_id'] for d in formset.cleaned_data
+                       if d['value']]
+                transactions = Transaction.objects.filter(account=account,
+                    id__in=ids)
+
+        # NOTE: these are chunked BULK operations, so they don't execute
+        # Transaction.save(). The Account totals are kept in sync by
+        # ``TransactionQuerySet``.
+        if transactions is not None and form.is_valid():
+            apply_action(transactions, **form.cleaned_data)
 
     return redirect(account)
 
 
 @login_required
+@condition(etag_func=account_etag,
+           last_modified_func=account_last_modified)
 def detail_transaction(request, account_slug, transaction_id):
     """Show all the details associated with a single Transaction."""
     account = get_object_or_404(Account, slug=account_slug, owner=request.user)
     transaction = get_object_or_404(Transaction, account=account,
         id=transaction_id)
-
-    similar_transactions = transaction.get_similar_transactions()
+    transaction.account = account
+
+    # Only show a page of the similar Transactions, along with a summary of
+    # all of them.
+    similar = transaction.get_similar_transactions()
+    similar_summary = Transaction.objects.summarize(similar)
+    similar_transactions = keyset_paginate_queryset(request, similar,
+        num_items=25, count=similar_summary['count'])
+    similar_transactions.object_list = attach_account(
+        similar_transactions.object_list, account)
     data = {
         'account': account,
         'transaction': transaction,
+        'similar_summary': similar_summary,
         'similar_transactions': similar_transactions
     }
     return rtr(request, 'moneybags/detail_transaction.html', data)